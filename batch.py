@@ -0,0 +1,178 @@
+"""
+Headless batch runs of the search-strategy pipeline.
+
+Reads research questions from a CSV (a "question" column, optional "id"), a JSONL file
+(objects with "question" and optional "id") or a JSON file holding an array of such objects
+or of plain question strings, and appends one JSON line per question to
+the output file. Questions already written with status "ok" are skipped, so an
+interrupted run picks up where it stopped. All questions share one rate limiter and
+the prompt cache, so repeated questions and identical stage inputs (e.g. the same
+suggested database list) are only paid for once.
+
+    python batch.py questions.csv strategies.jsonl --concurrency 4 --rate 120 --max-in-flight 8
+"""
+import argparse
+import csv
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import rate_limit
+import search_strat as ss
+
+
+def question_id(question):
+    return hashlib.sha1(question.strip().lower().encode("utf-8")).hexdigest()[:12]
+
+
+def read_questions(path):
+    """
+    Return a list of (id, question) pairs from a CSV, JSONL or JSON array file
+    """
+    questions = []
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        if path.lower().endswith(".json"):
+            text = f.read()
+            # JSON Lines saved under a .json name is read too
+            if text.lstrip().startswith("["):
+                rows = json.loads(text)
+            else:
+                rows = [json.loads(line) for line in text.splitlines() if line.strip()]
+        elif path.lower().endswith(".jsonl"):
+            rows = (json.loads(line) for line in f if line.strip())
+        else:
+            rows = csv.DictReader(f)
+        for row in rows:
+            if isinstance(row, str):
+                row = {"question": row}
+            if not isinstance(row, dict):
+                continue
+            question = (row.get("question") or "").strip()
+            if question:
+                questions.append((str(row.get("id") or question_id(question)), question))
+    return questions
+
+
+def load_completed(output_path):
+    """
+    Ids already written successfully to output_path
+    """
+    completed = set()
+    if not os.path.exists(output_path):
+        return completed
+    with open(output_path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # a line cut short by an interruption
+                continue
+            if record.get("status") == "ok":
+                completed.add(record["id"])
+    return completed
+
+
+def run_question(question, persona_dict, refine=False, stage_workers=4):
+    """
+    Build the strategy for one question and return its result record (without the id)
+    """
+    started = time.perf_counter()
+    new_question = question
+    if refine:
+        candidates = ss.develop_new_questions_concurrent(question, persona_dict)
+        if candidates:
+            new_question = ss.get_new_question_rationale(candidates[0])[0]
+    with ss.token_budget.track_run() as ledger:
+        run = ss.build_search_strategy(new_question, persona_dict, max_workers=stage_workers)
+    failures = run.results["database_strategies"].failures
+    return {
+        "question": question,
+        "new_question": new_question,
+        "status": "ok",
+        "strategy": ss.strategy_summary(run.results),
+        "failed_databases": {database: str(error) for database, error in failures.items()},
+        "wall_time": time.perf_counter() - started,
+        "critical_path_time": run.critical_path_time,
+        "usage": ledger.totals(),
+    }
+
+
+def run_batch(questions, output_path, persona_dict, concurrency=2, rate_per_minute=None, max_in_flight=None,
+              stage_workers=4, refine=False, on_record=None):
+    """
+    Run every question not yet completed in output_path. Returns the number of new records written.
+    """
+    completed = load_completed(output_path)
+    todo = [(qid, question) for qid, question in questions if qid not in completed]
+
+    # identical questions are run once and their result written under every id
+    groups = {}
+    for qid, question in todo:
+        groups.setdefault(" ".join(question.lower().split()), []).append((qid, question))
+
+    ss.set_rate_limiter(rate_limit.RateLimiter(rate_per_minute, max_in_flight))
+    write_lock = threading.Lock()
+    written = 0
+    try:
+        with open(output_path, "a", encoding="utf-8") as out, ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+            futures = {
+                executor.submit(run_question, group[0][1], persona_dict, refine, stage_workers): group
+                for group in groups.values()
+            }
+            for future in as_completed(futures):
+                group = futures[future]
+                try:
+                    result = future.result()
+                except Exception as exc:
+                    result = {"question": group[0][1], "status": "error", "error": repr(exc)}
+                for qid, question in group:
+                    record = dict(result, id=qid, question=question)
+                    with write_lock:
+                        out.write(json.dumps(record, ensure_ascii=False) + "\n")
+                        out.flush()
+                        written += 1
+                    if on_record is not None:
+                        on_record(record)
+    finally:
+        ss.set_rate_limiter(None)
+    return written
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("questions", help="CSV or JSONL file of research questions")
+    parser.add_argument("output", help="JSONL file to append results to (also the resume checkpoint)")
+    parser.add_argument("--personas", default="perssonadict.json")
+    parser.add_argument("--concurrency", type=int, default=2, help="questions processed at once")
+    parser.add_argument("--stage-workers", type=int, default=4, help="pipeline stages run at once per question")
+    parser.add_argument("--rate", type=float, default=None, help="LLM requests per minute across the whole batch")
+    parser.add_argument("--max-in-flight", type=int, default=None, help="LLM requests in flight across the whole batch")
+    parser.add_argument("--refine", action="store_true", help="use the first refined candidate question")
+    args = parser.parse_args()
+
+    persona_dict = ss.load_persona_dict(args.personas)
+    questions = read_questions(args.questions)
+
+    def report(record):
+        print(f"[{record['status']}] {record['id']}: {record['question'][:80]}", flush=True)
+
+    written = run_batch(
+        questions,
+        args.output,
+        persona_dict,
+        concurrency=args.concurrency,
+        rate_per_minute=args.rate,
+        max_in_flight=args.max_in_flight,
+        stage_workers=args.stage_workers,
+        refine=args.refine,
+        on_record=report,
+    )
+    stats = ss.prompt_cache.get_cache().stats()
+    print(f"wrote {written} records; prompt cache {stats['hits']} hits / {stats['misses']} misses")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""
+Duplicate-detection benchmark on synthetic merged search results: a share of the records
+are re-exported copies with changed case/punctuation, a typo, or a missing DOI.
+
+    python benchmarks/bench_dedupe.py --records 100000 --duplicate-rate 0.25
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import importers
+import record_dedupe
+
+WORDS = ("effect efficacy exercise therapy depression anxiety adults children randomized trial cohort "
+         "outcomes mortality intervention cognitive behavioural diabetes obesity review quality life").split()
+
+
+def synthetic_records(n, duplicate_rate, seed=0):
+    rng = random.Random(seed)
+    originals = int(n / (1 + duplicate_rate))
+    records = []
+    for i in range(originals):
+        title = " ".join(rng.choice(WORDS) for w in range(rng.randint(8, 16))) + f" study {i}"
+        records.append(importers.Record(id=f"R{i}", title=title.capitalize(), doi=f"10.1000/{i}", pmid=str(30000000 + i)))
+    truth = 0
+    while len(records) < n:
+        source = rng.choice(records[:originals])
+        title = source.title
+        change = rng.random()
+        if change < 0.3:
+            title = title.upper() + "."
+        elif change < 0.6:
+            position = rng.randrange(len(title))
+            title = title[:position] + rng.choice("abcdefghij") + title[position + 1:]
+        records.append(importers.Record(
+            id=f"D{len(records)}",
+            title=title,
+            doi=source.doi if rng.random() < 0.5 else "",
+            pmid="",
+        ))
+        truth += 1
+    rng.shuffle(records)
+    return records, truth
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--records", type=int, default=100000)
+    parser.add_argument("--duplicate-rate", type=float, default=0.25)
+    parser.add_argument("--threshold", type=float, default=record_dedupe.DEFAULT_THRESHOLD)
+    args = parser.parse_args()
+
+    records, truth = synthetic_records(args.records, args.duplicate_rate)
+    started = time.perf_counter()
+    result = record_dedupe.find_duplicates(records, threshold=args.threshold)
+    elapsed = time.perf_counter() - started
+    reasons = {}
+    for row in result.report:
+        reasons[row["reason"]] = reasons.get(row["reason"], 0) + 1
+    print(f"records: {result.total}, injected duplicates: {truth}, removed: {result.removed} {reasons}")
+    print(f"time: {elapsed:.2f}s ({result.total / elapsed:.0f} records/s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""
+Export benchmark: writes screening results for synthetic records in every streaming format and
+reports time, file size and peak traced memory, next to building the whole CSV in memory and
+base64-encoding it for a data: URI.
+
+    python benchmarks/bench_export.py --records 100000
+"""
+import argparse
+import base64
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import exports
+import importers
+
+WORDS = "patients randomised exercise therapy depression anxiety adults cohort outcomes intervention placebo baseline".split()
+
+
+def synthetic_records(count, rng):
+    for i in range(count):
+        yield importers.Record(
+            id=f"R{i}",
+            title=" ".join(rng.choice(WORDS) for w in range(12)),
+            abstract=" ".join(rng.choice(WORDS) for w in range(200)),
+            authors="; ".join(f"Author {rng.randrange(1000)}" for a in range(4)),
+            year=str(rng.randint(1990, 2024)),
+            journal="Journal of " + rng.choice(WORDS),
+            doi=f"10.1000/{i}",
+            source="bench",
+        )
+
+
+def measure(label, func):
+    tracemalloc.start()
+    started = time.perf_counter()
+    try:
+        result = func()
+    except ImportError as error:
+        tracemalloc.stop()
+        print(f"{label:24s} skipped ({error})")
+        return
+    elapsed = time.perf_counter() - started
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{label:24s} {elapsed:6.2f}s  {result / 1e6:8.1f} MB  peak {peak / 1e6:8.1f} MB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--records", type=int, default=100000)
+    parser.add_argument("--page-size", type=int, default=exports.PAGE_SIZE)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    with tempfile.TemporaryDirectory() as tmp:
+        store = importers.RecordStore(os.path.join(tmp, "records.sqlite"))
+        store.add_all(synthetic_records(args.records, rng))
+        decisions = {
+            f"R{i}": {"decision": rng.choice(("INCLUDE", "EXCLUDE", "UNSURE")), "reason": "matches the criteria"}
+            for i in range(args.records)
+        }
+        out_dir = os.path.join(tmp, "exports")
+        for label, fmt, compress in (("csv", "csv", False), ("csv.gz", "csv", True), ("ris.gz", "ris", True),
+                                     ("parquet", "parquet", False), ("parquet (gzip)", "parquet", True)):
+            measure(label, lambda: exports.export_rows(
+                exports.screening_rows(store, decisions), fmt, compress=compress, out_dir=out_dir, page_size=args.page_size,
+            ).size)
+
+        def data_uri():
+            import pandas as pd
+
+            frame = pd.DataFrame(list(exports.screening_rows(store, decisions)))
+            return len(base64.b64encode(frame.to_csv(index=False).encode()).decode())
+
+        measure("to_csv + base64", data_uri)
+        store.close()
+
+
+if __name__ == "__main__":
+    main()
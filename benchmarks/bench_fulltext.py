@@ -0,0 +1,108 @@
+"""
+Full-text store benchmark on locally generated PDFs: extraction throughput of the process pool,
+incremental re-runs, and chunk reads through the memory-mapped text files.
+
+    python benchmarks/bench_fulltext.py --papers 200 --pages 8 --added 10
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pdf_store
+
+WORDS = ("patients randomised exercise therapy depression anxiety adults children cohort outcomes mortality "
+         "intervention cognitive behavioural placebo baseline follow-up analysis significant confidence interval "
+         "trial participants measured primary secondary reduced increased compared groups").split()
+SECTIONS = ("Abstract", "Introduction", "Methods", "Results", "Discussion", "Conclusion", "References")
+
+
+def _escape(text):
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def make_pdf(pages):
+    """
+    A minimal valid PDF (Helvetica, one text line per entry) for a list of pages of lines
+    """
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>", None, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    page_ids = []
+    for lines in pages:
+        content = "BT /F1 10 Tf 12 TL 50 790 Td " + " ".join(f"({_escape(line)}) '" for line in lines) + " ET"
+        stream = content.encode("latin-1")
+        objects.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream))
+        objects.append(b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] /Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % len(objects))
+        page_ids.append(len(objects))
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (b" ".join(b"%d 0 R" % i for i in page_ids), len(page_ids))
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n%s\nendobj\n" % (number, body)
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    out += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    return bytes(out)
+
+
+def synthetic_paper(number, pages, rng, lines_per_page=60):
+    """
+    Page line lists for a paper with the usual section headings, and its title
+    """
+    title = f"Paper {number}: " + " ".join(rng.choice(WORDS) for w in range(8))
+    lines = [title]
+    per_section = pages * lines_per_page // len(SECTIONS)
+    for section in SECTIONS:
+        lines.append(section)
+        for i in range(per_section):
+            sentence = " ".join(rng.choice(WORDS) for w in range(rng.randint(8, 14)))
+            lines.append(sentence.capitalize() + ".")
+    return [lines[start:start + lines_per_page] for start in range(0, len(lines), lines_per_page)], title
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--papers", type=int, default=200)
+    parser.add_argument("--pages", type=int, default=8)
+    parser.add_argument("--added", type=int, default=10, help="papers added before the incremental run")
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    pdfs = [make_pdf(synthetic_paper(i, args.pages, rng)[0]) for i in range(args.papers + args.added)]
+    with tempfile.TemporaryDirectory() as tmp:
+        store = pdf_store.PDFStore(tmp)
+        for i, data in enumerate(pdfs[:args.papers]):
+            store.add(data, f"paper{i}.pdf", record_id=f"R{i}")
+        started = time.perf_counter()
+        failures = store.extract_pending(max_workers=args.workers)
+        elapsed = time.perf_counter() - started
+        print(f"extracted {args.papers} papers ({args.pages} pages each) in {elapsed:.2f}s "
+              f"({args.papers / elapsed:.1f} papers/s), failures: {len(failures)}")
+
+        for i, data in enumerate(pdfs):
+            store.add(data, f"paper{i}.pdf", record_id=f"R{i}")
+        started = time.perf_counter()
+        pending = len(store.pending())
+        store.extract_pending(max_workers=args.workers)
+        elapsed = time.perf_counter() - started
+        print(f"incremental run after adding {args.added} papers: extracted {pending} in {elapsed:.2f}s")
+
+        shas = [document["sha"] for document in store.documents()]
+        started = time.perf_counter()
+        reads = 0
+        for sha in shas:
+            for chunk in store.chunks(sha, sections=("methods", "results")):
+                reads += 1
+        elapsed = time.perf_counter() - started
+        print(f"read {reads} methods/results chunks from {len(shas)} papers in {elapsed * 1000:.1f}ms")
+        store.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""
+Import benchmark: generates synthetic RIS, CSV, NBIB and JSON exports and measures
+parse throughput and memory of the streaming importers. Each format runs in a fresh process
+so its peak RSS, which includes SQLite's page cache, is measured alongside the Python
+allocations tracemalloc sees. --store spills the records to a RecordStore at its default
+(temporary file) path, as the app does; --in-memory uses ":memory:" instead for comparison.
+
+    python benchmarks/bench_import.py --records 100000 --store
+"""
+import argparse
+import csv
+import json
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import importers
+
+ABSTRACT = "Background: " + " ".join(f"word{i}" for i in range(220))
+
+
+def synthetic(i):
+    return {
+        "id": f"R{i}",
+        "title": f"Effect of intervention {i} on outcome {i % 97} in adults",
+        "abstract": ABSTRACT,
+        "authors": [f"Author{i} A", f"Coauthor{i} B"],
+        "year": str(1990 + i % 34),
+        "journal": f"Journal {i % 300}",
+        "doi": f"10.1000/j.{i}",
+        "pmid": str(10000000 + i),
+    }
+
+
+def write_ris(path, n):
+    with open(path, "w", encoding="utf-8") as f:
+        for i in range(n):
+            r = synthetic(i)
+            f.write("TY  - JOUR\n")
+            f.write(f"ID  - {r['id']}\nTI  - {r['title']}\nAB  - {r['abstract']}\n")
+            for author in r["authors"]:
+                f.write(f"AU  - {author}\n")
+            f.write(f"PY  - {r['year']}\nJO  - {r['journal']}\nDO  - {r['doi']}\nER  - \n\n")
+
+
+def write_nbib(path, n):
+    with open(path, "w", encoding="utf-8") as f:
+        for i in range(n):
+            r = synthetic(i)
+            f.write(f"PMID- {r['pmid']}\nTI  - {r['title']}\nAB  - {r['abstract'][:80]}\n      {r['abstract'][80:]}\n")
+            for author in r["authors"]:
+                f.write(f"AU  - {author}\n")
+            f.write(f"DP  - {r['year']} Jan\nJT  - {r['journal']}\nLID - {r['doi']} [doi]\n\n")
+
+
+def write_csv(path, n):
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["ID", "Title", "Abstract", "Authors", "Year", "Journal", "DOI", "PMID"])
+        for i in range(n):
+            r = synthetic(i)
+            writer.writerow([r["id"], r["title"], r["abstract"], "; ".join(r["authors"]), r["year"], r["journal"], r["doi"], r["pmid"]])
+
+
+def write_json(path, n):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("[\n")
+        for i in range(n):
+            f.write(("," if i else "") + json.dumps(synthetic(i)) + "\n")
+        f.write("]\n")
+
+
+WRITERS = {"ris": write_ris, "nbib": write_nbib, "csv": write_csv, "json": write_json}
+
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    scale = 1 if sys.platform == "darwin" else 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale / 1e6
+
+
+def run_format(path, fmt, store, in_memory):
+    baseline = peak_rss_mb()
+    tracemalloc.start()
+    started = time.perf_counter()
+    records = importers.iter_file(path, fmt)
+    if store:
+        record_store = importers.RecordStore(":memory:" if in_memory else None)
+        count = record_store.add_all(records)
+        record_store.close()
+    else:
+        count = sum(1 for record in records)
+    elapsed = time.perf_counter() - started
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return count, elapsed, peak / 1e6, peak_rss_mb() - baseline
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--records", type=int, default=100000)
+    parser.add_argument("--formats", nargs="+", default=list(WRITERS))
+    parser.add_argument("--store", action="store_true", help="also spill records to a RecordStore")
+    parser.add_argument("--in-memory", action="store_true", help="use an in-memory RecordStore instead of the default temporary file")
+    args = parser.parse_args()
+
+    context = multiprocessing.get_context("spawn")
+    with tempfile.TemporaryDirectory() as tmp:
+        print(f"{'format':6} {'file MB':>8} {'records':>8} {'seconds':>8} {'rec/s':>9} {'traced MB':>10} {'RSS MB':>8}")
+        for fmt in args.formats:
+            path = os.path.join(tmp, "export." + fmt)
+            WRITERS[fmt](path, args.records)
+            with context.Pool(1) as pool:
+                count, elapsed, traced, rss = pool.apply(run_format, (path, fmt, args.store, args.in_memory))
+            size = os.path.getsize(path) / 1e6
+            print(f"{fmt:6} {size:8.1f} {count:8d} {elapsed:8.2f} {count / elapsed:9.0f} {traced:10.2f} {rss:8.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""
+Microbenchmark: per-call overhead of building a PromptTemplate/LLM/LLMChain for every
+persona call versus reusing the pooled chain. Uses langchain's FakeListLLM as a stub
+backend so nothing goes over the network.
+
+    python benchmarks/bench_llm_pool.py --calls 2000
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain import LLMChain, PromptTemplate
+from langchain.llms.fake import FakeListLLM
+
+import llm_pool
+
+
+def stub_factory(model, temperature, max_tokens):
+    return FakeListLLM(responses=["New Question: stub\nRationale: stub"])
+
+
+def per_call(calls):
+    start = time.perf_counter()
+    for i in range(calls):
+        prompt = PromptTemplate(template=llm_pool.QUESTION_TEMPLATE, input_variables=["question"])
+        llm_chain = LLMChain(prompt=prompt, llm=stub_factory("stub", 0, 2000), verbose=False)
+        llm_chain.predict(question="persona " + str(i))
+    return time.perf_counter() - start
+
+
+def pooled(calls):
+    pool = llm_pool.LLMPool(llm_factory=stub_factory)
+    start = time.perf_counter()
+    for i in range(calls):
+        llm_chain = pool.get_chain("stub", 0, 2000)
+        llm_chain.predict(question="persona " + str(i))
+    elapsed = time.perf_counter() - start
+    pool.shutdown()
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=1000)
+    args = parser.parse_args()
+
+    baseline = per_call(args.calls)
+    reused = pooled(args.calls)
+    print(f"calls:             {args.calls}")
+    print(f"build per call:    {baseline / args.calls * 1e6:9.1f} us/call")
+    print(f"pooled chain:      {reused / args.calls * 1e6:9.1f} us/call")
+    print(f"overhead saved:    {(baseline - reused) / args.calls * 1e6:9.1f} us/call")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""
+Risk-of-bias benchmark: LLM requests and wall time for assessing every RoB 2 domain of a paper in
+one request, an incremental re-run after adding papers, and the traffic-light aggregation, on
+locally generated PDFs with the fake LLM backend and a local hashing embedder.
+
+    python benchmarks/bench_risk_of_bias.py --papers 40 --added 1 --workers 8 --table-studies 20000
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import llm_pool
+import pdf_store
+import prompt_cache
+import risk_of_bias
+import search_strat as ss
+from benchmarks.bench_fulltext import make_pdf, synthetic_paper
+from benchmarks.bench_fulltext_screening import HashingEmbedder
+from benchmarks.fake_llm import FakeLLMBackend
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--papers", type=int, default=40)
+    parser.add_argument("--pages", type=int, default=10)
+    parser.add_argument("--added", type=int, default=1, help="papers added before the incremental run")
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--median-latency", type=float, default=0.2)
+    parser.add_argument("--table-studies", type=int, default=20000, help="synthetic studies for the aggregation timing")
+    args = parser.parse_args()
+
+    persona_dict = ss.load_persona_dict(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "perssonadict.json"))
+    backend = FakeLLMBackend(persona_dict, median_latency=args.median_latency)
+    llm_pool.get_pool().set_backend(backend)
+    prompt_cache.set_cache(prompt_cache.PromptCache(":memory:"))
+    rng = random.Random(0)
+    embedder = HashingEmbedder()
+    with tempfile.TemporaryDirectory() as tmp:
+        store = pdf_store.PDFStore(os.path.join(tmp, "fulltext"))
+        cache = risk_of_bias.JudgementCache(os.path.join(tmp, "rob.sqlite"))
+        papers = []
+        for i in range(args.papers + args.added):
+            pages, title = synthetic_paper(i, args.pages, rng)
+            papers.append((f"R{i}", store.add(make_pdf(pages), f"paper{i}.pdf", record_id=f"R{i}")))
+        store.extract_pending()
+
+        for label, batch in (("first run", papers[:args.papers]), (f"after adding {args.added}", papers)):
+            calls = backend.calls
+            started = time.perf_counter()
+            result = risk_of_bias.assess_papers(store, batch, persona_dict, max_workers=args.workers, cache=cache, embedder=embedder)
+            elapsed = time.perf_counter() - started
+            print(f"{label:18s} {len(result.rows):4d} papers, {result.assessed:4d} assessed, {result.cached:4d} cached, "
+                  f"{backend.calls - calls:4d} requests (one per domain: {result.assessed * len(risk_of_bias.DOMAINS)}), "
+                  f"{elapsed:.2f}s, failures: {len(result.failures)}")
+        store.close()
+        cache.close()
+
+    levels = risk_of_bias.LEVELS[:3]
+    rows = [
+        {"id": f"S{i}", "domains": [{"judgement": rng.choice(levels)} for domain in risk_of_bias.DOMAINS]}
+        for i in range(args.table_studies)
+    ]
+    started = time.perf_counter()
+    table = risk_of_bias.traffic_light_table(rows)
+    summary = risk_of_bias.summary_table(table)
+    elapsed = time.perf_counter() - started
+    print(f"traffic-light table and summary for {len(table)} studies in {elapsed * 1000:.1f}ms")
+    print(summary.round(1))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+Offline search benchmark: builds a synthetic local corpus, then runs PubMed-style queries
+against several mirrored sources at once and reports indexing and search throughput.
+
+    python benchmarks/bench_search.py --records 200000 --sources 3 --page-size 200
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import importers
+import literature_search
+
+WORDS = ("effect efficacy exercise therapy depression anxiety adults children adolescents randomized trial "
+         "cohort outcomes mortality intervention cognitive behavioural diabetes obesity heart failure "
+         "stroke cancer screening quality life pain opioid sleep school community").split()
+
+QUERIES = [
+    '(exercise[tiab] OR "physical activity"[tiab]) AND (depress*[tiab] OR anxiety[tiab]) AND 2000:2020[dp]',
+    '"heart failure"[Title/Abstract] AND (mortality[tiab] OR outcomes[tiab]) NOT children[tiab]',
+    '(child*[tiab] OR adolescen*[tiab]) AND (obesity[mh] OR diabetes[mh]) AND school[tiab]',
+    '"cognitive behavioural"[tiab:~2] AND (sleep[tiab] OR pain[tiab])',
+]
+
+
+def synthetic_records(n, seed=0):
+    rng = random.Random(seed)
+    for i in range(n):
+        yield importers.Record(
+            id=f"R{i}",
+            title=" ".join(rng.choice(WORDS) for w in range(rng.randint(6, 14))).capitalize(),
+            abstract=" ".join(rng.choice(WORDS) for w in range(rng.randint(40, 120))),
+            authors=f"Author{i % 5000} A; Coauthor{i % 701} B",
+            year=str(1990 + i % 34),
+            journal=f"Journal {i % 300}",
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--records", type=int, default=200000)
+    parser.add_argument("--sources", type=int, default=3)
+    parser.add_argument("--page-size", type=int, default=200)
+    parser.add_argument("--max-results", type=int, default=None)
+    parser.add_argument("--rate-per-minute", type=int, default=None, help="per-source page request limit")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        corpus = literature_search.LocalCorpus(os.path.join(tmp, "corpus.sqlite"))
+        started = time.perf_counter()
+        count = corpus.add_all(synthetic_records(args.records))
+        elapsed = time.perf_counter() - started
+        print(f"indexed {count} records in {elapsed:.2f}s ({count / elapsed:.0f} records/s)")
+
+        adapters = [
+            literature_search.LocalAdapter(corpus, name=f"Source {i + 1}", rate_per_minute=args.rate_per_minute)
+            for i in range(args.sources)
+        ]
+        print(f"{'query':>5} {'hits':>9} {'seconds':>8} {'hits/s':>9}")
+        for number, query in enumerate(QUERIES, 1):
+            run = literature_search.SearchRun(
+                [(adapter, query) for adapter in adapters],
+                page_size=args.page_size,
+                max_results=args.max_results,
+                max_workers=args.sources,
+            )
+            started = time.perf_counter()
+            hits = sum(1 for record in run)
+            elapsed = time.perf_counter() - started
+            print(f"{number:5d} {hits:9d} {elapsed:8.2f} {hits / elapsed:9.0f}" + (f"  failures: {run.failures}" if run.failures else ""))
+        corpus.close()
+
+
+if __name__ == "__main__":
+    main()
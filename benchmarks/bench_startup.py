@@ -0,0 +1,71 @@
+"""
+Cold-start benchmark: imports each module in a fresh interpreter under `python -X importtime`
+and reports the cumulative import time, the number of modules loaded and the heaviest
+dependencies, so regressions in what main.py pulls in before the sidebar renders show up.
+
+    python benchmarks/bench_startup.py --repeats 5 --top 10 main search_strat screening
+"""
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_MODULES = ("main", "search_strat", "screening", "fulltext_screening", "jobs", "batch")
+IMPORTTIME_LINE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S.*)$")
+
+
+def import_profile(module, statement=None):
+    """
+    ({module: cumulative microseconds} for every import, or None and the error output if the import failed)
+    """
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", statement or f"import {module}"],
+        cwd=ROOT, capture_output=True, text=True,
+    )
+    timings = {}
+    for line in completed.stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if match:
+            timings[match.group(4).strip()] = int(match.group(2))
+    if completed.returncode != 0:
+        return None, completed.stderr.strip().splitlines()[-1:]
+    return timings, None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("modules", nargs="*", default=DEFAULT_MODULES)
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--top", type=int, default=8, help="heaviest top-level packages to list per module")
+    args = parser.parse_args()
+
+    # modules the interpreter imports at startup (site, encodings, ...) are not the app's cost
+    startup, error = import_profile(None, "pass")
+    for module in args.modules:
+        runs = []
+        error = None
+        for i in range(args.repeats):
+            timings, error = import_profile(module)
+            if timings is None:
+                break
+            runs.append(timings)
+        if not runs:
+            print(f"{module:20s} import failed: {' '.join(error)}")
+            continue
+        totals = [timings.get(module, 0) / 1000 for timings in runs]
+        print(f"{module:20s} median {statistics.median(totals):8.1f}ms  min {min(totals):8.1f}ms  "
+              f"modules loaded {len(set(runs[-1]) - set(startup))}")
+        packages = {}
+        for name, micros in runs[-1].items():
+            top = name.split(".")[0]
+            if top != module and name not in startup:
+                packages[top] = max(packages.get(top, 0), micros)
+        for name, micros in sorted(packages.items(), key=lambda item: -item[1])[:args.top]:
+            print(f"    {name:24s} {micros / 1000:8.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
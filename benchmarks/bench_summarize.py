@@ -0,0 +1,78 @@
+"""
+Map-reduce summary benchmark: tokens, calls and wall time per tree level for growing numbers of
+studies, and how many nodes are recomputed after adding one study, on locally generated PDFs with
+the fake LLM backend.
+
+    python benchmarks/bench_summarize.py --studies 20 40 80 160 --fan-in 6 --workers 8
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import llm_pool
+import pdf_store
+import prompt_cache
+import search_strat as ss
+import summarizer
+from benchmarks.bench_fulltext import make_pdf, synthetic_paper
+from benchmarks.fake_llm import FakeLLMBackend
+
+QUESTION = "In adults with depression, does exercise therapy reduce symptoms compared with usual care?"
+
+
+def report(label, result, studies):
+    totals = result.totals()
+    tokens = totals["prompt_tokens"] + totals["completion_tokens"]
+    print(f"{label}: {len(result.levels) - 1} reduce levels, {totals['computed']} calls, {totals['cached']} cached, "
+          f"{tokens} tokens ({tokens / max(1, studies):.0f} per study), {result.elapsed:.2f}s")
+    for level in result.levels:
+        print(f"    level {level['level']}: {level['nodes']:4d} nodes {level['computed']:4d} computed {level['cached']:4d} cached "
+              f"{level['prompt_tokens']:8d} prompt {level['completion_tokens']:7d} completion {level['seconds']:6.2f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--studies", type=int, nargs="+", default=[20, 40, 80, 160])
+    parser.add_argument("--pages", type=int, default=4)
+    parser.add_argument("--fan-in", type=int, default=6)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--median-latency", type=float, default=0.1)
+    args = parser.parse_args()
+
+    persona_dict = ss.load_persona_dict(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "perssonadict.json"))
+    llm_pool.get_pool().set_backend(FakeLLMBackend(persona_dict, median_latency=args.median_latency))
+    rng = random.Random(0)
+    largest = max(args.studies)
+    with tempfile.TemporaryDirectory() as tmp:
+        store = pdf_store.PDFStore(tmp)
+        papers = []
+        for i in range(largest + 1):
+            pages, title = synthetic_paper(i, args.pages, rng)
+            papers.append((f"R{i}", store.add(make_pdf(pages), f"paper{i}.pdf", record_id=f"R{i}")))
+        started = time.perf_counter()
+        store.extract_pending()
+        print(f"extracted {len(papers)} papers in {time.perf_counter() - started:.2f}s")
+
+        for count in sorted(args.studies):
+            # an empty prompt cache too, so every call in the tree reaches the backend
+            prompt_cache.set_cache(prompt_cache.PromptCache(":memory:"))
+            cache = prompt_cache.PromptCache(":memory:", max_entries=None)
+            result = summarizer.summarize_studies(store, papers[:count], QUESTION, persona_dict, fan_in=args.fan_in,
+                                                  max_workers=args.workers, cache=cache)
+            report(f"{count} studies", result, count)
+
+        # insert one study among the others and re-run against the same node cache
+        added = papers[:largest // 2] + [papers[largest]] + papers[largest // 2:largest]
+        result = summarizer.summarize_studies(store, added, QUESTION, persona_dict, fan_in=args.fan_in,
+                                              max_workers=args.workers, cache=cache)
+        report(f"after adding 1 study to {largest}", result, 1)
+        store.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+"""
+Deterministic fake LLM backend for offline benchmarks.
+
+Install it with llm_pool.get_pool().set_backend(FakeLLMBackend(...)). Each call picks a
+canned response for the persona found in the prompt, sleeps for a sampled
+time-to-first-token plus completion_tokens / tokens_per_second, and fails with a
+RateLimitError at error_rate. Randomness is seeded per (seed, prompt, call number), so
+runs are reproducible at any concurrency.
+"""
+import asyncio
+import hashlib
+import random
+import re
+import threading
+import time
+
+
+class RateLimitError(Exception):
+    """
+    Named like the openai error so retry.is_transient_error treats it as transient
+    """
+
+
+LATENCY_DISTRIBUTIONS = ("fixed", "uniform", "lognormal")
+
+
+class FakeLLMBackend:
+    """
+    Factory passed to LLMPool.set_backend; every pool key shares the same call counters
+    """
+
+    def __init__(self, persona_dict, latency="lognormal", median_latency=0.5, latency_spread=0.4,
+                 tokens_per_second=400.0, error_rate=0.0, completion_words=150, n_databases=6,
+                 duplicate_rate=0.2, seed=0):
+        if latency not in LATENCY_DISTRIBUTIONS:
+            raise ValueError(f"latency must be one of {', '.join(LATENCY_DISTRIBUTIONS)}")
+        self.personas = [(key, text) for key, text in persona_dict.items() if isinstance(text, str)]
+        self.latency = latency
+        self.median_latency = median_latency
+        self.latency_spread = latency_spread
+        self.tokens_per_second = tokens_per_second
+        self.error_rate = error_rate
+        self.completion_words = completion_words
+        self.n_databases = n_databases
+        self.duplicate_rate = duplicate_rate
+        self.seed = seed
+        self.calls = 0
+        self.errors = 0
+        self._counts = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, model, temperature, max_tokens):
+        return FakeLLM(self, max_tokens)
+
+    def _rng(self, prompt):
+        digest = hashlib.sha1(prompt.encode("utf-8")).hexdigest()
+        with self._lock:
+            count = self._counts.get(digest, 0)
+            self._counts[digest] = count + 1
+            self.calls += 1
+        return random.Random(f"{self.seed}:{digest}:{count}")
+
+    def _ttft(self, rng):
+        if self.latency == "fixed":
+            return self.median_latency
+        if self.latency == "uniform":
+            return rng.uniform(self.median_latency * (1 - self.latency_spread), self.median_latency * (1 + self.latency_spread))
+        return rng.lognormvariate(0, self.latency_spread) * self.median_latency
+
+    def persona_key(self, prompt):
+        for key, text in self.personas:
+            if text and text in prompt:
+                return key
+        return None
+
+    def respond(self, prompt, max_tokens):
+        """
+        Return (response text, seconds before the first token, seconds per token) or raise RateLimitError
+        """
+        rng = self._rng(prompt)
+        if rng.random() < self.error_rate:
+            with self._lock:
+                self.errors += 1
+            raise RateLimitError("fake rate limit")
+        key = self.persona_key(prompt)
+        if key == "question_developer":
+            variant = 0 if rng.random() < self.duplicate_rate else rng.randrange(1, 10 ** 6)
+            text = (
+                f"New Question: In adults, what is the effect of intervention variant {variant} on outcomes?\n"
+                f"Rationale: Narrows the population and makes the outcome measurable (variant {variant})."
+            )
+        elif key == "intorexp_developer":
+            text = rng.choice(["PICO", "PECO", "SPIDER"])
+        elif key == "fulltext_screening_developer":
+            criteria = len(re.findall(r"^\d+\. \(", prompt, re.MULTILINE))
+            passages = max(1, len(re.findall(r"^\[P\d+\]", prompt, re.MULTILINE)))
+            lines = [
+                f"{number} | {rng.choice(('MET', 'NOT MET', 'UNCLEAR'))} | P{rng.randint(1, passages)} | stated in the passage"
+                for number in range(1, criteria + 1)
+            ]
+            lines.append(f"DECISION | {rng.choice(('INCLUDE', 'EXCLUDE', 'UNSURE'))} | follows from the criteria")
+            text = "\n".join(lines)
+        elif key == "risk_of_bias_developer":
+            domains = len(re.findall(r"^\d+\. \(D\d\)", prompt, re.MULTILINE))
+            passages = max(1, len(re.findall(r"^\[P\d+\]", prompt, re.MULTILINE)))
+            text = "\n".join(
+                f"{number} | {rng.choice(('LOW', 'SOME CONCERNS', 'HIGH'))} | P{rng.randint(1, passages)} | reported in the passage"
+                for number in range(1, domains + 1)
+            )
+        elif key == "list_returner":
+            text = repr([f"Database {i + 1}" for i in range(self.n_databases)])
+        else:
+            words = min(self.completion_words, max_tokens)
+            text = " ".join(f"term{rng.randrange(1000)}" for i in range(words))
+        tokens = max(1, len(text.split()))
+        return text, self._ttft(rng), 1.0 / self.tokens_per_second if tokens else 0.0
+
+
+class FakeLLM:
+    """
+    Stands in for both the pooled LLM and its chain
+    """
+
+    def __init__(self, backend, max_tokens):
+        self.backend = backend
+        self.max_tokens = max_tokens
+
+    def predict(self, question):
+        text, ttft, per_token = self.backend.respond(question, self.max_tokens)
+        time.sleep(ttft + per_token * len(text.split()))
+        return text
+
+    async def apredict(self, question):
+        text, ttft, per_token = self.backend.respond(question, self.max_tokens)
+        await asyncio.sleep(ttft + per_token * len(text.split()))
+        return text
+
+    def stream(self, prompt_text):
+        text, ttft, per_token = self.backend.respond(prompt_text, self.max_tokens)
+        time.sleep(ttft)
+        words = text.split(" ")
+        for i, word in enumerate(words):
+            time.sleep(per_token)
+            yield word if i == len(words) - 1 else word + " "
@@ -0,0 +1,137 @@
+"""
+Offline benchmark suite for the search-strategy pipeline.
+
+Replaces the LLM with benchmarks.fake_llm.FakeLLMBackend and times question generation,
+the full strategy chain and the per-database strategies at several concurrency levels.
+Reports p50/p95 latency, throughput and peak traced memory per scenario.
+
+    python benchmarks/run_benchmarks.py --repeats 5 --median-latency 0.2 --error-rate 0.05
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import llm_pool
+import prompt_cache
+import search_strat as ss
+from benchmarks.fake_llm import FakeLLMBackend
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, max(0, round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def measure(name, func, repeats, work_items):
+    """
+    Run func repeats times with an empty prompt cache and summarise the timings
+    """
+    latencies = []
+    failures = 0
+    tracemalloc.start()
+    for i in range(repeats):
+        prompt_cache.set_cache(prompt_cache.PromptCache(":memory:"))
+        started = time.perf_counter()
+        try:
+            func()
+        except Exception:
+            # injected errors that the code path under test does not retry
+            failures += 1
+            continue
+        latencies.append(time.perf_counter() - started)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    total = sum(latencies)
+    return {
+        "scenario": name,
+        "repeats": repeats,
+        "failures": failures,
+        "p50_s": percentile(latencies, 0.5),
+        "p95_s": percentile(latencies, 0.95),
+        "mean_s": statistics.mean(latencies) if latencies else 0.0,
+        "throughput_per_s": len(latencies) * work_items / total if total else 0.0,
+        "peak_mem_mb": peak / 1e6,
+    }
+
+
+def scenarios(persona_dict, args):
+    question = "Does exercise improve depression in older adults?"
+    searchstrat = "(exercise OR physical activity) AND depression AND (aged OR elderly)"
+    databases = [f"Database {i + 1}" for i in range(args.databases)]
+
+    yield "new_questions sequential", lambda: ss.develop_new_questions(question, persona_dict), 10
+    for concurrency in args.concurrency:
+        yield (
+            f"new_questions async c={concurrency}",
+            lambda c=concurrency: ss.develop_new_questions_concurrent(question, persona_dict, max_concurrency=c),
+            10,
+        )
+    yield "database strategies sequential", lambda: ss.develop_database_search_strategies(databases, searchstrat, persona_dict), len(databases)
+    for concurrency in args.concurrency:
+        yield (
+            f"database strategies c={concurrency}",
+            lambda c=concurrency: ss.develop_database_search_strategies_concurrent(databases, searchstrat, persona_dict, max_workers=c, backoff=0.05),
+            len(databases),
+        )
+    for concurrency in args.concurrency:
+        yield (
+            f"full strategy chain workers={concurrency}",
+            lambda c=concurrency: ss.build_search_strategy(question, persona_dict, max_workers=c),
+            1,
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 10])
+    parser.add_argument("--databases", type=int, default=8)
+    parser.add_argument("--latency", choices=["fixed", "uniform", "lognormal"], default="lognormal")
+    parser.add_argument("--median-latency", type=float, default=0.2, help="seconds to first token")
+    parser.add_argument("--latency-spread", type=float, default=0.4)
+    parser.add_argument("--tokens-per-second", type=float, default=400.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--filter", default=None, help="only run scenarios containing this text")
+    parser.add_argument("--json", default=None, help="also write the report to this file")
+    args = parser.parse_args()
+
+    persona_dict = ss.load_persona_dict(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "perssonadict.json"))
+    backend = FakeLLMBackend(
+        persona_dict,
+        latency=args.latency,
+        median_latency=args.median_latency,
+        latency_spread=args.latency_spread,
+        tokens_per_second=args.tokens_per_second,
+        error_rate=args.error_rate,
+        n_databases=args.databases,
+        seed=args.seed,
+    )
+    llm_pool.get_pool().set_backend(backend)
+
+    report = []
+    print(f"{'scenario':42} {'p50 s':>8} {'p95 s':>8} {'items/s':>9} {'peak MB':>8} {'failed':>6}")
+    for name, func, work_items in scenarios(persona_dict, args):
+        if args.filter and args.filter not in name:
+            continue
+        row = measure(name, func, args.repeats, work_items)
+        report.append(row)
+        print(f"{name:42} {row['p50_s']:8.3f} {row['p95_s']:8.3f} {row['throughput_per_s']:9.2f} {row['peak_mem_mb']:8.2f} {row['failures']:6d}")
+    print(f"fake LLM calls: {backend.calls}, injected errors: {backend.errors}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+"""
+Semantic deduplication of candidate research questions
+"""
+import re
+
+import numpy as np
+
+import embeddings
+
+NEW_QUESTION_REGEX = r"New Question:\s+(.*)\n"
+DEFAULT_SIMILARITY_THRESHOLD = 0.92
+
+
+def extract_question(new_question_output):
+    match = re.search(NEW_QUESTION_REGEX, str(new_question_output))
+    return match.group(1).strip() if match else None
+
+
+def cluster_representatives(vectors, threshold=DEFAULT_SIMILARITY_THRESHOLD):
+    """
+    Greedy clustering on the cosine-similarity matrix: walking in order, each row not yet
+    claimed becomes a representative and claims every later row at least threshold similar.
+    Returns the representative row indices in order.
+    """
+    if len(vectors) == 0:
+        return []
+    unit = embeddings.normalize(np.asarray(vectors, dtype=np.float32))
+    similarity = unit @ unit.T
+    claimed = np.zeros(len(unit), dtype=bool)
+    representatives = []
+    for i in range(len(unit)):
+        if claimed[i]:
+            continue
+        representatives.append(i)
+        claimed |= similarity[i] >= threshold
+    return representatives
+
+
+def semantic_dedupe(question_outputs, threshold=DEFAULT_SIMILARITY_THRESHOLD, embedder=None):
+    """
+    Keep one completion per cluster of near-identical "New Question" texts, in original order.
+    All questions are embedded in one batched call (cached by text hash).
+    """
+    questions = [extract_question(output) for output in question_outputs]
+    kept = [(output, question) for output, question in zip(question_outputs, questions) if question]
+    if len(kept) < 2:
+        return [output for output, question in kept]
+    vectors = embeddings.embed_texts([question for output, question in kept], embedder=embedder)
+    return [kept[i][0] for i in cluster_representatives(vectors, threshold)]
@@ -0,0 +1,97 @@
+"""
+Batched text embeddings with a process-wide cache keyed by text hash
+"""
+import hashlib
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+import lazy
+
+DEFAULT_EMBEDDING_MODEL = "text-embedding-ada-002"
+
+_default_embedder = None
+_embedder_lock = threading.Lock()
+
+
+def default_embedder():
+    """
+    Shared langchain OpenAIEmbeddings client, built on first use
+    """
+    global _default_embedder
+    with _embedder_lock:
+        if _default_embedder is None:
+            from langchain.embeddings import OpenAIEmbeddings
+            _default_embedder = OpenAIEmbeddings(model=DEFAULT_EMBEDDING_MODEL, openai_api_key=lazy.secret("OPENAI_API_KEY"))
+        return _default_embedder
+
+
+def text_hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Thread-safe LRU of text hash -> vector
+    """
+
+    def __init__(self, max_entries=50000):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._vectors = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            vector = self._vectors.get(key)
+            if vector is None:
+                self.misses += 1
+                return None
+            self._vectors.move_to_end(key)
+            self.hits += 1
+            return vector
+
+    def put(self, key, vector):
+        with self._lock:
+            self._vectors[key] = vector
+            self._vectors.move_to_end(key)
+            while len(self._vectors) > self.max_entries:
+                self._vectors.popitem(last=False)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._vectors)
+
+
+cache = EmbeddingCache()
+
+
+def embed_texts(texts, embedder=None, batch_size=500):
+    """
+    Return a float32 matrix with one row per text. Only texts missing from the cache are
+    sent to the embedder, in batches of batch_size via embed_documents
+    """
+    embedder = embedder or default_embedder()
+    keys = [text_hash(text) for text in texts]
+    vectors = [cache.get(key) for key in keys]
+    missing = {}
+    for key, text, vector in zip(keys, texts, vectors):
+        if vector is None and key not in missing:
+            missing[key] = text
+    missing_keys = list(missing)
+    for start in range(0, len(missing_keys), batch_size):
+        batch_keys = missing_keys[start:start + batch_size]
+        batch_vectors = embedder.embed_documents([missing[key] for key in batch_keys])
+        for key, vector in zip(batch_keys, batch_vectors):
+            cache.put(key, np.asarray(vector, dtype=np.float32))
+    if not texts:
+        return np.zeros((0, 0), dtype=np.float32)
+    return np.vstack([cache.get(key) if vector is None else vector for key, vector in zip(keys, vectors)])
+
+
+def normalize(matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
@@ -0,0 +1,220 @@
+"""
+Streaming exports of records and screening results.
+
+Rows arrive as an iterable and are written page by page to a temporary file, which is then
+renamed to its SHA-256 under DEFAULT_EXPORT_DIR, so memory stays bounded by one page however many
+rows there are and an identical export is stored once. CSV and RIS can be gzip-compressed
+(deterministically, so the hash is stable); Parquet is written one row group per page with
+pyarrow and uses gzip as its column compression instead. python-docx builds a document in
+memory, so Word exports are capped at DOCX_MAX_ROWS.
+"""
+import csv
+import gzip
+import hashlib
+import io
+import os
+import tempfile
+
+import importers
+import prompt_cache
+
+DEFAULT_EXPORT_DIR = os.path.join(prompt_cache.DEFAULT_CACHE_DIR, "exports")
+FORMATS = {"CSV": "csv", "Parquet": "parquet", "RIS": "ris", "Word": "docx"}
+MIME_TYPES = {
+    "csv": "text/csv",
+    "parquet": "application/vnd.apache.parquet",
+    "ris": "application/x-research-info-systems",
+    "docx": "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+    "gz": "application/gzip",
+}
+PAGE_SIZE = 5000
+DOCX_MAX_ROWS = 5000
+SCREENING_COLUMNS = importers.RECORD_FIELDS + ("decision", "reason", "score")
+
+# RECORD_FIELDS -> RIS tag, the inverse of importers.RIS_FIELDS
+RIS_TAGS = (("title", "TI"), ("authors", "AU"), ("year", "PY"), ("journal", "JO"), ("doi", "DO"),
+            ("pmid", "AN"), ("id", "ID"), ("abstract", "AB"))
+
+
+class Export:
+    def __init__(self, path, fmt, rows, compressed):
+        self.path = path
+        self.fmt = fmt
+        self.rows = rows
+        self.compressed = compressed
+
+    @property
+    def size(self):
+        return os.path.getsize(self.path)
+
+    @property
+    def mime(self):
+        return MIME_TYPES["gz" if self.compressed else self.fmt]
+
+    def file_name(self, stem):
+        return f"{stem}.{self.fmt}" + (".gz" if self.compressed else "")
+
+    def open(self):
+        return open(self.path, "rb")
+
+
+def pages(rows, page_size=PAGE_SIZE):
+    """
+    Lists of at most page_size rows from any iterable
+    """
+    page = []
+    for row in rows:
+        page.append(row)
+        if len(page) >= page_size:
+            yield page
+            page = []
+    if page:
+        yield page
+
+
+def screening_rows(store, decisions, scores=None):
+    """
+    Record fields plus decision, reason and score for every screened record, read from the
+    RecordStore in batches
+    """
+    scores = scores or {}
+    for record in store:
+        decision = decisions.get(str(record.id))
+        if decision is not None:
+            yield dict(record.to_dict(), decision=decision["decision"], reason=decision.get("reason", ""),
+                       score=scores.get(record.id, ""))
+
+
+def _cell(value):
+    return "" if value is None else str(value)
+
+
+def _write_csv(stream, row_pages, columns):
+    text = io.TextIOWrapper(stream, encoding="utf-8", newline="")
+    writer = csv.writer(text)
+    writer.writerow(columns)
+    count = 0
+    for page in row_pages:
+        writer.writerows([[_cell(row.get(column)) for column in columns] for row in page])
+        count += len(page)
+    text.flush()
+    text.detach()
+    return count
+
+
+def _write_ris(stream, row_pages, columns):
+    text = io.TextIOWrapper(stream, encoding="utf-8", newline="")
+    count = 0
+    for page in row_pages:
+        lines = []
+        for row in page:
+            lines.append("TY  - JOUR")
+            for field, tag in RIS_TAGS:
+                value = _cell(row.get(field)).strip()
+                if not value:
+                    continue
+                if field == "authors":
+                    lines += [f"AU  - {author.strip()}" for author in value.split(";") if author.strip()]
+                else:
+                    lines.append(f"{tag}  - {' '.join(value.split())}")
+            if row.get("decision"):
+                lines.append(f"N1  - Screening: {row['decision']} {_cell(row.get('reason'))}".rstrip())
+            lines.append("ER  - ")
+            lines.append("")
+        text.write("\n".join(lines) + "\n")
+        count += len(page)
+    text.flush()
+    text.detach()
+    return count
+
+
+def _write_parquet(path, row_pages, columns, compressed):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([(column, pa.string()) for column in columns])
+    count = 0
+    with pq.ParquetWriter(path, schema, compression="gzip" if compressed else "snappy") as writer:
+        for page in row_pages:
+            writer.write_table(pa.table({column: [_cell(row.get(column)) for row in page] for column in columns}, schema=schema))
+            count += len(page)
+        if not count:
+            writer.write_table(schema.empty_table())
+    return count
+
+
+def _write_docx(path, row_pages, columns, title):
+    import docx
+
+    document = docx.Document()
+    document.add_heading(title, 1)
+    grid = document.add_table(rows=1, cols=len(columns))
+    grid.style = "Table Grid"
+    for cell, column in zip(grid.rows[0].cells, columns):
+        cell.text = column
+    count = 0
+    for page in row_pages:
+        for row in page:
+            if count >= DOCX_MAX_ROWS:
+                raise ValueError(f"Word exports are limited to {DOCX_MAX_ROWS} rows; use CSV or Parquet")
+            for cell, column in zip(grid.add_row().cells, columns):
+                cell.text = _cell(row.get(column))
+            count += 1
+    document.save(path)
+    return count
+
+
+def file_sha256(path, block_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def export_rows(rows, fmt, columns=SCREENING_COLUMNS, compress=False, out_dir=DEFAULT_EXPORT_DIR,
+                page_size=PAGE_SIZE, title="Export", on_progress=None):
+    """
+    Write row dicts to a content-addressed file in fmt ("csv", "parquet", "ris" or "docx") and return
+    an Export. compress gzips CSV and RIS and switches Parquet to gzip column compression; Word
+    files are already compressed. on_progress(rows written) is called after every page.
+    """
+    if fmt not in MIME_TYPES or fmt == "gz":
+        raise ValueError(f"Unknown export format {fmt!r}")
+    compress = compress and fmt != "docx"
+    columns = list(columns)
+
+    def row_pages():
+        count = 0
+        for page in pages(rows, page_size):
+            yield page
+            count += len(page)
+            if on_progress is not None:
+                on_progress(count)
+
+    os.makedirs(out_dir, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=out_dir, suffix=".tmp")
+    try:
+        if fmt in ("csv", "ris"):
+            write = _write_csv if fmt == "csv" else _write_ris
+            with os.fdopen(fd, "wb") as raw:
+                if compress:
+                    # no name or mtime in the header, so identical exports hash the same
+                    with gzip.GzipFile(filename="", fileobj=raw, mode="wb", compresslevel=6, mtime=0) as stream:
+                        count = write(stream, row_pages(), columns)
+                else:
+                    count = write(raw, row_pages(), columns)
+        else:
+            os.close(fd)
+            if fmt == "parquet":
+                count = _write_parquet(tmp_path, row_pages(), columns, compress)
+            else:
+                count = _write_docx(tmp_path, row_pages(), columns, title)
+        suffix = f".{fmt}" + (".gz" if compress and fmt != "parquet" else "")
+        path = os.path.join(out_dir, file_sha256(tmp_path)[:32] + suffix)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return Export(path, fmt, count, compress and fmt != "parquet")
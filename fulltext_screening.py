@@ -0,0 +1,238 @@
+"""
+Retrieval-augmented full-text screening.
+
+Papers come from pdf_store as section chunks. Each inclusion/exclusion criterion is embedded and
+matched against the paper's chunks in a local vector index, and only the best passages per
+criterion (reference lists and acknowledgements left out) are sent to the LLM, numbered so every
+criterion judgement cites the chunks it relied on. The whole paper is never put in a prompt, and
+each result records the prompt tokens next to what the full text would have cost.
+"""
+import contextvars
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import embeddings
+import rate_limit
+import retry
+import search_strat as ss
+import token_budget
+import vector_index
+
+SKIP_SECTIONS = {
+    "references", "bibliography", "acknowledgements", "acknowledgments", "acknowledgement", "acknowledgment",
+    "funding", "conflict of interest", "conflicts of interest",
+}
+CRITERION_REGEX = re.compile(r"^\s*\[?(\d+)\]?\s*[|:.)-]\s*(NOT MET|MET|UNCLEAR)\b\s*(?:\|\s*([^|]*?)\s*(?:\|\s*(.*))?)?$", re.IGNORECASE)
+DECISION_REGEX = re.compile(r"^\s*(?:final\s+)?decision\s*[|:-]\s*(INCLUDE|EXCLUDE|UNSURE)\b\s*[|:-]?\s*(.*)$", re.IGNORECASE)
+
+
+def split_criteria(incexc_text):
+    """
+    [(kind, criterion)] from develop_inclusion_exclusion_criteria output, kind being "inclusion" or "exclusion"
+    """
+    criteria = []
+    kind = "inclusion"
+    for line in (incexc_text or "").splitlines():
+        line = line.strip()
+        heading = re.match(r"^(inclusion|exclusion)\s+criteria\s*:?\s*(.*)$", line, re.IGNORECASE)
+        if heading:
+            kind = heading.group(1).lower()
+            line = heading.group(2).strip()
+        line = re.sub(r"^(?:[-*•]|\d+[.)])\s*", "", line).strip()
+        if line:
+            criteria.append((kind, line))
+    return criteria
+
+
+def retrieve_passages(chunks, criteria, top_k=2, max_passages=8, embedder=None):
+    """
+    Pick up to top_k chunks per criterion, best first and round-robin across criteria, keeping at
+    most max_passages in total. Returns (passages in document order, passage numbers per criterion)
+    """
+    chunks = [chunk for chunk in chunks if chunk.section not in SKIP_SECTIONS]
+    if not chunks or not criteria:
+        return [], [[] for criterion in criteria]
+    index = vector_index.LocalIndex()
+    index.upsert(list(range(len(chunks))), embeddings.embed_texts([chunk.text for chunk in chunks], embedder=embedder))
+    criterion_vectors = embeddings.embed_texts([text for kind, text in criteria], embedder=embedder)
+    hits = [[position for position, score, meta in index.query(vector, top_k=top_k)] for vector in criterion_vectors]
+    selected = []
+    cited = [[] for criterion in criteria]
+    for rank in range(top_k):
+        for number, criterion_hits in enumerate(hits):
+            if rank >= len(criterion_hits):
+                continue
+            position = criterion_hits[rank]
+            if position not in selected:
+                if len(selected) >= max_passages:
+                    continue
+                selected.append(position)
+            cited[number].append(position)
+    order = sorted(selected)
+    numbers = {position: number for number, position in enumerate(order, start=1)}
+    return [chunks[position] for position in order], [[numbers[position] for position in positions] for positions in cited]
+
+
+def build_fulltext_prompt(criteria, passages, cited):
+    lines = ["Criteria:"]
+    for number, (kind, text) in enumerate(criteria, start=1):
+        lines.append(f"{number}. ({kind.capitalize()}) {text}")
+    lines += ["", "Passages:"]
+    for number, chunk in enumerate(passages, start=1):
+        lines.append(f"[P{number}] ({chunk.section}) {chunk.text}")
+    lines.append("")
+    lines.append("Passages retrieved for each criterion: " + "; ".join(
+        f"{number}: {', '.join(f'P{passage}' for passage in passages_for) or 'none'}"
+        for number, passages_for in enumerate(cited, start=1)
+    ))
+    lines.append("Assessment:")
+    return "\n".join(lines)
+
+
+def parse_assessment(text, count):
+    """
+    ({criterion number: (status, [passage numbers], reason)}, (decision, reason) or None).
+    Criteria the model skipped come back UNCLEAR
+    """
+    assessments = {}
+    decision = None
+    for line in str(text).splitlines():
+        match = DECISION_REGEX.match(line)
+        if match:
+            decision = (match.group(1).upper(), match.group(2).strip())
+            continue
+        match = CRITERION_REGEX.match(line)
+        if match:
+            number = int(match.group(1))
+            if 1 <= number <= count and number not in assessments:
+                passages = [int(passage) for passage in re.findall(r"P(\d+)", match.group(3) or "", re.IGNORECASE)]
+                assessments[number] = (" ".join(match.group(2).upper().split()), passages, (match.group(4) or "").strip())
+    for number in range(1, count + 1):
+        assessments.setdefault(number, ("UNCLEAR", [], "no assessment returned"))
+    return assessments, decision
+
+
+def decide(criteria, assessments):
+    """
+    Decision implied by the criterion judgements, used when the model gives no final line
+    """
+    statuses = [(kind, assessments[number][0]) for number, (kind, text) in enumerate(criteria, start=1)]
+    if any(kind == "exclusion" and status == "MET" or kind == "inclusion" and status == "NOT MET" for kind, status in statuses):
+        return "EXCLUDE", "a criterion rules the paper out"
+    if all(kind == "inclusion" and status == "MET" or kind == "exclusion" and status == "NOT MET" for kind, status in statuses):
+        return "INCLUDE", "all criteria are satisfied"
+    return "UNSURE", "some criteria are unclear"
+
+
+def screen_paper(store, sha, criteria, persona_dict, record_id=None, top_k=2, max_passages=8, embedder=None, limiter=None):
+    """
+    Screen one stored paper against [(kind, criterion)]. Returns a result row with the decision,
+    per-criterion judgements citing (section, chunk) and the prompt vs full-text token counts
+    """
+    chunks = store.chunks(sha)
+    passages, cited = retrieve_passages(chunks, criteria, top_k=top_k, max_passages=max_passages, embedder=embedder)
+    prompt = build_fulltext_prompt(criteria, passages, cited)
+    persona = persona_dict["fulltext_screening_developer"]
+    max_tokens = token_budget.persona_max_tokens(persona_dict, "fulltext_screening_developer") * (len(criteria) + 1)
+    if limiter is not None:
+        limiter.acquire()
+    try:
+        output = ss.question_developer(prompt, persona, max_tokens=max_tokens, stage="fulltext_screening_developer")
+    finally:
+        if limiter is not None:
+            limiter.release()
+    assessments, decision = parse_assessment(output, len(criteria))
+    if decision is None:
+        decision = decide(criteria, assessments)
+    judgements = []
+    for number, (kind, text) in enumerate(criteria, start=1):
+        status, passage_numbers, reason = assessments[number]
+        passage_numbers = [n for n in passage_numbers if 1 <= n <= len(passages)] or cited[number - 1]
+        judgements.append({
+            "criterion": text,
+            "kind": kind,
+            "status": status,
+            "reason": reason,
+            "citations": [{"section": passages[n - 1].section, "chunk": passages[n - 1].seq} for n in passage_numbers],
+        })
+    full_text = build_fulltext_prompt(criteria, [], [[] for criterion in criteria]) + "\n" + "\n".join(chunk.text for chunk in chunks)
+    return {
+        "id": str(record_id if record_id is not None else sha[:12]),
+        "sha": sha,
+        "decision": decision[0],
+        "reason": decision[1],
+        "criteria": judgements,
+        "passages": len(passages),
+        "prompt_tokens": token_budget.count_tokens(persona + prompt, ss.LLM_MODEL),
+        "full_text_tokens": token_budget.count_tokens(persona + full_text, ss.LLM_MODEL),
+    }
+
+
+class FullTextResult:
+    def __init__(self, rows, failures, elapsed):
+        self.rows = rows
+        self.failures = failures
+        self.elapsed = elapsed
+
+    @property
+    def prompt_tokens(self):
+        return sum(row["prompt_tokens"] for row in self.rows.values())
+
+    @property
+    def full_text_tokens(self):
+        return sum(row["full_text_tokens"] for row in self.rows.values())
+
+    @property
+    def token_reduction(self):
+        """
+        How many times fewer prompt tokens were sent than full-text prompts would have used
+        """
+        return self.full_text_tokens / self.prompt_tokens if self.prompt_tokens else 0.0
+
+    def counts(self):
+        counts = {"INCLUDE": 0, "EXCLUDE": 0, "UNSURE": 0}
+        for row in self.rows.values():
+            counts[row["decision"]] = counts.get(row["decision"], 0) + 1
+        return counts
+
+
+def screen_papers(store, papers, incexc_text, persona_dict, top_k=2, max_passages=8, max_workers=4,
+                  rate_per_minute=None, retries=3, embedder=None, on_progress=None):
+    """
+    Screen [(record_id, sha)] papers concurrently against the inclusion/exclusion criteria text.
+    A paper that still fails after retries is recorded in failures. on_progress(done, total) is
+    called in this thread.
+    """
+    criteria = split_criteria(incexc_text)
+    if not criteria:
+        raise ValueError("No inclusion or exclusion criteria to screen against")
+    limiter = rate_limit.RateLimiter(rate_per_minute, max_workers)
+    rows = {}
+    failures = {}
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        futures = {
+            executor.submit(
+                contextvars.copy_context().run, retry.call_with_retry, screen_paper, store, sha, criteria, persona_dict,
+                record_id=record_id, top_k=top_k, max_passages=max_passages, embedder=embedder, limiter=limiter,
+                retries=retries,
+            ): (record_id, sha)
+            for record_id, sha in papers
+        }
+        try:
+            for done, future in enumerate(as_completed(futures), start=1):
+                record_id, sha = futures[future]
+                try:
+                    row = future.result()
+                    rows[row["id"]] = row
+                except Exception as error:
+                    failures[str(record_id if record_id is not None else sha[:12])] = error
+                if on_progress is not None:
+                    on_progress(done, len(futures))
+        except BaseException:
+            # e.g. a cancelled job raising from on_progress: papers not started yet are dropped
+            executor.shutdown(cancel_futures=True)
+            raise
+    return FullTextResult(rows, failures, time.perf_counter() - started)
+
@@ -0,0 +1,434 @@
+"""
+Streaming importers for database search exports (RIS, CSV, NBIB/MEDLINE, JSON/JSON Lines).
+
+Every parser is a generator over a text stream, so a file is never decoded or held in
+memory as a whole. Records are compact __slots__ objects, and RecordStore spills them to
+SQLite so large imports can be paged through without keeping them all in memory.
+"""
+import csv
+import io
+import json
+import os
+import re
+import sqlite3
+import tempfile
+import threading
+
+RECORD_FIELDS = ("id", "title", "abstract", "authors", "year", "journal", "doi", "pmid", "source")
+
+
+class Record:
+    """
+    One bibliographic record. authors is a "; "-joined string to keep the object small
+    """
+
+    __slots__ = RECORD_FIELDS
+
+    def __init__(self, id=None, title="", abstract="", authors="", year="", journal="", doi="", pmid="", source=""):
+        self.id = id
+        self.title = title
+        self.abstract = abstract
+        self.authors = authors
+        self.year = year
+        self.journal = journal
+        self.doi = doi
+        self.pmid = pmid
+        self.source = source
+
+    def get(self, key, default=None):
+        value = getattr(self, key, None)
+        return default if value is None else value
+
+    def to_dict(self):
+        return {field: getattr(self, field) for field in RECORD_FIELDS}
+
+    def __repr__(self):
+        return f"Record(id={self.id!r}, title={self.title[:60]!r})"
+
+
+def _clean_doi(value):
+    value = (value or "").strip()
+    for prefix in ("https://doi.org/", "http://doi.org/", "http://dx.doi.org/", "doi:"):
+        if value.lower().startswith(prefix):
+            value = value[len(prefix):]
+    return value.split(" ")[0]
+
+
+RIS_FIELDS = {
+    "TI": "title", "T1": "title",
+    "AB": "abstract", "N2": "abstract",
+    "AU": "authors", "A1": "authors",
+    "PY": "year", "Y1": "year",
+    "JO": "journal", "JF": "journal", "T2": "journal",
+    "DO": "doi",
+    "ID": "id",
+    "AN": "pmid",
+}
+# "ER  -" often has no trailing space, and the first line may carry a byte order mark
+RIS_TAG_REGEX = re.compile(r"^\ufeff?([A-Z][A-Z0-9])  -(?: |$)(.*)$")
+
+
+def iter_ris(stream, source=""):
+    fields = {}
+    for line in stream:
+        match = RIS_TAG_REGEX.match(line.rstrip("\r\n"))
+        if not match:
+            continue
+        tag, value = match.group(1), match.group(2).strip()
+        if tag == "ER":
+            if fields:
+                yield _make_record(fields, source)
+            fields = {}
+            continue
+        field = RIS_FIELDS.get(tag)
+        if field == "authors":
+            fields.setdefault("authors", []).append(value)
+        elif field and field not in fields:
+            fields[field] = value
+    if fields:
+        yield _make_record(fields, source)
+
+
+NBIB_FIELDS = {
+    "PMID": "pmid",
+    "TI": "title",
+    "AB": "abstract",
+    "AU": "authors",
+    "DP": "year",
+    "JT": "journal",
+}
+
+
+def iter_nbib(stream, source=""):
+    """
+    PubMed MEDLINE/.nbib: 4-character tags, continuation lines indented by six spaces,
+    records separated by blank lines
+    """
+    fields = {}
+    last_field = None
+    for line in stream:
+        line = line.rstrip("\r\n")
+        if not line.strip():
+            if fields:
+                yield _make_record(fields, source)
+            fields, last_field = {}, None
+            continue
+        if line.startswith("      ") and last_field:
+            if last_field == "authors":
+                fields["authors"][-1] += " " + line.strip()
+            else:
+                fields[last_field] += " " + line.strip()
+            continue
+        if len(line) < 6 or line[4:6] != "- ":
+            last_field = None
+            continue
+        tag, value = line[:4].strip(), line[6:].strip()
+        if tag in ("LID", "AID") and value.endswith("[doi]"):
+            fields.setdefault("doi", value[:-5].strip())
+            last_field = None
+            continue
+        field = NBIB_FIELDS.get(tag)
+        if field == "authors":
+            fields.setdefault("authors", []).append(value)
+        elif field == "year":
+            fields.setdefault("year", value[:4])
+        elif field and field not in fields:
+            fields[field] = value
+        else:
+            field = None
+        last_field = field
+    if fields:
+        yield _make_record(fields, source)
+
+
+CSV_ALIASES = {
+    "id": "id", "record id": "id", "key": "id",
+    "title": "title", "article title": "title", "ti": "title",
+    "abstract": "abstract", "ab": "abstract",
+    "authors": "authors", "author": "authors", "au": "authors",
+    "year": "year", "publication year": "year", "py": "year",
+    "journal": "journal", "source title": "journal", "journal/book": "journal",
+    "doi": "doi",
+    "pmid": "pmid", "pubmed id": "pmid",
+}
+
+
+def iter_csv(stream, source=""):
+    reader = csv.reader(stream)
+    header = next(reader, None)
+    if header is None:
+        return
+    columns = [CSV_ALIASES.get(name.strip().lower().lstrip("﻿")) for name in header]
+    for row in reader:
+        fields = {}
+        for field, value in zip(columns, row):
+            if field and value and field not in fields:
+                fields[field] = value
+        if fields:
+            yield _make_record(fields, source)
+
+
+def _iter_json_values(stream, chunk_size=1 << 16):
+    """
+    Yield the elements of a top-level JSON array (or a stream of concatenated / line-delimited
+    JSON values) without reading the whole document
+    """
+    decoder = json.JSONDecoder()
+    buffer = ""
+    in_array = None
+    eof = False
+    while True:
+        stripped = buffer.lstrip()
+        if in_array is None and stripped:
+            in_array = stripped[0] == "["
+            buffer = stripped[1:] if in_array else stripped
+            continue
+        buffer = buffer.lstrip().lstrip(",").lstrip()
+        if in_array and buffer.startswith("]"):
+            return
+        if buffer:
+            try:
+                value, end = decoder.raw_decode(buffer)
+            except ValueError:
+                if eof:
+                    raise
+            else:
+                # a number at the end of the buffer may still be incomplete
+                if end < len(buffer) or eof or not isinstance(value, (int, float)):
+                    yield value
+                    buffer = buffer[end:]
+                    continue
+        if eof:
+            return
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            eof = True
+        buffer += chunk
+
+
+JSON_FIELDS = {
+    "id": "id", "title": "title", "abstract": "abstract", "authors": "authors", "author": "authors",
+    "year": "year", "journal": "journal", "doi": "doi", "pmid": "pmid",
+}
+
+
+def _json_field(field, value):
+    """
+    Authors stay a list for _make_record to join; a list in any other field (e.g. a title split
+    into parts) is joined into one string
+    """
+    if isinstance(value, list):
+        parts = [str(part) for part in value if part not in (None, "")]
+        return parts if field == "authors" else " ".join(parts)
+    return str(value)
+
+
+def iter_json(stream, source=""):
+    for item in _iter_json_values(stream):
+        if not isinstance(item, dict):
+            continue
+        fields = {}
+        for key, value in item.items():
+            field = JSON_FIELDS.get(key.lower())
+            if field and value not in (None, "", []) and field not in fields:
+                fields[field] = _json_field(field, value)
+        if fields:
+            yield _make_record(fields, source)
+
+
+def _make_record(fields, source):
+    authors = fields.get("authors", "")
+    if isinstance(authors, list):
+        authors = "; ".join(str(author) for author in authors)
+    return Record(
+        id=fields.get("id") or fields.get("pmid") or _clean_doi(fields.get("doi")) or None,
+        title=fields.get("title", ""),
+        abstract=fields.get("abstract", ""),
+        authors=authors,
+        year=str(fields.get("year", ""))[:4],
+        journal=fields.get("journal", ""),
+        doi=_clean_doi(fields.get("doi")),
+        pmid=fields.get("pmid", ""),
+        source=source,
+    )
+
+
+PARSERS = {
+    "ris": iter_ris,
+    "nbib": iter_nbib,
+    "csv": iter_csv,
+    "json": iter_json,
+}
+
+EXTENSIONS = {
+    ".ris": "ris",
+    ".txt": "nbib",
+    ".nbib": "nbib",
+    ".medline": "nbib",
+    ".csv": "csv",
+    ".json": "json",
+    ".jsonl": "json",
+}
+
+
+def detect_format(filename):
+    return EXTENSIONS.get(os.path.splitext(filename.lower())[1])
+
+
+class _ProgressReader(io.RawIOBase):
+    """
+    Wraps a binary file and reports bytes read so far
+    """
+
+    def __init__(self, raw, on_progress, total):
+        self.raw = raw
+        self.on_progress = on_progress
+        self.total = total
+        self.bytes_read = 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        data = self.raw.read(len(buffer))
+        n = len(data)
+        buffer[:n] = data
+        self.bytes_read += n
+        if self.on_progress is not None and n:
+            self.on_progress(self.bytes_read, self.total)
+        return n
+
+
+def iter_records(binary_stream, fmt, source="", total_bytes=None, on_progress=None, encoding="utf-8-sig"):
+    """
+    Parse a binary stream incrementally. on_progress(bytes_read, total_bytes) is called as the file is consumed
+    """
+    parser = PARSERS[fmt]
+    reader = io.BufferedReader(_ProgressReader(binary_stream, on_progress, total_bytes), buffer_size=1 << 16)
+    text = io.TextIOWrapper(reader, encoding=encoding, errors="replace", newline="" if fmt == "csv" else None)
+    yield from parser(text, source)
+
+
+def iter_file(path, fmt=None, on_progress=None):
+    fmt = fmt or detect_format(path)
+    with open(path, "rb") as f:
+        yield from iter_records(f, fmt, source=os.path.basename(path), total_bytes=os.path.getsize(path), on_progress=on_progress)
+
+
+class RecordStore:
+    """
+    Append-only SQLite spill of imported records with paging, so memory stays bounded
+    however large the import is. Without a path the database is a temporary file that
+    close() deletes
+    """
+
+    def __init__(self, path=None):
+        self.temporary = path is None
+        if self.temporary:
+            fd, path = tempfile.mkstemp(prefix="records-", suffix=".sqlite")
+            os.close(fd)
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        columns = ", ".join(f"{field} TEXT" for field in RECORD_FIELDS)
+        self._conn.execute(f"CREATE TABLE IF NOT EXISTS records (rowid INTEGER PRIMARY KEY, {columns})")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS records_id ON records (id)")
+        self._conn.commit()
+
+    def add_all(self, records, batch_size=2000):
+        """
+        Insert records from any iterable in batches; returns the number inserted
+        """
+        placeholders = ", ".join("?" for field in RECORD_FIELDS)
+        sql = f"INSERT INTO records ({', '.join(RECORD_FIELDS)}) VALUES ({placeholders})"
+        count = 0
+        batch = []
+        next_number = len(self)
+        for record in records:
+            if record.id in (None, ""):
+                record.id = f"record-{next_number + count + len(batch) + 1}"
+            batch.append(tuple(getattr(record, field) for field in RECORD_FIELDS))
+            if len(batch) >= batch_size:
+                count += self._insert(sql, batch)
+                batch = []
+        if batch:
+            count += self._insert(sql, batch)
+        return count
+
+    def _insert(self, sql, rows):
+        with self._lock:
+            self._conn.executemany(sql, rows)
+            self._conn.commit()
+        return len(rows)
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM records").fetchone()[0]
+
+    def page(self, page, page_size=50):
+        """
+        Records on a 0-based page
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {', '.join(RECORD_FIELDS)} FROM records ORDER BY rowid LIMIT ? OFFSET ?",
+                (page_size, page * page_size),
+            ).fetchall()
+        return [Record(*row) for row in rows]
+
+    def get_many(self, ids):
+        """
+        Records with the given ids, in the order of ids (unknown ids are skipped)
+        """
+        ids = [str(item_id) for item_id in ids]
+        found = {}
+        for start in range(0, len(ids), 500):
+            chunk = ids[start:start + 500]
+            with self._lock:
+                rows = self._conn.execute(
+                    f"SELECT {', '.join(RECORD_FIELDS)} FROM records WHERE id IN ({', '.join('?' for i in chunk)})",
+                    chunk,
+                ).fetchall()
+            for row in rows:
+                found.setdefault(str(row[0]), Record(*row))
+        return [found[item_id] for item_id in ids if item_id in found]
+
+    def get_rows(self, positions):
+        """
+        Records at the given 0-based positions in import order, in the order of positions.
+        Unlike ids, positions stay distinct when duplicate records share an id
+        """
+        rowids = [int(position) + 1 for position in positions]
+        found = {}
+        for start in range(0, len(rowids), 500):
+            chunk = rowids[start:start + 500]
+            with self._lock:
+                rows = self._conn.execute(
+                    f"SELECT rowid, {', '.join(RECORD_FIELDS)} FROM records WHERE rowid IN ({', '.join('?' for i in chunk)})",
+                    chunk,
+                ).fetchall()
+            for row in rows:
+                found[row[0]] = Record(*row[1:])
+        return [found[rowid] for rowid in rowids if rowid in found]
+
+    def __iter__(self, batch_size=1000):
+        last = 0
+        while True:
+            with self._lock:
+                rows = self._conn.execute(
+                    f"SELECT rowid, {', '.join(RECORD_FIELDS)} FROM records WHERE rowid > ? ORDER BY rowid LIMIT ?",
+                    (last, batch_size),
+                ).fetchall()
+            if not rows:
+                return
+            for row in rows:
+                yield Record(*row[1:])
+            last = rows[-1][0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+            if self.temporary:
+                for suffix in ("", "-journal"):
+                    if os.path.exists(self.path + suffix):
+                        os.remove(self.path + suffix)
@@ -0,0 +1,473 @@
+"""
+Background job queue for long pipeline stages.
+
+Jobs are rows in a SQLite table, claimed by worker threads in priority order, so a
+Streamlit button only submits work and the page polls by job id. Work survives reruns
+and browser sessions because the queue lives in the server process, and jobs left
+running by a process that died are re-queued when the next queue starts. Handlers report
+progress and partial results (as an append-only event log) through the Job passed to
+them, and stop at their next checkpoint once cancellation is requested.
+
+    queue = jobs.get_queue()
+    job_id = queue.submit("strategy", {"question": question}, priority=1)
+    queue.get(job_id)["status"], queue.events(job_id)
+"""
+import atexit
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+import prompt_cache
+import token_budget
+
+DEFAULT_JOBS_PATH = os.path.join(prompt_cache.DEFAULT_CACHE_DIR, "jobs.sqlite")
+ACTIVE_STATUSES = ("queued", "running")
+JOB_COLUMNS = (
+    "id", "kind", "params", "owner", "priority", "status", "cancel_requested", "progress", "message",
+    "result", "usage", "error", "created", "started", "finished", "pid",
+)
+JSON_COLUMNS = ("params", "result", "usage")
+
+HANDLERS = {}
+
+
+class JobCancelled(Exception):
+    pass
+
+
+def handler(kind):
+    """
+    Register the decorated function(job, **params) as the default handler for a job kind
+    """
+    def register(func):
+        HANDLERS[kind] = func
+        return func
+    return register
+
+
+def _dumps(value):
+    return json.dumps(value, default=str, ensure_ascii=False)
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except (OSError, TypeError):
+        return False
+    return True
+
+
+class Job:
+    """
+    What a handler sees of its job: progress, partial results and cancellation
+    """
+
+    def __init__(self, queue, job_id):
+        self.queue = queue
+        self.id = job_id
+
+    def progress(self, fraction, message=None):
+        self.queue._update(self.id, progress=max(0.0, min(1.0, fraction)), message=message)
+
+    def emit(self, kind, data):
+        """
+        Append a partial result that pollers can read with JobQueue.events
+        """
+        self.queue._emit(self.id, kind, data)
+
+    @property
+    def cancelled(self):
+        row = self.queue._connection().execute("SELECT cancel_requested FROM jobs WHERE id = ?", (self.id,)).fetchone()
+        return bool(row and row[0])
+
+    def check_cancelled(self):
+        if self.cancelled:
+            raise JobCancelled(self.id)
+
+
+class JobQueue:
+    """
+    SQLite-backed queue worked by a fixed number of threads. Higher priority runs first,
+    then oldest first.
+    """
+
+    def __init__(self, path=DEFAULT_JOBS_PATH, workers=2, poll_interval=0.5):
+        self.path = path
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.handlers = dict(HANDLERS)
+        self._local = threading.local()
+        self._threads = []
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._start_lock = threading.Lock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        conn = self._connection()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs (id TEXT PRIMARY KEY, kind TEXT, params TEXT, owner TEXT, "
+            "priority INTEGER DEFAULT 0, status TEXT, cancel_requested INTEGER DEFAULT 0, progress REAL DEFAULT 0, "
+            "message TEXT, result TEXT, usage TEXT, error TEXT, created REAL, started REAL, finished REAL, pid INTEGER)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS jobs_claim ON jobs (status, priority, created)")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS job_events (seq INTEGER PRIMARY KEY AUTOINCREMENT, job_id TEXT, kind TEXT, "
+            "data TEXT, created REAL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS job_events_job ON job_events (job_id, seq)")
+        conn.commit()
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            self._local.conn = conn
+        return conn
+
+    def register(self, kind, func):
+        self.handlers[kind] = func
+
+    def start(self):
+        """
+        Re-queue jobs orphaned by a dead process and start the worker threads (once)
+        """
+        with self._start_lock:
+            if self._threads:
+                return
+            conn = self._connection()
+            for job_id, pid in conn.execute("SELECT id, pid FROM jobs WHERE status = 'running'").fetchall():
+                if pid == os.getpid() or not _pid_alive(pid):
+                    conn.execute("UPDATE jobs SET status = 'queued', pid = NULL WHERE id = ? AND status = 'running'", (job_id,))
+            self._stop.clear()
+            for number in range(self.workers):
+                thread = threading.Thread(target=self._work, name=f"job-worker-{number}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def submit(self, kind, params=None, priority=0, owner=None):
+        """
+        Queue a job and return its id; workers are started on first submit
+        """
+        if kind not in self.handlers:
+            raise KeyError(f"No handler registered for job kind {kind!r}")
+        job_id = uuid.uuid4().hex
+        self._connection().execute(
+            "INSERT INTO jobs (id, kind, params, owner, priority, status, created) VALUES (?, ?, ?, ?, ?, 'queued', ?)",
+            (job_id, kind, _dumps(params or {}), owner, priority, time.time()),
+        )
+        self.start()
+        self._wake.set()
+        return job_id
+
+    def cancel(self, job_id):
+        """
+        Cancel a queued job now, or ask a running one to stop at its next checkpoint.
+        Returns False if the job had already finished
+        """
+        conn = self._connection()
+        cursor = conn.execute(
+            "UPDATE jobs SET status = 'cancelled', cancel_requested = 1, finished = ? WHERE id = ? AND status = 'queued'",
+            (time.time(), job_id),
+        )
+        if cursor.rowcount:
+            return True
+        cursor = conn.execute("UPDATE jobs SET cancel_requested = 1 WHERE id = ? AND status = 'running'", (job_id,))
+        return bool(cursor.rowcount)
+
+    def _decode(self, row):
+        job = dict(zip(JOB_COLUMNS, row))
+        for column in JSON_COLUMNS:
+            if job[column] is not None:
+                job[column] = json.loads(job[column])
+        return job
+
+    def get(self, job_id):
+        row = self._connection().execute(f"SELECT {', '.join(JOB_COLUMNS)} FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._decode(row) if row else None
+
+    def list(self, owner=None, status=None, limit=50):
+        """
+        Most recent jobs first, optionally for one owner and/or status
+        """
+        clauses = []
+        params = []
+        if owner is not None:
+            clauses.append("owner = ?")
+            params.append(owner)
+        if status is not None:
+            clauses.append("status = ?")
+            params.append(status)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        rows = self._connection().execute(
+            f"SELECT {', '.join(JOB_COLUMNS)} FROM jobs {where} ORDER BY created DESC LIMIT ?", params + [limit]
+        ).fetchall()
+        return [self._decode(row) for row in rows]
+
+    def events(self, job_id, after=0):
+        """
+        Partial results emitted by a job since event seq after, oldest first
+        """
+        rows = self._connection().execute(
+            "SELECT seq, kind, data, created FROM job_events WHERE job_id = ? AND seq > ? ORDER BY seq", (job_id, after)
+        ).fetchall()
+        return [{"seq": seq, "kind": kind, "data": json.loads(data), "created": created} for seq, kind, data, created in rows]
+
+    def _update(self, job_id, **fields):
+        fields = {column: value for column, value in fields.items() if value is not None}
+        if not fields:
+            return
+        assignments = ", ".join(f"{column} = ?" for column in fields)
+        values = [_dumps(value) if column in JSON_COLUMNS else value for column, value in fields.items()]
+        self._connection().execute(f"UPDATE jobs SET {assignments} WHERE id = ?", values + [job_id])
+
+    def _emit(self, job_id, kind, data):
+        self._connection().execute(
+            "INSERT INTO job_events (job_id, kind, data, created) VALUES (?, ?, ?, ?)",
+            (job_id, kind, _dumps(data), time.time()),
+        )
+
+    def _claim(self):
+        """
+        Atomically move the best queued job to running; None when the queue is empty
+        """
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                f"SELECT {', '.join(JOB_COLUMNS)} FROM jobs WHERE status = 'queued' ORDER BY priority DESC, created LIMIT 1"
+            ).fetchone()
+            if row is not None:
+                conn.execute(
+                    "UPDATE jobs SET status = 'running', started = ?, pid = ? WHERE id = ?",
+                    (time.time(), os.getpid(), row[0]),
+                )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return self._decode(row) if row else None
+
+    def _work(self):
+        while not self._stop.is_set():
+            job = self._claim()
+            if job is None:
+                self._wake.wait(self.poll_interval)
+                self._wake.clear()
+                continue
+            self._run(job)
+
+    def _run(self, job):
+        func = self.handlers.get(job["kind"])
+        status, result, error = "done", None, None
+        with token_budget.track_run() as ledger:
+            try:
+                if func is None:
+                    raise KeyError(f"No handler registered for job kind {job['kind']!r}")
+                result = func(Job(self, job["id"]), **job["params"])
+            except JobCancelled:
+                status = "cancelled"
+            except Exception as exc:
+                status, error = "failed", f"{type(exc).__name__}: {exc}"
+        self._update(
+            job["id"], status=status, result=result, error=error, finished=time.time(),
+            usage={"totals": ledger.totals(), "by_stage": ledger.by_stage()},
+            progress=1.0 if status == "done" else None,
+        )
+
+    def shutdown(self, wait=True):
+        """
+        Stop the workers after their current job; unfinished jobs stay queued
+        """
+        self._stop.set()
+        self._wake.set()
+        if wait:
+            for thread in self._threads:
+                thread.join()
+        self._threads = []
+
+
+_queue = None
+_queue_lock = threading.Lock()
+
+
+def get_queue():
+    """
+    Return the process-wide queue, creating it on first use
+    """
+    global _queue
+    with _queue_lock:
+        if _queue is None:
+            _queue = JobQueue()
+        return _queue
+
+
+def shutdown_queue():
+    global _queue
+    with _queue_lock:
+        queue, _queue = _queue, None
+    if queue is not None:
+        queue.shutdown(wait=False)
+
+
+atexit.register(shutdown_queue)
+
+
+@handler("strategy")
+def run_strategy(job, question, max_workers=4):
+    """
+    The search strategy pipeline; each finished stage is emitted as a "stage" event
+    """
+    import search_strat as ss
+
+    persona_dict = ss.load_persona_dict()
+    finished = []
+
+    def on_result(stage, value, seconds):
+        finished.append(stage.name)
+        job.emit("stage", {"name": stage.name, "label": stage.label, "value": value, "seconds": seconds})
+        job.progress(len(finished) / len(ss.STRATEGY_PIPELINE), f"Finished {stage.label}")
+        job.check_cancelled()
+
+    run = ss.build_search_strategy(question, persona_dict, max_workers=max_workers, on_result=on_result)
+    return {
+        "strategy": ss.strategy_summary(run.results),
+        "failures": {database: str(error) for database, error in run.results["database_strategies"].failures.items()},
+        "wall_time": run.wall_time,
+        "critical_path": run.critical_path,
+        "critical_path_time": run.critical_path_time,
+    }
+
+
+@handler("screening")
+def run_screening(job, records, criteria, batch_size=10, max_workers=4, rate_per_minute=None, checkpoint=None):
+    """
+    Title/abstract screening of record dicts; decisions so far are readable from the checkpoint
+    """
+    import screening
+    import search_strat as ss
+
+    persona_dict = ss.load_persona_dict()
+    total = len(records)
+
+    def on_progress(screened, resumed):
+        job.progress((screened + resumed) / max(1, total), f"Screened {screened + resumed}/{total} records")
+        job.check_cancelled()
+
+    result = screening.screen_records(
+        records, criteria, persona_dict, batch_size=batch_size, max_workers=max_workers,
+        rate_per_minute=rate_per_minute, checkpoint=checkpoint, on_progress=on_progress,
+    )
+    return {
+        "decisions": result.decisions,
+        "counts": result.counts(),
+        "screened": result.screened,
+        "resumed": result.resumed,
+        "failed_batches": result.failed_batches,
+        "records_per_minute": result.records_per_minute,
+    }
+
+
+@handler("fulltext")
+def run_fulltext(job, papers, criteria, top_k=2, max_passages=8, max_workers=4, store_root=None):
+    """
+    Full-text screening of [(record_id, sha)] papers from the PDF store
+    """
+    import fulltext_screening
+    import pdf_store
+    import search_strat as ss
+
+    persona_dict = ss.load_persona_dict()
+    store = pdf_store.PDFStore(store_root or pdf_store.DEFAULT_STORE_DIR)
+
+    def on_progress(done, total):
+        job.progress(done / max(1, total), f"Screened {done}/{total} papers")
+        job.check_cancelled()
+
+    try:
+        result = fulltext_screening.screen_papers(
+            store, [tuple(paper) for paper in papers], criteria, persona_dict,
+            top_k=top_k, max_passages=max_passages, max_workers=max_workers, on_progress=on_progress,
+        )
+    finally:
+        store.close()
+    return {
+        "rows": result.rows,
+        "failures": {record_id: str(error) for record_id, error in result.failures.items()},
+        "prompt_tokens": result.prompt_tokens,
+        "full_text_tokens": result.full_text_tokens,
+    }
+
+
+@handler("risk_of_bias")
+def run_risk_of_bias(job, papers, max_passages=10, max_workers=4, store_root=None, cache_path=None):
+    """
+    RoB 2 assessment of [(record_id, sha)] papers; each judgement reaches the on-disk cache as
+    its paper finishes, so a cancelled or failed job loses none of the finished ones
+    """
+    import pdf_store
+    import risk_of_bias
+    import search_strat as ss
+
+    persona_dict = ss.load_persona_dict()
+    store = pdf_store.PDFStore(store_root or pdf_store.DEFAULT_STORE_DIR)
+    cache = risk_of_bias.JudgementCache(cache_path or risk_of_bias.DEFAULT_CACHE_PATH)
+
+    def on_progress(done, total):
+        job.progress(done / max(1, total), f"Assessed {done}/{total} papers")
+        job.check_cancelled()
+
+    try:
+        result = risk_of_bias.assess_papers(
+            store, [tuple(paper) for paper in papers], persona_dict, max_passages=max_passages,
+            max_workers=max_workers, cache=cache, on_progress=on_progress,
+        )
+    finally:
+        cache.close()
+        store.close()
+    return {
+        "rows": result.rows,
+        "failures": {record_id: str(error) for record_id, error in result.failures.items()},
+        "assessed": result.assessed,
+        "cached": result.cached,
+    }
+
+
+@handler("summary")
+def run_summary(job, papers, question, fan_in=6, max_workers=4, store_root=None, cache_path=None):
+    """
+    Map-reduce summary of [(record_id, sha)] papers; every finished node is cached on disk, so
+    a re-run after a cancel or failure only pays for the nodes still missing
+    """
+    import pdf_store
+    import prompt_cache
+    import search_strat as ss
+    import summarizer
+
+    persona_dict = ss.load_persona_dict()
+    store = pdf_store.PDFStore(store_root or pdf_store.DEFAULT_STORE_DIR)
+    cache = prompt_cache.PromptCache(cache_path or summarizer.DEFAULT_CACHE_PATH, max_entries=None)
+
+    def on_progress(level, done, total):
+        step = "Summarised" if level == 0 else f"Combined (level {level})"
+        job.progress(done / max(1, total), f"{step} {done}/{total}")
+        job.check_cancelled()
+
+    try:
+        result = summarizer.summarize_studies(
+            store, [tuple(paper) for paper in papers], question, persona_dict, fan_in=fan_in,
+            max_workers=max_workers, cache=cache, on_progress=on_progress,
+        )
+    finally:
+        cache.close()
+        store.close()
+    return {
+        "summary": result.summary,
+        "studies": result.studies,
+        "levels": result.levels,
+        "failures": {key: str(error) for key, error in result.failures.items()},
+        "elapsed": result.elapsed,
+    }
@@ -0,0 +1,79 @@
+"""
+Deferred imports and per-process secrets.
+
+Streamlit re-executes main.py on every interaction, and the first run of a process pays for every
+module it imports before the sidebar renders. lazy_import returns a stand-in module that is only
+imported when one of its attributes is first used, so a stage's dependencies (pandas, numpy, the
+LLM stack) load when that stage runs. secret resolves a setting once per process, from Streamlit
+secrets when running under Streamlit and from the environment otherwise.
+"""
+import functools
+import importlib
+import os
+import sys
+import threading
+import types
+
+_import_lock = threading.RLock()
+
+
+class LazyModule(types.ModuleType):
+    """
+    Module proxy that imports the real module on first attribute access
+    """
+
+    def __init__(self, name):
+        super().__init__(name)
+        self.__dict__["_module"] = None
+
+    def _load(self):
+        module = self.__dict__["_module"]
+        if module is None:
+            with _import_lock:
+                module = self.__dict__["_module"]
+                if module is None:
+                    module = importlib.import_module(self.__name__)
+                    self.__dict__["_module"] = module
+        return module
+
+    def __getattr__(self, name):
+        return getattr(self._load(), name)
+
+    def __setattr__(self, name, value):
+        setattr(self._load(), name, value)
+
+    def __dir__(self):
+        return dir(self._load())
+
+    def __repr__(self):
+        state = "loaded" if self.__dict__["_module"] is not None else "not loaded"
+        return f"<lazy module {self.__name__!r} ({state})>"
+
+
+def lazy_import(name):
+    """
+    The module itself if it is already imported, otherwise a LazyModule that imports it on first use
+    """
+    module = sys.modules.get(name)
+    if module is not None:
+        return module
+    return LazyModule(name)
+
+
+def is_loaded(name):
+    return name in sys.modules
+
+
+@functools.lru_cache(maxsize=None)
+def secret(name, default=None):
+    """
+    st.secrets[name] under Streamlit, else the environment variable, else default. Resolved once per process;
+    headless runs (batch.py, job workers) never import streamlit for this
+    """
+    streamlit = sys.modules.get("streamlit")
+    if streamlit is not None:
+        try:
+            return streamlit.secrets[name]
+        except Exception:
+            pass
+    return os.environ.get(name, default)
@@ -0,0 +1,541 @@
+"""
+Database search: pluggable source adapters, a local stand-in backend and a concurrent executor.
+
+The local backend is an on-disk SQLite corpus with an FTS5 index. PubMed-style Boolean
+queries (AND/OR/NOT evaluated left to right, parentheses, quoted phrases, trailing * truncation,
+[tiab]/[ti]/[ab]/[au]/[ta]/[dp]-style field tags, [tiab:~N] proximity and year ranges) are
+parsed once and compiled to a single FTS5 MATCH expression wherever possible. Other sources
+can be added later by subclassing SearchAdapter and registering an instance.
+
+SearchRun queries every selected source concurrently, pages through each result set under that
+source's rate limit, and yields importers.Record hits as pages arrive so they can stream
+straight into a RecordStore.
+"""
+import functools
+import os
+import queue
+import re
+import sqlite3
+import threading
+from array import array
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import importers
+import prompt_cache
+from rate_limit import RateLimiter
+from retry import call_with_retry
+
+DEFAULT_CORPUS_PATH = os.environ.get("SYNTHSCOPE_CORPUS", os.path.join(prompt_cache.DEFAULT_CACHE_DIR, "corpus.sqlite"))
+LOCAL_SOURCE = "Local corpus"
+
+TEXT_COLUMNS = ("title", "abstract")
+INDEXED_COLUMNS = ("title", "abstract", "authors", "journal")
+
+# PubMed field tags -> corpus columns. The stand-in corpus has no MeSH or publication-type
+# data, so those tags search titles and abstracts like a text word would.
+FIELD_COLUMNS = {
+    "ti": ("title",), "title": ("title",),
+    "ab": ("abstract",), "abstract": ("abstract",),
+    "tiab": TEXT_COLUMNS, "title/abstract": TEXT_COLUMNS,
+    "tw": TEXT_COLUMNS, "text word": TEXT_COLUMNS, "all": TEXT_COLUMNS, "all fields": TEXT_COLUMNS,
+    "mh": TEXT_COLUMNS, "mesh": TEXT_COLUMNS, "mesh terms": TEXT_COLUMNS, "majr": TEXT_COLUMNS,
+    "mesh major topic": TEXT_COLUMNS, "sh": TEXT_COLUMNS, "pt": TEXT_COLUMNS, "publication type": TEXT_COLUMNS,
+    "au": ("authors",), "author": ("authors",), "1au": ("authors",), "lastau": ("authors",), "fau": ("authors",),
+    "ta": ("journal",), "journal": ("journal",), "jour": ("journal",),
+}
+DATE_FIELDS = {"dp", "pdat", "publication date", "date - publication", "edat", "year", "py"}
+
+_TOKEN = re.compile(
+    r'\s*(?:(?P<lparen>\()|(?P<rparen>\))|(?P<field>\[[^\]]*\]?)|"(?P<phrase>[^"]*)"?'
+    r'|(?P<colon>:(?=[\s"]|$))|(?P<word>[^\s()\[\]"]+))'
+)
+OPERATORS = ("AND", "OR", "NOT")
+
+
+class Term:
+    """
+    A word or phrase searched in some columns; prefix for trailing *, proximity for [field:~N]
+    """
+
+    __slots__ = ("words", "columns", "prefix", "proximity")
+
+    def __init__(self, words, columns=TEXT_COLUMNS, prefix=False, proximity=None):
+        self.words = words
+        self.columns = columns
+        self.prefix = prefix
+        self.proximity = proximity
+
+
+class YearRange:
+    __slots__ = ("start", "end")
+
+    def __init__(self, start, end):
+        self.start = min(start, end)
+        self.end = max(start, end)
+
+
+class AllRecords:
+    """
+    Every record: the left operand of a NOT that starts a query or group
+    """
+
+    __slots__ = ()
+
+
+class BoolOp:
+    __slots__ = ("op", "left", "right")
+
+    def __init__(self, op, left, right):
+        self.op = op
+        self.left = left
+        self.right = right
+
+
+def _tokenize(query):
+    tokens = []
+    for match in _TOKEN.finditer(query):
+        kind = match.lastgroup
+        if kind is None:
+            continue
+        value = match.group(kind)
+        if kind == "word" and value in OPERATORS:
+            kind = "op"
+        tokens.append((kind, value))
+    return tokens
+
+
+def _years(text):
+    return [int(year) for year in re.findall(r"\d{4}", text)]
+
+
+def _make_term(text, field=None):
+    """
+    A Term or YearRange for one query word/phrase and its optional [field] tag; None if it has no searchable words
+    """
+    field = (field or "").strip("[] ").lower()
+    field, _, modifier = field.partition(":")
+    field = field.strip()
+    if field in DATE_FIELDS:
+        years = _years(text)
+        return YearRange(years[0], years[-1]) if years else None
+    prefix = text.rstrip().endswith("*")
+    words = tuple(re.findall(r"\w+", text.lower()))
+    if not words:
+        return None
+    proximity = None
+    if modifier.strip().startswith("~"):
+        digits = modifier.strip()[1:]
+        proximity = int(digits) if digits.isdigit() else None
+    return Term(words, FIELD_COLUMNS.get(field, TEXT_COLUMNS), prefix, proximity)
+
+
+def parse_query(query):
+    """
+    Parse a PubMed-style query into Term/YearRange/BoolOp nodes. Operators are applied left to
+    right as PubMed does, adjacent terms are ANDed, and unbalanced parentheses are tolerated
+    (generated queries often drop the opening one). A field tag applies to the whole run of words
+    before it ("Smith J[au]" is one author), and a leading NOT excludes from every record.
+    Raises ValueError if nothing is searchable.
+    """
+    tokens = _tokenize(query or "")
+    position = 0
+
+    def operand(depth):
+        nonlocal position
+        kind, value = tokens[position]
+        position += 1
+        if kind == "lparen":
+            return expression(depth + 1)
+        if kind not in ("word", "phrase"):
+            return None
+        if kind == "word":
+            end = position
+            while end < len(tokens) and tokens[end][0] == "word":
+                end += 1
+            if end > position and end < len(tokens) and tokens[end][0] == "field":
+                value = " ".join([value] + [word for _, word in tokens[position:end]])
+                position = end
+        field = None
+        if position < len(tokens) and tokens[position][0] == "field":
+            field = tokens[position][1]
+            position += 1
+        node = _make_term(value, field)
+        if isinstance(node, YearRange) and position < len(tokens) and tokens[position][0] == "colon":
+            position += 1
+            end = operand(depth) if position < len(tokens) else None
+            if isinstance(end, YearRange):
+                node = YearRange(node.start, end.end)
+        return node
+
+    def expression(depth):
+        nonlocal position
+        node = None
+        op = None
+        while position < len(tokens):
+            kind, value = tokens[position]
+            if kind == "rparen":
+                position += 1
+                if depth:
+                    break
+                continue
+            if kind == "op":
+                op = value
+                position += 1
+                continue
+            right = operand(depth)
+            if right is None:
+                continue
+            if node is None and op == "NOT":
+                node = AllRecords()
+            node = right if node is None else BoolOp(op or "AND", node, right)
+            op = None
+        return node
+
+    node = expression(0)
+    if node is None:
+        raise ValueError(f"Nothing to search for in query: {query!r}")
+    return node
+
+
+def _fts_term(term):
+    phrases = [f'"{word}"' for word in term.words]
+    if term.prefix:
+        phrases[-1] += " *"
+    if term.proximity is not None and len(phrases) > 1:
+        body = f"NEAR({' '.join(phrases)}, {term.proximity})"
+    elif term.prefix:
+        body = f'"{" ".join(term.words)}" *'
+    else:
+        body = f'"{" ".join(term.words)}"'
+    return "{" + " ".join(term.columns) + "} : " + body
+
+
+FTS_FILTER = "rowid IN (SELECT rowid FROM records_fts WHERE records_fts MATCH ?)"
+SQL_OPERATORS = {"AND": "AND", "OR": "OR", "NOT": "AND NOT"}
+
+
+def _compile(node):
+    """
+    ("fts", match_expression, []) while a subtree only needs the full-text index, else ("sql", where, params)
+    """
+    if isinstance(node, Term):
+        return "fts", _fts_term(node), []
+    if isinstance(node, YearRange):
+        return "sql", "(year_num BETWEEN ? AND ?)", [node.start, node.end]
+    if isinstance(node, AllRecords):
+        return "sql", "1", []
+    left = _compile(node.left)
+    right = _compile(node.right)
+    if left[0] == right[0] == "fts":
+        return "fts", f"({left[1]}) {node.op} ({right[1]})", []
+    left_sql, left_params = _as_sql(left)
+    right_sql, right_params = _as_sql(right)
+    return "sql", f"({left_sql} {SQL_OPERATORS[node.op]} {right_sql})", left_params + right_params
+
+
+def _as_sql(compiled):
+    kind, text, params = compiled
+    if kind == "fts":
+        return FTS_FILTER, [text]
+    return text, params
+
+
+@functools.lru_cache(maxsize=256)
+def compile_query(query):
+    """
+    SQL WHERE clause and parameters over the corpus records table for a PubMed-style query
+    """
+    where, params = _as_sql(_compile(parse_query(query)))
+    return where, tuple(params)
+
+
+def _year_num(year):
+    match = re.search(r"\d{4}", year or "")
+    return int(match.group()) if match else None
+
+
+class LocalCorpus:
+    """
+    On-disk record corpus with an FTS5 index. Each thread gets its own read connection,
+    reused across searches.
+    """
+
+    def __init__(self, path=DEFAULT_CORPUS_PATH):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._local = threading.local()
+        self._connections = []
+        self._lock = threading.Lock()
+        self.version = 0
+        conn = self._connection()
+        columns = ", ".join(f"{field} TEXT" for field in importers.RECORD_FIELDS)
+        conn.execute(f"CREATE TABLE IF NOT EXISTS records (rowid INTEGER PRIMARY KEY, {columns}, year_num INTEGER)")
+        conn.execute("CREATE INDEX IF NOT EXISTS records_year ON records (year_num)")
+        conn.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS records_fts USING fts5({', '.join(INDEXED_COLUMNS)}, "
+            "content='records', content_rowid='rowid', tokenize='unicode61 remove_diacritics 2')"
+        )
+        conn.commit()
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+            self._local.conn = conn
+            with self._lock:
+                self._connections.append(conn)
+        return conn
+
+    def add_all(self, records, batch_size=2000):
+        """
+        Add records from any iterable in batches and index them; returns the number added
+        """
+        fields = importers.RECORD_FIELDS + ("year_num",)
+        sql = f"INSERT INTO records ({', '.join(fields)}) VALUES ({', '.join('?' for field in fields)})"
+        count = 0
+        batch = []
+        for record in records:
+            batch.append(tuple(getattr(record, field) for field in importers.RECORD_FIELDS) + (_year_num(record.year),))
+            if len(batch) >= batch_size:
+                count += self._insert(sql, batch)
+                batch = []
+        if batch:
+            count += self._insert(sql, batch)
+        return count
+
+    def _insert(self, sql, rows):
+        conn = self._connection()
+        with self._lock:
+            last = conn.execute("SELECT COALESCE(MAX(rowid), 0) FROM records").fetchone()[0]
+            conn.executemany(sql, rows)
+            conn.execute(
+                f"INSERT INTO records_fts (rowid, {', '.join(INDEXED_COLUMNS)}) "
+                f"SELECT rowid, {', '.join(INDEXED_COLUMNS)} FROM records WHERE rowid > ?",
+                (last,),
+            )
+            conn.commit()
+            self.version += 1
+        return len(rows)
+
+    def __len__(self):
+        return self._connection().execute("SELECT COUNT(*) FROM records").fetchone()[0]
+
+    def match_ids(self, query):
+        """
+        Rowids of every record matching the query, in corpus order
+        """
+        where, params = compile_query(query)
+        rows = self._connection().execute(f"SELECT rowid FROM records WHERE {where} ORDER BY rowid", params)
+        return array("q", (row[0] for row in rows))
+
+    def fetch(self, rowids):
+        """
+        Records for the given rowids, in the order given
+        """
+        found = {}
+        for start in range(0, len(rowids), 500):
+            chunk = list(rowids[start:start + 500])
+            rows = self._connection().execute(
+                f"SELECT rowid, {', '.join(importers.RECORD_FIELDS)} FROM records WHERE rowid IN ({', '.join('?' for i in chunk)})",
+                chunk,
+            ).fetchall()
+            for row in rows:
+                found[row[0]] = importers.Record(*row[1:])
+        return [found[rowid] for rowid in rowids if rowid in found]
+
+    def close(self):
+        with self._lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections = []
+        self._local = threading.local()
+
+
+class SearchAdapter:
+    """
+    One searchable source. Subclasses implement count(query) and fetch_page(query, cursor,
+    page_size) -> (records, next_cursor), with next_cursor None after the last page. Every call
+    goes through the adapter's own rate limiter.
+    """
+
+    name = "Source"
+
+    def __init__(self, name=None, rate_per_minute=None, max_concurrent=None):
+        self.name = name or self.name
+        self.limiter = RateLimiter(rate_per_minute, max_concurrent)
+
+    def count(self, query):
+        raise NotImplementedError
+
+    def fetch_page(self, query, cursor=None, page_size=100):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class LocalAdapter(SearchAdapter):
+    """
+    Adapter over a LocalCorpus, standing in for a real bibliographic database. Like PubMed's
+    esearch/efetch, a query is matched once and its id list kept for paging (until the corpus
+    changes); the cursor is an offset into that list.
+    """
+
+    name = LOCAL_SOURCE
+
+    def __init__(self, corpus, name=None, rate_per_minute=None, max_concurrent=None, cached_queries=16):
+        super().__init__(name, rate_per_minute, max_concurrent)
+        self.corpus = corpus
+        self.cached_queries = cached_queries
+        self._ids = OrderedDict()
+        self._ids_lock = threading.Lock()
+
+    def _match_ids(self, query):
+        key = (query, self.corpus.version)
+        with self._ids_lock:
+            if key in self._ids:
+                self._ids.move_to_end(key)
+                return self._ids[key]
+        ids = self.corpus.match_ids(query)
+        with self._ids_lock:
+            self._ids[key] = ids
+            while len(self._ids) > self.cached_queries:
+                self._ids.popitem(last=False)
+        return ids
+
+    def count(self, query):
+        return len(self._match_ids(query))
+
+    def fetch_page(self, query, cursor=None, page_size=100):
+        ids = self._match_ids(query)
+        start = cursor or 0
+        end = start + page_size
+        return self.corpus.fetch(ids[start:end]), (end if end < len(ids) else None)
+
+    def close(self):
+        with self._ids_lock:
+            self._ids.clear()
+        self.corpus.close()
+
+
+_adapters = {}
+_adapters_lock = threading.Lock()
+
+
+def register_adapter(adapter):
+    with _adapters_lock:
+        _adapters[adapter.name] = adapter
+    return adapter
+
+
+def get_adapter(name):
+    return _adapters[name]
+
+
+def adapter_names():
+    return list(_adapters)
+
+
+def register_local_corpus(path=DEFAULT_CORPUS_PATH, name=LOCAL_SOURCE, rate_per_minute=None, max_concurrent=None):
+    """
+    The registered adapter for the local corpus, creating the corpus and adapter on first use
+    """
+    with _adapters_lock:
+        if name not in _adapters:
+            _adapters[name] = LocalAdapter(LocalCorpus(path), name, rate_per_minute, max_concurrent)
+        return _adapters[name]
+
+
+_DONE = object()
+
+
+class SearchRun:
+    """
+    Run one query per adapter concurrently and yield Record hits (source set to the adapter
+    name) as pages arrive. totals, counts and failures are filled in per source as the run
+    goes; a failing source is recorded in failures and does not stop the others.
+    on_page(source, fetched, total) is called on the consuming thread after each page.
+    """
+
+    def __init__(self, searches, page_size=100, max_results=None, max_workers=4, retries=3, backoff=1.0, on_page=None):
+        self.searches = list(searches)
+        self.page_size = page_size
+        self.max_results = max_results
+        self.max_workers = max_workers
+        self.retries = retries
+        self.backoff = backoff
+        self.on_page = on_page
+        self.totals = {}
+        self.counts = {}
+        self.failures = {}
+
+    def _call(self, adapter, func, *args):
+        def limited():
+            with adapter.limiter:
+                return func(*args)
+
+        return call_with_retry(limited, retries=self.retries, backoff=self.backoff)
+
+    def _put(self, hits, item, stop):
+        while not stop.is_set():
+            try:
+                hits.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+    def _run_source(self, adapter, query, hits, stop):
+        try:
+            self.totals[adapter.name] = self._call(adapter, adapter.count, query)
+            self.counts[adapter.name] = 0
+            cursor = None
+            while not stop.is_set():
+                size = self.page_size
+                if self.max_results is not None:
+                    size = min(size, self.max_results - self.counts[adapter.name])
+                if size <= 0:
+                    break
+                records, cursor = self._call(adapter, adapter.fetch_page, query, cursor, size)
+                for record in records:
+                    record.source = adapter.name
+                self.counts[adapter.name] += len(records)
+                self._put(hits, (adapter.name, records), stop)
+                if cursor is None:
+                    break
+        except Exception as error:
+            self.failures[adapter.name] = error
+        finally:
+            self._put(hits, _DONE, stop)
+
+    def expected(self):
+        """
+        Hits this run will yield in total, once every source has reported its count
+        """
+        return sum(
+            total if self.max_results is None else min(total, self.max_results)
+            for total in self.totals.values()
+        )
+
+    def __iter__(self):
+        hits = queue.Queue(maxsize=self.max_workers * 4)
+        stop = threading.Event()
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            for adapter, query in self.searches:
+                pool.submit(self._run_source, adapter, query, hits, stop)
+            remaining = len(self.searches)
+            try:
+                while remaining:
+                    item = hits.get()
+                    if item is _DONE:
+                        remaining -= 1
+                        continue
+                    source, records = item
+                    if self.on_page is not None:
+                        self.on_page(source, self.counts[source], self.totals.get(source))
+                    yield from records
+            finally:
+                stop.set()
+
@@ -0,0 +1,167 @@
+"""
+Process-wide pool of LLM clients and chains.
+
+Every persona call used to build its own PromptTemplate, client and LLMChain. The pool
+builds one chain per (model, temperature, max_tokens) and hands the same object back on
+later calls, so the client's HTTP connection pool and the compiled template survive
+across calls and Streamlit reruns (the module stays imported between reruns).
+"""
+import atexit
+import threading
+
+import lazy
+
+QUESTION_TEMPLATE = """Question: {question}
+
+    Answer:"""
+
+CHAT_MODEL_PREFIXES = ("gpt-3.5-turbo", "gpt-4")
+
+
+def default_llm_factory(model, temperature, max_tokens):
+    """
+    Build the langchain LLM for a pool key. Chat models go through ChatOpenAI, the rest through OpenAI
+    """
+    if model.startswith(CHAT_MODEL_PREFIXES) and "instruct" not in model:
+        from langchain.chat_models import ChatOpenAI
+        return ChatOpenAI(model_name=model, temperature=temperature, max_tokens=max_tokens,
+                          openai_api_key=lazy.secret("OPENAI_API_KEY"))
+    from langchain.llms import OpenAI
+    return OpenAI(model_name=model, temperature=temperature, max_tokens=max_tokens, openai_api_key=lazy.secret("OPENAI_API_KEY"))
+
+
+def _close_llm(llm):
+    """
+    Close the HTTP client behind a langchain LLM if the installed openai version exposes one
+    """
+    for attr in ("root_client", "client"):
+        client = getattr(llm, attr, None)
+        client = getattr(client, "_client", client)
+        close = getattr(client, "close", None)
+        if callable(close):
+            try:
+                close()
+            except Exception:
+                pass
+
+
+class LLMPool:
+    """
+    Thread-safe cache of LLMChain objects keyed by (model, temperature, max_tokens)
+    """
+
+    def __init__(self, llm_factory=None, backend=None):
+        self.llm_factory = llm_factory or default_llm_factory
+        self.backend = backend
+        self._lock = threading.Lock()
+        self._prompt = None
+        self._llms = {}
+        self._chains = {}
+        self._closed = False
+
+    def prompt(self):
+        """
+        The shared question template, compiled once per pool
+        """
+        with self._lock:
+            if self._prompt is None:
+                from langchain import PromptTemplate
+                self._prompt = PromptTemplate(template=QUESTION_TEMPLATE, input_variables=["question"])
+            return self._prompt
+
+    def get_llm(self, model, temperature=0, max_tokens=2000):
+        key = (model, float(temperature), max_tokens)
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("LLM pool has been shut down")
+            llm = self._llms.get(key)
+            if llm is None:
+                factory = self.backend or self.llm_factory
+                llm = factory(model, temperature, max_tokens)
+                self._llms[key] = llm
+            return llm
+
+    def get_chain(self, model, temperature=0, max_tokens=2000):
+        key = (model, float(temperature), max_tokens)
+        with self._lock:
+            chain = self._chains.get(key)
+        if chain is not None:
+            return chain
+        if self.backend is not None:
+            # backends answer predict()/apredict() themselves, no langchain chain needed
+            chain = self.get_llm(model, temperature, max_tokens)
+            with self._lock:
+                return self._chains.setdefault(key, chain)
+        prompt = self.prompt()
+        llm = self.get_llm(model, temperature, max_tokens)
+        from langchain import LLMChain
+        with self._lock:
+            chain = self._chains.get(key)
+            if chain is None:
+                chain = LLMChain(prompt=prompt, llm=llm, verbose=False)
+                self._chains[key] = chain
+            return chain
+
+    def set_llm_factory(self, llm_factory):
+        """
+        Swap the backend (e.g. a stub for benchmarks). Already pooled clients are closed and dropped
+        """
+        self.clear()
+        with self._lock:
+            self.llm_factory = llm_factory or default_llm_factory
+
+    def set_backend(self, backend):
+        """
+        Serve every key from backend(model, temperature, max_tokens) instead of langchain.
+        The returned object needs predict(question=...), apredict(question=...) and stream(text).
+        Pass None to go back to the real clients.
+        """
+        self.clear()
+        with self._lock:
+            self.backend = backend
+
+    def clear(self):
+        with self._lock:
+            llms = list(self._llms.values())
+            self._llms.clear()
+            self._chains.clear()
+        for llm in llms:
+            _close_llm(llm)
+
+    def shutdown(self):
+        """
+        Close every pooled client. Later get_* calls raise until a new pool is created
+        """
+        self.clear()
+        with self._lock:
+            self._closed = True
+
+    def __len__(self):
+        with self._lock:
+            return len(self._chains)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """
+    Return the process-wide pool, creating it on first use
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None or _pool._closed:
+            _pool = LLMPool()
+        return _pool
+
+
+def shutdown_pool():
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown()
+
+
+atexit.register(shutdown_pool)
@@ -1,12 +1,28 @@
 import streamlit as st
-import base64
-import pandas as pd
-import search_strat as ss
-import json
+import lazy
+import tracing
+import importers
+import hashlib
+import os
+import time
+import uuid
+import jobs
+import prompt_cache
 
-openai_api_key = st.secrets["OPENAI_API_KEY"]
-pinecone_api_key = st.secrets["PINECONE_API_KEY"]
-index_name = st.secrets["PINECONE_INDEX_NAME"]
+# Stage modules (and pandas, numpy and the LLM stack behind them) load on first use, so the
+# sidebar renders without paying for stages the user never opens
+pd = lazy.lazy_import("pandas")
+ss = lazy.lazy_import("search_strat")
+vector_index = lazy.lazy_import("vector_index")
+screening = lazy.lazy_import("screening")
+record_dedupe = lazy.lazy_import("record_dedupe")
+literature_search = lazy.lazy_import("literature_search")
+pdf_store = lazy.lazy_import("pdf_store")
+fulltext_screening = lazy.lazy_import("fulltext_screening")
+risk_of_bias = lazy.lazy_import("risk_of_bias")
+summarizer = lazy.lazy_import("summarizer")
+report = lazy.lazy_import("report")
+exports = lazy.lazy_import("exports")
 
 # Main app function
 def main():
@@ -51,24 +67,35 @@ def main():
     elif feature == "Report Generation":
         report_generation()
 
-def download_link(object_to_download, download_filename, download_link_text):
+def export_panel(key, make_rows, columns, file_stem, title, total=None):
     """
-    Generates a link to download the given object_to_download.
+    Write make_rows() to an export file when asked and offer it for download; the file is
+    streamed to disk page by page instead of being built up in the page
     """
-    if isinstance(object_to_download, pd.DataFrame):
-        object_to_download = object_to_download.to_csv(index=False)
+    fmt_label = st.selectbox("Export format", list(exports.FORMATS), key=f"{key}_format")
+    compress = st.checkbox("gzip", value=False, key=f"{key}_gzip", disabled=exports.FORMATS[fmt_label] == "docx")
+    if st.button("Prepare export", key=f"{key}_prepare"):
+        progress = st.progress(0.0, text="Writing export...")
+        try:
+            st.session_state[key] = exports.export_rows(
+                make_rows(), exports.FORMATS[fmt_label], columns=columns, compress=compress, title=title,
+                on_progress=lambda count: progress.progress(min(1.0, count / total) if total else 0.0, text=f"Wrote {count} rows"),
+            )
+        except (ImportError, ValueError) as error:
+            st.error(f"Could not export: {error}")
+            return
+        progress.progress(1.0, text="Export ready")
+    export = st.session_state.get(key)
+    if export is not None and os.path.exists(export.path):
+        with export.open() as f:
+            st.download_button(
+                f"Download {export.rows} rows ({export.size / 1e6:.1f} MB)", f,
+                file_name=export.file_name(file_stem), mime=export.mime, key=f"{key}_download",
+            )
 
-    # Some strings <-> bytes conversions necessary here
-    b64 = base64.b64encode(object_to_download.encode()).decode()
-
-    return f'<a href="data:file/txt;base64,{b64}" download="{download_filename}">{download_link_text}</a>'
-
-import json
 
 def load_persona_dict():
-    with open('perssonadict.json', 'r') as f:
-        persona_dict = json.load(f)
-    return persona_dict
+    return ss.load_persona_dict()
 
 def search_strategy_generation():
     st.markdown("## Generate Search Strategy")
@@ -77,47 +104,285 @@ def search_strategy_generation():
         if user_input:
             with st.spinner("Generating enhanced research questions..."):
                 persona_dict = load_persona_dict()
-                questions = ss.develop_new_questions(user_input, persona_dict)
-                st.write(questions)
+                sample = ss.sample_new_questions(
+                    user_input,
+                    persona_dict,
+                    target=5,
+                    max_attempts=10,
+                    max_concurrency=5,
+                    similarity_threshold=0.92,
+                    )
+                questions = sample.questions
                 question_list = []
                 for q in questions:
-                    text = question_list.append(ss.get_new_question_rationale(q))
-                    st.write(text)
+                    question_list.append(ss.get_new_question_rationale(q))
+                st.session_state["question_list"] = question_list
                 st.success("Research questions generated!")
-            st.markdown("**Enhanced Research Questions**")
-            options = []
-            rationale = []
-            for i in range(len(question_list)):
-                options.append(f"**Question {i+1}:** {question_list[i][0]}")
-                rationale.append(f"**Rationale {i+1}:** {question_list[i][1]}")
-            
-            st.radio(label="Select a question", options=options, index=1)
+                st.caption(f"{sample.calls} generation calls ({sample.saved_calls} saved); {sample.duplicates} duplicates, {sample.malformed} malformed")
+                cache_stats = ss.prompt_cache.get_cache().stats()
+                st.caption(f"Prompt cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses, {cache_stats['entries']} stored completions")
+        else:
+            st.error("Please enter a research question.")
+
+    question_list = st.session_state.get("question_list")
+    if question_list:
+        st.markdown("**Enhanced Research Questions**")
+        options = []
+        rationale = []
+        for i in range(len(question_list)):
+            options.append(f"**Question {i+1}:** {question_list[i][0]}")
+            rationale.append(f"**Rationale {i+1}:** {question_list[i][1]}")
+
+        choice = st.radio(label="Select a question", options=range(len(options)), format_func=lambda i: options[i])
+        st.markdown(rationale[choice])
+
+        background = st.checkbox("Run in the background", value=True, help="Keeps running if you use other widgets or leave the page")
+        show_waterfall = st.checkbox("Show timing waterfall", disabled=background)
+        if st.button("Build Search Strategy"):
+            if background:
+                track_job("strategy_job", jobs.get_queue().submit("strategy", {"question": question_list[choice][0]}, owner=session_owner()))
+            else:
+                build_search_strategy(question_list[choice][0], show_waterfall)
+
+    strategy_job_panel()
 
 
-            
-            st.write(questions)
+def session_owner():
+    """
+    Id that groups one browser session's background jobs
+    """
+    if "owner" not in st.session_state:
+        st.session_state["owner"] = uuid.uuid4().hex
+    return st.session_state["owner"]
+
+
+def track_job(key, job_id):
+    """
+    Remember a background job in the session and in the URL, so a reload finds it again
+    """
+    st.session_state[key] = job_id
+    st.query_params[key] = job_id
 
 
+def job_panel(key, title):
+    """
+    Status, progress and a cancel button for the job tracked under key; returns the job
+    """
+    job_id = st.session_state.get(key) or st.query_params.get(key)
+    if not job_id:
+        return None
+    queue = jobs.get_queue()
+    job = queue.get(job_id)
+    if job is None:
+        return None
+    st.markdown(f"**{title}:** {job['status']}")
+    if job["status"] in jobs.ACTIVE_STATUSES:
+        st.progress(job["progress"] or 0.0, text=job["message"] or "Waiting for a worker...")
+        if st.button("Cancel", key=f"cancel-{job_id}"):
+            queue.cancel(job_id)
+    elif job["status"] == "failed":
+        st.error(job["error"])
+    elif job["status"] == "cancelled":
+        st.warning("The job was cancelled.")
+    return job
+
+
+def poll_job(job, interval=1.0):
+    """
+    Rerun the page shortly while the job is still queued or running
+    """
+    if job is not None and job["status"] in jobs.ACTIVE_STATUSES:
+        time.sleep(interval)
+        st.rerun()
+
+
+def strategy_job_panel():
+    job = job_panel("strategy_job", "Search strategy")
+    if job is None:
+        return
+    for event in jobs.get_queue().events(job["id"]):
+        if event["kind"] == "stage":
+            st.markdown(f"**{event['data']['label']}** ({event['data']['seconds']:.1f}s)")
+            st.write(event["data"]["value"])
+    if job["status"] == "done":
+        result = job["result"]
+        st.session_state["strategy"] = result["strategy"]
+        for database, error in result["failures"].items():
+            st.warning(f"Could not generate a search strategy for {database}: {error}")
+        st.caption(
+            f"Finished in {result['wall_time']:.1f}s. "
+            f"Critical path ({' -> '.join(result['critical_path'])}): {result['critical_path_time']:.1f}s"
+        )
+        totals = job["usage"]["totals"]
+        st.markdown(
+            f"**Token usage:** {totals['prompt_tokens']} prompt + {totals['completion_tokens']} completion tokens "
+            f"over {totals['calls']} calls (${totals['cost']:.4f})"
+        )
+        st.dataframe(pd.DataFrame(job["usage"]["by_stage"]))
+    poll_job(job)
+
+
+def build_search_strategy(new_question, show_waterfall=False):
+    """
+    Run the strategy pipeline for the chosen question, showing each stage as soon as it finishes
+    """
+    persona_dict = load_persona_dict()
+    sink = tracing.MemorySink() if show_waterfall else None
+    if sink is not None:
+        tracing.add_sink(sink)
+    placeholders = {}
+    streamed_text = {}
+
+    def show_token(stage, token):
+        if stage.name not in placeholders:
+            st.markdown(f"**{stage.label}**")
+            placeholders[stage.name] = st.empty()
+            streamed_text[stage.name] = ""
+        streamed_text[stage.name] += token
+        placeholders[stage.name].markdown(streamed_text[stage.name] + "▌")
+
+    def show_stage(stage, value, seconds):
+        if stage.name in placeholders:
+            placeholders[stage.name].write(value)
+            st.caption(f"{stage.label}: {seconds:.1f}s")
         else:
-            st.error("Please enter a research question.")
+            st.markdown(f"**{stage.label}** ({seconds:.1f}s)")
+            st.write(value)
+
+    try:
+        with st.spinner("Building search strategy..."), ss.token_budget.track_run() as ledger, tracing.span("strategy_run") as root:
+            run = ss.build_search_strategy(new_question, persona_dict, on_result=show_stage, on_token=show_token)
+    finally:
+        if sink is not None:
+            tracing.remove_sink(sink)
+    st.session_state["strategy"] = ss.strategy_summary(run.results)
+    for database, error in run.results["database_strategies"].failures.items():
+        st.warning(f"Could not generate a search strategy for {database}: {error}")
+    st.caption(
+        f"Finished in {run.wall_time:.1f}s. "
+        f"Critical path ({' -> '.join(run.critical_path)}): {run.critical_path_time:.1f}s"
+    )
+    totals = ledger.totals()
+    st.markdown(
+        f"**Token usage:** {totals['prompt_tokens']} prompt + {totals['completion_tokens']} completion tokens "
+        f"over {totals['calls']} calls (${totals['cost']:.4f})"
+    )
+    st.dataframe(pd.DataFrame(ledger.by_stage()))
+    if sink is not None:
+        render_waterfall(sink.trace(root.trace_id))
+
+
+def render_waterfall(spans):
+    """
+    Gantt-style chart of every traced span in a run, offset from the first span's start
+    """
+    import altair as alt
+
+    if not spans:
+        return
+    df = pd.DataFrame(spans)
+    origin = df["start"].min()
+    df["start_s"] = df["start"] - origin
+    df["end_s"] = df["end"] - origin
+    df["queue_time"] = df["attributes"].map(lambda a: a.get("queue_time", 0.0))
+    df["llm_calls"] = df["attributes"].map(lambda a: a.get("llm_calls", 0))
+    df["cache_hits"] = df["attributes"].map(lambda a: a.get("cache_hits", 0))
+    df["retries"] = df["attributes"].map(lambda a: a.get("retries", 0))
+    df = df.sort_values("start_s")
+    df["label"] = [f"{i:02d} {name}" for i, name in enumerate(df["name"])]
+    st.markdown("**Timing waterfall**")
+    chart = alt.Chart(df).mark_bar().encode(
+        x=alt.X("start_s", title="seconds"),
+        x2="end_s",
+        y=alt.Y("label", sort=None, title=None),
+        color="thread",
+        tooltip=["name", "duration", "queue_time", "llm_calls", "cache_hits", "retries"],
+    )
+    st.altair_chart(chart, use_container_width=True)
 
 
 def database_search():
     st.header("Database Search")
     st.write("SynthScope will run the search strategy on a range of academic databases.")
-    databases = st.multiselect("Select databases to search", ["Database 1", "Database 2", "Database 3"])
+    local = literature_search.register_local_corpus()
+    with st.expander("Local search corpus"):
+        st.write("The local corpus stands in for an online database. Add search exports to it to search them offline.")
+        corpus_file = st.file_uploader("Add a search export to the local corpus", type=['txt', 'csv', 'json', 'jsonl', 'ris', 'nbib'], key="corpus_upload")
+        if corpus_file is not None and st.button("Add to corpus"):
+            fmt = importers.detect_format(corpus_file.name)
+            if fmt is None:
+                st.error("Unsupported file type.")
+            else:
+                count = local.corpus.add_all(importers.iter_records(corpus_file, fmt, source=corpus_file.name, total_bytes=corpus_file.size))
+                st.success(f"Added {count} records to the local corpus.")
+
+    strategy = st.session_state.get("strategy", {})
+    query = st.text_area("Search query", value=strategy.get("Pubmed Query", ""))
+    databases = st.multiselect("Select databases to search", literature_search.adapter_names(), default=[local.name])
+    page_size = st.number_input("Records per page", min_value=10, max_value=1000, value=200, step=10)
+    max_results = st.number_input("Maximum records per database (0 for all)", min_value=0, value=0, step=100)
     if st.button("Run Database Search"):
-        # Call your backend function here to run the database search
-        pass
+        if not query or not databases:
+            st.error("Please enter a search query and select at least one database.")
+            return
+        try:
+            literature_search.parse_query(query)
+        except ValueError as error:
+            st.error(str(error))
+            return
+
+        progress = st.progress(0.0, text="Searching...")
+
+        def report(source, fetched, total):
+            expected = run.expected()
+            done = sum(run.counts.values())
+            progress.progress(min(1.0, done / expected) if expected else 1.0, text=f"Retrieved {done} of {expected} records")
+
+        run = literature_search.SearchRun(
+            [(literature_search.get_adapter(name), query) for name in databases],
+            page_size=int(page_size),
+            max_results=int(max_results) or None,
+            max_workers=len(databases),
+            on_page=report,
+        )
+        store = importers.RecordStore()
+        count = store.add_all(run)
+        progress.progress(1.0, text=f"Retrieved {count} records")
+        replace_record_store(store, ("search", query, tuple(databases)))
+        st.dataframe(
+            pd.DataFrame(
+                [{"Database": name, "Matches": run.totals.get(name), "Retrieved": run.counts.get(name, 0)} for name in databases]
+            ),
+            use_container_width=True,
+        )
+        for name, error in run.failures.items():
+            st.warning(f"Search failed for {name}: {error}")
+
+    store_key = st.session_state.get("record_store_key")
+    if store_key and store_key[0] == "search":
+        st.write(f"{len(st.session_state['record_store'])} records from the last search are ready for title and abstract screening.")
+        preview_records(st.session_state["record_store"])
 
 
 def title_abstract_screening():
     st.header("Title and Abstract Screening")
     st.write("SynthScope will screen the titles and abstracts of the results for if they meet the search strategy criteria and creates a file of articles that met criteria.")
-    if st.button("Start Title and Abstract Screening"):
-        # Call your backend function here to perform title and abstract screening
-        pass
-        uploaded_file = st.file_uploader("Choose a file to upload", type=['txt', 'csv', 'json'])
+    uploaded_file = st.file_uploader("Choose a file to upload", type=['txt', 'csv', 'json', 'jsonl', 'ris', 'nbib'])
+    strategy = st.session_state.get("strategy", {})
+    criteria = st.text_area(
+        "Screening criteria",
+        value=vector_index.criteria_text(
+            strategy.get("Population Statement"),
+            strategy.get("Inclusion and Exclusion Criteria"),
+            strategy.get("New Question"),
+        ),
+    )
+    backend = st.radio("Vector index", ["Local", "Pinecone"], horizontal=True)
+    shortlist_size = st.number_input("Shortlist size", min_value=10, value=200, step=10)
+    batch_size = st.number_input("Records per prompt", min_value=1, max_value=30, value=10)
+    max_workers = st.number_input("Concurrent requests", min_value=1, max_value=32, value=4)
+    rate_per_minute = st.number_input("Requests per minute", min_value=1, value=60)
+    background = st.checkbox("Screen in the background", value=True, key="screening_background")
 
     if uploaded_file is not None:
         file_details = {
@@ -126,49 +391,539 @@ def title_abstract_screening():
             "file_size": uploaded_file.size
         }
         st.write(file_details)
+        store = import_records(uploaded_file)
+    else:
+        store = st.session_state.get("record_store")
+        if store is not None:
+            st.caption("Using the records from the last import or database search.")
+    if store is not None:
+        if st.checkbox("Remove duplicate records", value=True):
+            store = dedupe_records(store)
+        preview_records(store)
+
+    if st.button("Start Title and Abstract Screening"):
+        if store is None or not criteria:
+            st.error("Please upload a file and enter the screening criteria.")
+            return
+
+        if backend == "Pinecone":
+            # one namespace per record set, so the shared index never shortlists ids from another upload
+            records_key = st.session_state.get("record_store_key")
+            if store is st.session_state.get("deduped_store"):
+                records_key = ("deduped", records_key)
+            index = vector_index.PineconeIndex(lazy.secret("PINECONE_INDEX_NAME"), lazy.secret("PINECONE_API_KEY"),
+                                               namespace=vector_index.namespace_for(records_key))
+        else:
+            index = vector_index.LocalIndex()
+        progress = st.progress(0.0, text="Embedding records...")
+        vector_index.index_records(index, store, total=len(store), on_progress=lambda done, total: progress.progress(done / total, text=f"Embedded {done}/{total} records"))
+        ranked = vector_index.shortlist(index, criteria, top_k=int(shortlist_size))
+        shortlisted = store.get_many([item_id for item_id, score, meta in ranked])
+        known = {str(record.id) for record in shortlisted}
+        ranked = [item for item in ranked if str(item[0]) in known]
+        st.session_state["shortlist"] = ranked
+        st.markdown(f"**Shortlisted {len(shortlisted)} of {len(store)} records by similarity to the criteria**")
+        checkpoint = screening.checkpoint_path(criteria, st.session_state.get("record_store_key"))
+        if background:
+            params = {
+                "records": [record.to_dict() for record in shortlisted],
+                "criteria": criteria,
+                "batch_size": int(batch_size),
+                "max_workers": int(max_workers),
+                "rate_per_minute": int(rate_per_minute),
+                "checkpoint": checkpoint,
+            }
+            track_job("screening_job", jobs.get_queue().submit("screening", params, owner=session_owner()))
+        else:
+            screen_now(shortlisted, criteria, ranked, int(batch_size), int(max_workers), int(rate_per_minute), checkpoint)
+
+    screening_job_panel()
+    decisions = st.session_state.get("screening_decisions")
+    if store is not None and decisions:
+        st.subheader("Export screening results")
+        scores = {item_id: score for item_id, score, meta in st.session_state.get("shortlist", [])}
+        export_panel(
+            "screening_export", lambda: exports.screening_rows(store, decisions, scores), exports.SCREENING_COLUMNS,
+            "screening_results", "Title and abstract screening results", total=len(decisions),
+        )
+
+
+def screen_now(shortlisted, criteria, ranked, batch_size, max_workers, rate_per_minute, checkpoint):
+    """
+    Screen the shortlist in the page's own thread, showing progress as batches finish
+    """
+    persona_dict = load_persona_dict()
+    screen_progress = st.progress(0.0, text="Screening shortlisted records...")
+
+    def report(screened, resumed):
+        done = screened + resumed
+        screen_progress.progress(min(1.0, done / max(1, len(shortlisted))), text=f"Screened {done}/{len(shortlisted)} records")
+
+    result = screening.screen_records(
+        shortlisted,
+        criteria,
+        persona_dict,
+        batch_size=batch_size,
+        max_workers=max_workers,
+        rate_per_minute=rate_per_minute,
+        checkpoint=checkpoint,
+        on_progress=report,
+    )
+    st.session_state["screening_decisions"] = result.decisions
+    counts = result.counts()
+    st.success(
+        f"Screened {result.screened} records ({result.resumed} resumed from checkpoint) "
+        f"at {result.records_per_minute:.0f} records/minute: "
+        f"{counts['INCLUDE']} included, {counts['EXCLUDE']} excluded, {counts['UNSURE']} unsure"
+    )
+    if result.failed_batches:
+        st.warning(f"{result.failed_batches} batches failed and will be retried on the next run.")
+    scores = {item_id: score for item_id, score, meta in ranked}
+    st.dataframe(pd.DataFrame([dict(row, score=scores.get(row["id"])) for row in result.decisions.values()]))
+
 
-        # Read the file content
-        file_content = uploaded_file.getvalue().decode("utf-8")
-        st.write(file_content)
+def screening_job_panel():
+    job = job_panel("screening_job", "Title and abstract screening")
+    if job is None:
+        return
+    scores = {item_id: score for item_id, score, meta in st.session_state.get("shortlist", [])}
+    if job["status"] == "done":
+        result = job["result"]
+        decisions = result["decisions"]
+        st.session_state["screening_decisions"] = decisions
+        counts = result["counts"]
+        st.success(
+            f"Screened {result['screened']} records ({result['resumed']} resumed from checkpoint) "
+            f"at {result['records_per_minute']:.0f} records/minute: "
+            f"{counts['INCLUDE']} included, {counts['EXCLUDE']} excluded, {counts['UNSURE']} unsure"
+        )
+        if result["failed_batches"]:
+            st.warning(f"{result['failed_batches']} batches failed and will be retried on the next run.")
+    else:
+        # decisions reach the checkpoint file batch by batch, so show what is there so far
+        decisions = screening.load_checkpoint(job["params"].get("checkpoint"))
+    if decisions:
+        st.dataframe(pd.DataFrame([dict(row, score=scores.get(row["id"])) for row in decisions.values()]))
+    poll_job(job)
+
+
+def upload_sha256(uploaded_file, block_size=1 << 20):
+    uploaded_file.seek(0)
+    digest = hashlib.sha256()
+    for block in iter(lambda: uploaded_file.read(block_size), b""):
+        digest.update(block)
+    uploaded_file.seek(0)
+    return digest.hexdigest()
+
+
+def import_records(uploaded_file):
+    """
+    Stream the uploaded export into a RecordStore once per upload and keep it in the session.
+    Uploads are told apart by content, so a different file with the same name and size is re-imported
+    """
+    fmt = importers.detect_format(uploaded_file.name)
+    if fmt is None:
+        st.error("Unsupported file type.")
+        return None
+    upload_key = ("upload", uploaded_file.name, upload_sha256(uploaded_file))
+    if st.session_state.get("record_store_key") == upload_key:
+        return st.session_state["record_store"]
+
+    progress = st.progress(0.0, text="Importing records...")
+
+    def report(bytes_read, total_bytes):
+        if total_bytes:
+            progress.progress(min(1.0, bytes_read / total_bytes), text=f"Imported {bytes_read / 1e6:.1f} of {total_bytes / 1e6:.1f} MB")
+
+    store = importers.RecordStore()
+    uploaded_file.seek(0)
+    count = store.add_all(importers.iter_records(uploaded_file, fmt, source=uploaded_file.name, total_bytes=uploaded_file.size, on_progress=report))
+    progress.progress(1.0, text=f"Imported {count} records")
+    replace_record_store(store, upload_key)
+    return store
+
+
+def replace_record_store(store, key):
+    """
+    Make store the session's records, closing the imported and deduplicated stores it replaces
+    """
+    for name in ("record_store", "deduped_store"):
+        old = st.session_state.pop(name, None)
+        if old is not None:
+            old.close()
+    st.session_state.pop("dedupe_key", None)
+    st.session_state["record_store"] = store
+    st.session_state["record_store_key"] = key
+
+
+def dedupe_records(store):
+    """
+    Deduplicate the session's RecordStore once per upload into a second store and show the merge report.
+    The imported store stays open, so unticking the option brings the duplicates back
+    """
+    if st.session_state.get("dedupe_key") != st.session_state.get("record_store_key"):
+        with st.spinner("Finding duplicate records..."):
+            result = record_dedupe.find_duplicates(store)
+        deduped = importers.RecordStore()
+        deduped.add_all(result.unique)
+        old = st.session_state.pop("deduped_store", None)
+        if old is not None:
+            old.close()
+        st.session_state["deduped_store"] = deduped
+        st.session_state["dedupe_report"] = result.report
+        st.session_state["dedupe_key"] = st.session_state.get("record_store_key")
+    report = st.session_state.get("dedupe_report", [])
+    store = st.session_state["deduped_store"]
+    st.markdown(f"**Removed {len(report)} duplicate records; {len(store)} unique records remain**")
+    if report:
+        with st.expander("Merge report"):
+            st.dataframe(pd.DataFrame(report), use_container_width=True)
+    return store
+
+
+def preview_records(store, page_size=50):
+    """
+    Show one page of imported records at a time instead of the whole file
+    """
+    pages = max(1, -(-len(store) // page_size))
+    page = st.number_input(f"Preview page (of {pages})", min_value=1, max_value=pages, value=1)
+    st.dataframe(pd.DataFrame([record.to_dict() for record in store.page(page - 1, page_size)]))
 
 
 def full_text_pdf_retrieval():
     st.header("Full Text PDF Retrieval")
     st.write("SynthScope will pull the full text pdf files for the papers that passed the first screening. You can pull the articles from the database search or upload a ris file")
+    st.caption("Name each PDF after its record id to link it to the screening decisions.")
+    uploaded_pdfs = st.file_uploader("Upload full text PDFs", type=["pdf"], accept_multiple_files=True)
     if st.button("Retrieve Full Text PDFs"):
-        # Call your backend function here to retrieve full text PDFs
-        pass
+        store = get_pdf_store()
+        for uploaded_pdf in uploaded_pdfs or []:
+            store.add(uploaded_pdf.getvalue(), uploaded_pdf.name, record_id=os.path.splitext(uploaded_pdf.name)[0])
+        pending = len(store.pending())
+        if pending:
+            progress = st.progress(0.0, text=f"Extracting text from {pending} new PDFs...")
+            failures = store.extract_pending(on_progress=lambda done, total: progress.progress(done / total, text=f"Extracted {done}/{total} PDFs"))
+            for sha, error in failures.items():
+                st.warning(f"Could not extract text from {sha[:12]}: {error}")
+        st.success(f"{len(store)} PDFs in the full text store ({pending} newly extracted).")
+
+    if "pdf_store" in st.session_state:
+        included = {
+            item_id for item_id, decision in st.session_state.get("screening_decisions", {}).items()
+            if decision.get("decision") in ("INCLUDE", "UNSURE")
+        }
+        documents = pd.DataFrame(st.session_state["pdf_store"].documents())
+        if included and not documents.empty:
+            documents["passed screening"] = documents["record_id"].isin(included)
+        st.dataframe(documents, use_container_width=True)
+
+
+def get_pdf_store():
+    """
+    One PDFStore per session; the files and extracted text persist on disk between sessions
+    """
+    if "pdf_store" not in st.session_state:
+        st.session_state["pdf_store"] = pdf_store.PDFStore()
+    return st.session_state["pdf_store"]
+
+
+def get_rob_cache():
+    """
+    Judgements persist on disk, so only papers new since the last run are assessed
+    """
+    if "rob_cache" not in st.session_state:
+        st.session_state["rob_cache"] = risk_of_bias.JudgementCache()
+    return st.session_state["rob_cache"]
+
+
+def get_summary_cache():
+    """
+    Map and reduce summaries persist on disk keyed by their inputs, so re-runs only fill in new nodes
+    """
+    if "summary_cache" not in st.session_state:
+        st.session_state["summary_cache"] = prompt_cache.PromptCache(summarizer.DEFAULT_CACHE_PATH, max_entries=None)
+    return st.session_state["summary_cache"]
 
 
 def full_text_screening():
     st.header("Full Text Screening")
     st.write("SynthScope will complete a screening of the full text of the papers and determines which ones meet the criteria.")
+    strategy = st.session_state.get("strategy", {})
+    criteria = st.text_area("Inclusion and exclusion criteria", value=strategy.get("Inclusion and Exclusion Criteria", ""))
+    top_k = st.number_input("Passages per criterion", min_value=1, max_value=10, value=2)
+    max_passages = st.number_input("Passages per paper", min_value=1, max_value=40, value=8)
+    max_workers = st.number_input("Concurrent requests", min_value=1, max_value=32, value=4, key="fulltext_workers")
+    background = st.checkbox("Screen in the background", value=True, key="fulltext_background")
     if st.button("Start Full Text Screening"):
-        # Call your backend function here to perform full text screening
-        pass
+        store = get_pdf_store()
+        included = {
+            item_id for item_id, decision in st.session_state.get("screening_decisions", {}).items()
+            if decision.get("decision") in ("INCLUDE", "UNSURE")
+        }
+        papers = [
+            (document["record_id"], document["sha"]) for document in store.documents()
+            if document["chunks"] and (not included or document["record_id"] in included)
+        ]
+        if not papers or not criteria:
+            st.error("Please retrieve the full text PDFs and enter the inclusion and exclusion criteria.")
+            return
+        if background:
+            params = {
+                "papers": papers,
+                "criteria": criteria,
+                "top_k": int(top_k),
+                "max_passages": int(max_passages),
+                "max_workers": int(max_workers),
+                "store_root": store.root,
+            }
+            track_job("fulltext_job", jobs.get_queue().submit("fulltext", params, owner=session_owner()))
+        else:
+            progress = st.progress(0.0, text="Screening full texts...")
+            result = fulltext_screening.screen_papers(
+                store,
+                papers,
+                criteria,
+                load_persona_dict(),
+                top_k=int(top_k),
+                max_passages=int(max_passages),
+                max_workers=int(max_workers),
+                on_progress=lambda done, total: progress.progress(done / total, text=f"Screened {done}/{total} papers"),
+            )
+            st.session_state["fulltext_decisions"] = result.rows
+            show_fulltext_results(result)
+
+    fulltext_job_panel()
+
+
+def fulltext_job_panel():
+    job = job_panel("fulltext_job", "Full text screening")
+    if job is None:
+        return
+    if job["status"] == "done":
+        rows = job["result"]["rows"]
+        st.session_state["fulltext_decisions"] = rows
+        show_fulltext_results(fulltext_screening.FullTextResult(rows, job["result"]["failures"], 0.0))
+    poll_job(job)
+
+
+def show_fulltext_results(result):
+    counts = result.counts()
+    st.success(f"{counts['INCLUDE']} included, {counts['EXCLUDE']} excluded, {counts['UNSURE']} unsure")
+    st.caption(
+        f"Prompts used {result.prompt_tokens} tokens instead of {result.full_text_tokens} for the full texts "
+        f"({result.token_reduction:.1f}x fewer)"
+    )
+    for record_id, error in result.failures.items():
+        st.warning(f"Could not screen {record_id}: {error}")
+    st.dataframe(pd.DataFrame([
+        {"id": row["id"], "decision": row["decision"], "reason": row["reason"], "passages": row["passages"], "prompt tokens": row["prompt_tokens"]}
+        for row in result.rows.values()
+    ]))
+    for row in result.rows.values():
+        with st.expander(f"{row['id']}: {row['decision']}"):
+            for judgement in row["criteria"]:
+                cited = ", ".join(f"{citation['section']} #{citation['chunk']}" for citation in judgement["citations"])
+                st.markdown(f"**{judgement['status']}** ({judgement['kind']}) {judgement['criterion']}  \n{judgement['reason']} _[{cited}]_")
+
+
+def included_papers(store):
+    """
+    [(record_id, sha)] for extracted papers that full-text screening included (or all of them before it has run)
+    """
+    included = {
+        row["id"] for row in st.session_state.get("fulltext_decisions", {}).values() if row["decision"] in ("INCLUDE", "UNSURE")
+    }
+    papers = []
+    for document in store.documents():
+        record_id = document["record_id"] or document["sha"][:12]
+        if document["chunks"] and (not included or record_id in included):
+            papers.append((record_id, document["sha"]))
+    return papers
 
 
 def risk_of_bias_screening():
     st.header("Risk of Bias Screening")
     st.write("SynthScope will screen the included papers against the cochrane risk of bias tool and create a risk of bias table, risk of bias graph, and risk of biassummary.")
+    max_passages = st.number_input("Passages per paper", min_value=1, max_value=40, value=10, key="rob_passages")
+    max_workers = st.number_input("Concurrent requests", min_value=1, max_value=32, value=4, key="rob_workers")
+    background = st.checkbox("Assess in the background", value=True, key="rob_background")
     if st.button("Start Risk of Bias Screening"):
-    # Call your backend function here to perform risk of bias screening
-        pass
+        store = get_pdf_store()
+        papers = included_papers(store)
+        if not papers:
+            st.error("Please retrieve and screen the full text PDFs first.")
+            return
+        if background:
+            params = {
+                "papers": papers,
+                "max_passages": int(max_passages),
+                "max_workers": int(max_workers),
+                "store_root": store.root,
+                "cache_path": get_rob_cache().path,
+            }
+            track_job("rob_job", jobs.get_queue().submit("risk_of_bias", params, owner=session_owner()))
+        else:
+            progress = st.progress(0.0, text="Assessing risk of bias...")
+            result = risk_of_bias.assess_papers(
+                store,
+                papers,
+                load_persona_dict(),
+                max_passages=int(max_passages),
+                max_workers=int(max_workers),
+                cache=get_rob_cache(),
+                on_progress=lambda done, total: progress.progress(done / total, text=f"Assessed {done}/{total} papers"),
+            )
+            progress.progress(1.0, text="Risk of bias assessment complete")
+            st.session_state["rob_rows"] = result.rows
+            st.success(f"Assessed {result.assessed} papers, {result.cached} from earlier runs")
+            for record_id, error in result.failures.items():
+                st.warning(f"Could not assess {record_id}: {error}")
+
+    rob_job_panel()
+    rows = st.session_state.get("rob_rows")
+    if rows:
+        table = risk_of_bias.traffic_light_table(rows.values())
+        st.subheader("Risk of bias table")
+        st.dataframe(risk_of_bias.style_traffic_lights(table))
+        st.subheader("Risk of bias graph")
+        summary = risk_of_bias.summary_table(table)
+        st.bar_chart(summary, horizontal=True, color=[risk_of_bias.LEVEL_COLOURS[level] for level in summary.columns])
+        st.subheader("Risk of bias summary")
+        for row in rows.values():
+            with st.expander(row["id"]):
+                for domain in row["domains"]:
+                    cited = ", ".join(f"{citation['section']} #{citation['chunk']}" for citation in domain["citations"])
+                    st.markdown(f"**{domain['judgement']}** {domain['domain']} {domain['name']}  \n{domain['reason']} _[{cited}]_")
+
+def rob_job_panel():
+    job = job_panel("rob_job", "Risk of bias assessment")
+    if job is None:
+        return
+    if job["status"] == "done":
+        result = job["result"]
+        st.session_state["rob_rows"] = result["rows"]
+        st.success(f"Assessed {result['assessed']} papers, {result['cached']} from earlier runs")
+        for record_id, error in result["failures"].items():
+            st.warning(f"Could not assess {record_id}: {error}")
+    poll_job(job)
 
 def summary_generation():
     st.header("Summary Generation")
     st.write("SynthScope will summarize the full text papers that met criteria and return this summary of the articles that met criteria to the user.")
+    strategy = st.session_state.get("strategy", {})
+    question = st.text_input("Review question", value=strategy.get("New Question") or "")
+    fan_in = st.number_input("Summaries combined per step", min_value=2, max_value=12, value=6)
+    max_workers = st.number_input("Concurrent requests", min_value=1, max_value=32, value=4, key="summary_workers")
+    background = st.checkbox("Summarise in the background", value=True, key="summary_background")
     if st.button("Generate Summary"):
-    # Call your backend function here to generate the summary
-        pass
+        store = get_pdf_store()
+        papers = included_papers(store)
+        if not papers or not question:
+            st.error("Please retrieve and screen the full text PDFs and enter the review question.")
+            return
+        if background:
+            params = {
+                "papers": papers,
+                "question": question,
+                "fan_in": int(fan_in),
+                "max_workers": int(max_workers),
+                "store_root": store.root,
+                "cache_path": summarizer.DEFAULT_CACHE_PATH,
+            }
+            track_job("summary_job", jobs.get_queue().submit("summary", params, owner=session_owner()))
+        else:
+            progress = st.progress(0.0, text="Summarising studies...")
+            try:
+                result = summarizer.summarize_studies(
+                    store,
+                    papers,
+                    question,
+                    load_persona_dict(),
+                    fan_in=int(fan_in),
+                    max_workers=int(max_workers),
+                    cache=get_summary_cache(),
+                    on_progress=lambda level, done, total: progress.progress(
+                        done / total, text=f"{'Summarised' if level == 0 else f'Combined (level {level})'} {done}/{total}"
+                    ),
+                )
+            except RuntimeError as error:
+                # a failed reduce step; the summaries finished so far are cached for the next run
+                st.error(f"Could not combine the study summaries: {error}")
+                return
+            progress.progress(1.0, text="Summary complete")
+            st.session_state["summary"] = result
+            for record_id, error in result.failures.items():
+                st.warning(f"Could not summarise {record_id}: {error}")
+
+    summary_job_panel()
+    result = st.session_state.get("summary")
+    if result is not None:
+        st.subheader("Summary of included studies")
+        st.write(result.summary)
+        totals = result.totals()
+        st.caption(f"{totals['computed']} of {totals['nodes']} summaries generated, the rest reused from earlier runs")
+        st.dataframe(pd.DataFrame(result.levels))
+        with st.expander("Per-study summaries"):
+            for record_id, text in result.studies.items():
+                st.markdown(text)
+
+def summary_job_panel():
+    job = job_panel("summary_job", "Summary")
+    if job is None:
+        return
+    if job["status"] == "done":
+        result = job["result"]
+        st.session_state["summary"] = summarizer.SummaryResult(
+            result["summary"], result["studies"], result["levels"], result["failures"], result["elapsed"],
+        )
+        for record_id, error in result["failures"].items():
+            st.warning(f"Could not summarise {record_id}: {error}")
+    poll_job(job)
 
 def report_generation():
     st.header("Report Generation")
     st.write("SynthScope will create a full literature review report on the above process including introduction, methods, results, discussion, and conclusion.")
     report_format = st.selectbox("Choose report format", ["PDF", "Word", "HTML"])
     if st.button("Generate Report"):
-    # Call your backend function here to generate the report
-        pass
+        strategy = st.session_state.get("strategy", {})
+        summary = st.session_state.get("summary")
+        inputs = {
+            "strategy": strategy,
+            "screening": st.session_state.get("screening_decisions", {}),
+            "fulltext": st.session_state.get("fulltext_decisions", {}),
+            "rob": st.session_state.get("rob_rows", {}),
+            "summary": {"summary": summary.summary, "studies": summary.studies} if summary is not None else {},
+        }
+        with st.spinner("Writing report sections..."):
+            sections = report.build_report(inputs, load_persona_dict(), cache=get_report_cache())
+        regenerated = [section["title"] for section in sections if section["regenerated"]]
+        st.caption(f"Regenerated: {', '.join(regenerated)}" if regenerated else "Every section was reused from the last report")
+        title = strategy.get("Document Title") or "Systematic review report"
+        fmt = report.FORMATS[report_format]
+        st.session_state["report_render"] = (report.start_render(str(title).strip(), sections, fmt), fmt)
+
+    render = st.session_state.get("report_render")
+    if render is not None:
+        future, fmt = render
+        if not future.done():
+            st.info("Rendering the report...")
+            time.sleep(1)
+            st.rerun()
+        elif future.exception() is not None:
+            st.error(f"Could not render the report: {future.exception()}")
+        else:
+            path = future.result()
+            with open(path, "rb") as f:
+                st.download_button(f"Download report (.{fmt})", f, file_name=f"synthscope_report.{fmt}")
+
+
+def get_report_cache():
+    """
+    Built sections persist on disk under their input fingerprints, so only changed sections are rebuilt
+    """
+    if "report_cache" not in st.session_state:
+        st.session_state["report_cache"] = prompt_cache.PromptCache(report.DEFAULT_CACHE_PATH, max_entries=None)
+    return st.session_state["report_cache"]
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,300 @@
+"""
+Content-addressed full-text store: PDFs are kept once per SHA-256 under objects/, converted to
+normalised text in a process pool, and split into section chunks whose byte offsets are indexed
+in SQLite. Chunk text is read through memory-mapped files, so screening code can fetch a few
+passages without re-parsing or loading whole documents.
+
+Extraction is incremental: only documents without text for the current EXTRACTOR_VERSION are
+processed, so adding ten PDFs extracts ten PDFs. Requires pypdf.
+"""
+import hashlib
+import mmap
+import os
+import re
+import sqlite3
+import tempfile
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+import prompt_cache
+
+DEFAULT_STORE_DIR = os.path.join(prompt_cache.DEFAULT_CACHE_DIR, "fulltext")
+EXTRACTOR_VERSION = 2
+CHUNK_CHARS = 600
+
+SECTION_HEADING = re.compile(
+    r"^(?:\d+(?:\.\d+)*\.?\s+)?(abstract|summary|background|introduction|methods?|materials and methods|"
+    r"patients and methods|methodology|study design|results|findings|discussion|conclusions?|limitations|"
+    r"references|bibliography|acknowledge?ments?|funding|conflicts? of interest)\s*:?$",
+    re.IGNORECASE,
+)
+
+
+def split_sections(text):
+    """
+    [(section, text)] for normalised text; lines before the first recognised heading are in "front matter"
+    """
+    text = unicodedata.normalize("NFKC", text)
+    text = re.sub(r"(\w)-\n(\w)", r"\1\2", text)
+    sections = []
+    section = "front matter"
+    lines = []
+    for line in text.splitlines():
+        line = " ".join(line.split())
+        if not line:
+            continue
+        heading = SECTION_HEADING.match(line) if len(line) <= 60 else None
+        if heading:
+            if lines:
+                sections.append((section, " ".join(lines)))
+            section = heading.group(1).lower()
+            lines = []
+        else:
+            lines.append(line)
+    if lines:
+        sections.append((section, " ".join(lines)))
+    return sections
+
+
+def chunk_text(text, max_chars=CHUNK_CHARS):
+    """
+    Split text into pieces of at most max_chars, breaking between sentences where possible
+    """
+    chunks = []
+    current = ""
+    for sentence in re.split(r"(?<=[.!?])\s+", text):
+        while len(sentence) > max_chars:
+            if current:
+                chunks.append(current)
+                current = ""
+            chunks.append(sentence[:max_chars])
+            sentence = sentence[max_chars:]
+        if current and len(current) + 1 + len(sentence) > max_chars:
+            chunks.append(current)
+            current = sentence
+        else:
+            current = f"{current} {sentence}" if current else sentence
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def extract_pdf(pdf_path, text_path, max_chunk_chars=CHUNK_CHARS):
+    """
+    Runs in a worker process. Writes the document's chunks to text_path and returns
+    (pages, [(section, start, end)], error) with byte offsets into that file
+    """
+    try:
+        from pypdf import PdfReader
+
+        reader = PdfReader(pdf_path)
+        pages = [page.extract_text() or "" for page in reader.pages]
+        chunks = []
+        offset = 0
+        tmp_path = text_path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            for section, body in split_sections("\n".join(pages)):
+                for piece in chunk_text(body, max_chunk_chars):
+                    data = piece.encode("utf-8")
+                    f.write(data + b"\n\n")
+                    chunks.append((section, offset, offset + len(data)))
+                    offset += len(data) + 2
+        os.replace(tmp_path, text_path)
+        return len(pages), chunks, None
+    except Exception as error:
+        return 0, [], f"{type(error).__name__}: {error}"
+
+
+class Chunk:
+    __slots__ = ("sha", "seq", "section", "text")
+
+    def __init__(self, sha, seq, section, text):
+        self.sha = sha
+        self.seq = seq
+        self.section = section
+        self.text = text
+
+    def __repr__(self):
+        return f"Chunk({self.sha[:8]}#{self.seq}, {self.section!r})"
+
+
+class PDFStore:
+    """
+    On-disk PDF store with a SQLite index of documents and chunk offsets
+    """
+
+    def __init__(self, root=DEFAULT_STORE_DIR, max_open_maps=64):
+        self.root = root
+        os.makedirs(os.path.join(root, "objects"), exist_ok=True)
+        os.makedirs(os.path.join(root, "text"), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(os.path.join(root, "index.sqlite"), check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS documents (sha TEXT PRIMARY KEY, filename TEXT, record_id TEXT, "
+            "size INTEGER, added REAL, pages INTEGER, extractor INTEGER, error TEXT)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS chunks (sha TEXT, seq INTEGER, section TEXT, start INTEGER, end INTEGER, "
+            "PRIMARY KEY (sha, seq))"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS documents_record ON documents (record_id)")
+        self._conn.commit()
+        self._maps = OrderedDict()
+        self.max_open_maps = max_open_maps
+
+    def pdf_path(self, sha):
+        return os.path.join(self.root, "objects", sha[:2], sha + ".pdf")
+
+    def text_path(self, sha):
+        return os.path.join(self.root, "text", sha + ".txt")
+
+    def add(self, data, filename="", record_id=None):
+        """
+        Store PDF bytes (or a file-like object) once by content hash; returns the sha.
+        Re-adding a known document only updates its record_id.
+        """
+        if hasattr(data, "read"):
+            data = data.read()
+        sha = hashlib.sha256(data).hexdigest()
+        path = self.pdf_path(sha)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO documents (sha, filename, record_id, size, added) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT(sha) DO UPDATE SET record_id = COALESCE(excluded.record_id, record_id)",
+                (sha, filename, record_id, len(data), time.time()),
+            )
+            self._conn.commit()
+        return sha
+
+    def add_file(self, path, record_id=None):
+        with open(path, "rb") as f:
+            return self.add(f, os.path.basename(path), record_id)
+
+    def pending(self):
+        """
+        shas of documents not yet extracted with the current extractor version
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT sha FROM documents WHERE extractor IS NULL OR extractor != ? ORDER BY added",
+                (EXTRACTOR_VERSION,),
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def extract_pending(self, max_workers=None, on_progress=None):
+        """
+        Extract every pending document in a process pool (inline for a single document).
+        on_progress(done, total) is called in this thread. Returns {sha: error} for failed documents.
+        """
+        pending = self.pending()
+        failures = {}
+        if not pending:
+            return failures
+        jobs = [(self.pdf_path(sha), self.text_path(sha)) for sha in pending]
+        if len(pending) == 1:
+            results = [extract_pdf(*jobs[0])]
+            pool = None
+        else:
+            pool = ProcessPoolExecutor(max_workers=max_workers)
+            results = pool.map(extract_pdf, *zip(*jobs))
+        try:
+            for done, (sha, (pages, chunks, error)) in enumerate(zip(pending, results), 1):
+                self._save_extraction(sha, pages, chunks, error)
+                if error:
+                    failures[sha] = error
+                if on_progress is not None:
+                    on_progress(done, len(pending))
+        finally:
+            if pool is not None:
+                pool.shutdown()
+        return failures
+
+    def _save_extraction(self, sha, pages, chunks, error):
+        self._close_map(sha)
+        with self._lock:
+            self._conn.execute("DELETE FROM chunks WHERE sha = ?", (sha,))
+            self._conn.executemany(
+                "INSERT INTO chunks (sha, seq, section, start, end) VALUES (?, ?, ?, ?, ?)",
+                [(sha, seq, section, start, end) for seq, (section, start, end) in enumerate(chunks)],
+            )
+            self._conn.execute(
+                "UPDATE documents SET pages = ?, extractor = ?, error = ? WHERE sha = ?",
+                (pages, EXTRACTOR_VERSION, error, sha),
+            )
+            self._conn.commit()
+
+    def _map(self, sha):
+        with self._lock:
+            if sha in self._maps:
+                self._maps.move_to_end(sha)
+                return self._maps[sha]
+            with open(self.text_path(sha), "rb") as f:
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if os.fstat(f.fileno()).st_size else b""
+            self._maps[sha] = mapped
+            while len(self._maps) > self.max_open_maps:
+                old_sha, old = self._maps.popitem(last=False)
+                if isinstance(old, mmap.mmap):
+                    old.close()
+            return mapped
+
+    def _close_map(self, sha):
+        with self._lock:
+            mapped = self._maps.pop(sha, None)
+        if isinstance(mapped, mmap.mmap):
+            mapped.close()
+
+    def chunks(self, sha, sections=None):
+        """
+        The document's chunks in order, optionally only those in the given sections
+        """
+        with self._lock:
+            rows = self._conn.execute("SELECT seq, section, start, end FROM chunks WHERE sha = ? ORDER BY seq", (sha,)).fetchall()
+        if sections is not None:
+            rows = [row for row in rows if row[1] in sections]
+        if not rows:
+            return []
+        mapped = self._map(sha)
+        return [Chunk(sha, seq, section, mapped[start:end].decode("utf-8")) for seq, section, start, end in rows]
+
+    def chunk(self, sha, seq):
+        with self._lock:
+            row = self._conn.execute("SELECT section, start, end FROM chunks WHERE sha = ? AND seq = ?", (sha, seq)).fetchone()
+        if row is None:
+            raise KeyError((sha, seq))
+        section, start, end = row
+        return Chunk(sha, seq, section, self._map(sha)[start:end].decode("utf-8"))
+
+    def documents(self):
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT d.sha, d.filename, d.record_id, d.size, d.pages, d.error, COUNT(c.seq) "
+                "FROM documents d LEFT JOIN chunks c ON c.sha = d.sha GROUP BY d.sha ORDER BY d.added"
+            ).fetchall()
+        columns = ("sha", "filename", "record_id", "size", "pages", "error", "chunks")
+        return [dict(zip(columns, row)) for row in rows]
+
+    def sha_for_record(self, record_id):
+        with self._lock:
+            row = self._conn.execute("SELECT sha FROM documents WHERE record_id = ?", (str(record_id),)).fetchone()
+        return row[0] if row else None
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            for mapped in self._maps.values():
+                if isinstance(mapped, mmap.mmap):
+                    mapped.close()
+            self._maps.clear()
+            self._conn.close()
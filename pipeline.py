@@ -0,0 +1,177 @@
+"""
+Dependency-graph executor for the search-strategy stages.
+
+Each Stage names the values it needs; the executor starts a stage as soon as all of its
+inputs exist, runs independent stages on a thread pool, and hands every finished result
+back on the calling thread (so Streamlit calls in on_result/on_token are safe).
+"""
+import contextvars
+import queue
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import tracing
+
+
+class Stage:
+    """
+    One node of the pipeline: func is called with the values named in inputs, in order.
+    A streaming stage's func also accepts stream=True and then returns an iterator of text chunks.
+    """
+
+    def __init__(self, name, func, inputs, label=None, streams=False):
+        self.name = name
+        self.func = func
+        self.inputs = tuple(inputs)
+        self.label = label or name.replace("_", " ").capitalize()
+        self.streams = streams
+
+    def __repr__(self):
+        return f"Stage({self.name!r}, inputs={self.inputs!r})"
+
+
+class PipelineRun:
+    """
+    Results and timings of one executor run
+    """
+
+    def __init__(self, results, timings, wall_time, critical_path, critical_path_time):
+        self.results = results
+        self.timings = timings
+        self.wall_time = wall_time
+        self.critical_path = critical_path
+        self.critical_path_time = critical_path_time
+
+    def durations(self):
+        return {name: end - start for name, (start, end) in self.timings.items()}
+
+
+def validate_stages(stages, initial_names):
+    """
+    Check that names are unique, every input is produced somewhere and there are no cycles
+    """
+    names = set(initial_names)
+    for stage in stages:
+        if stage.name in names:
+            raise ValueError(f"Duplicate pipeline value: {stage.name}")
+        names.add(stage.name)
+    for stage in stages:
+        missing = [name for name in stage.inputs if name not in names]
+        if missing:
+            raise ValueError(f"Stage {stage.name} needs unknown inputs: {', '.join(missing)}")
+
+    by_name = {stage.name: stage for stage in stages}
+    visiting, done = set(), set()
+
+    def visit(name):
+        if name in done or name not in by_name:
+            return
+        if name in visiting:
+            raise ValueError(f"Pipeline has a cycle through {name}")
+        visiting.add(name)
+        for dep in by_name[name].inputs:
+            visit(dep)
+        visiting.discard(name)
+        done.add(name)
+
+    for stage in stages:
+        visit(stage.name)
+
+
+def critical_path(stages, durations):
+    """
+    Longest chain of dependent stages by measured duration: (stage names, seconds)
+    """
+    by_name = {stage.name: stage for stage in stages}
+    finish = {}
+    previous = {}
+
+    def finish_time(name):
+        if name not in finish:
+            best_dep, best_time = None, 0.0
+            for dep in by_name[name].inputs:
+                if dep in by_name and finish_time(dep) > best_time:
+                    best_dep, best_time = dep, finish_time(dep)
+            finish[name] = best_time + durations.get(name, 0.0)
+            previous[name] = best_dep
+        return finish[name]
+
+    if not by_name:
+        return [], 0.0
+    end = max(by_name, key=finish_time)
+    path = []
+    node = end
+    while node is not None:
+        path.append(node)
+        node = previous[node]
+    return list(reversed(path)), finish[end]
+
+
+def run_pipeline(stages, inputs, max_workers=4, on_result=None, on_token=None, poll_interval=0.05):
+    """
+    Execute stages with as much parallelism as their dependencies allow.
+    on_result(stage, value, seconds) is called on this thread as each stage finishes.
+    When on_token is given, streaming stages run with stream=True and on_token(stage, chunk)
+    is called on this thread for every chunk before that stage's on_result.
+    The first stage that raises stops scheduling and the exception propagates.
+    """
+    stages = list(stages)
+    validate_stages(stages, inputs)
+    results = dict(inputs)
+    timings = {}
+    pending = {stage.name: stage for stage in stages}
+    running = {}
+    tokens = queue.Queue()
+    started = time.perf_counter()
+
+    def timed(stage, args):
+        stage_start = time.perf_counter()
+        if stage.streams and on_token is not None:
+            chunks = []
+            for chunk in stage.func(*args, stream=True):
+                chunks.append(chunk)
+                tokens.put((stage, chunk))
+            value = "".join(chunks)
+        else:
+            value = stage.func(*args)
+        return value, stage_start, time.perf_counter()
+
+    def drain_tokens():
+        while True:
+            try:
+                stage, chunk = tokens.get_nowait()
+            except queue.Empty:
+                return
+            on_token(stage, chunk)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        while pending or running:
+            for name, stage in list(pending.items()):
+                if all(dep in results for dep in stage.inputs):
+                    args = [results[dep] for dep in stage.inputs]
+                    context = contextvars.copy_context()
+                    context.run(tracing.mark_queued)
+                    running[executor.submit(context.run, timed, stage, args)] = stage
+                    del pending[name]
+            if not running:
+                break
+            timeout = poll_interval if on_token is not None else None
+            finished, _ = wait(running, timeout=timeout, return_when=FIRST_COMPLETED)
+            if on_token is not None:
+                drain_tokens()
+            for future in finished:
+                stage = running.pop(future)
+                try:
+                    value, stage_start, stage_end = future.result()
+                except Exception:
+                    for other in running:
+                        other.cancel()
+                    raise
+                results[stage.name] = value
+                timings[stage.name] = (stage_start - started, stage_end - started)
+                if on_result is not None:
+                    on_result(stage, value, stage_end - stage_start)
+
+    durations = {name: end - start for name, (start, end) in timings.items()}
+    path, path_time = critical_path(stages, durations)
+    return PipelineRun(results, timings, time.perf_counter() - started, path, path_time)
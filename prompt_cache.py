@@ -0,0 +1,154 @@
+"""
+Persistent, content-addressed cache for persona prompt completions.
+
+Entries live in a SQLite file and are keyed by a SHA-256 of the full prompt and the
+model parameters, so rerunning the page with the same question returns stored
+completions instead of paying for another round-trip. Only deterministic
+(temperature 0) calls are cached unless cache_nonzero_temperature is set.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+DEFAULT_CACHE_DIR = os.environ.get("SYNTHSCOPE_CACHE_DIR", ".synthscope_cache")
+DEFAULT_CACHE_PATH = os.path.join(DEFAULT_CACHE_DIR, "prompt_cache.sqlite")
+
+
+def make_key(prompt, model, temperature, max_tokens, **params):
+    """
+    Hash of everything that determines a completion
+    """
+    payload = {
+        "prompt": prompt,
+        "model": model,
+        "temperature": float(temperature),
+        "max_tokens": max_tokens,
+        "params": params,
+    }
+    encoded = json.dumps(payload, sort_keys=True, ensure_ascii=False).encode("utf-8")
+    return hashlib.sha256(encoded).hexdigest()
+
+
+class PromptCache:
+    """
+    SQLite-backed completion cache with optional TTL and LRU eviction past max_entries
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, ttl=None, max_entries=10000, cache_nonzero_temperature=False):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.cache_nonzero_temperature = cache_nonzero_temperature
+        self.hits = 0
+        self.misses = 0
+        self.skipped = 0
+        self._lock = threading.Lock()
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS completions (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                created REAL NOT NULL,
+                last_access REAL NOT NULL
+            )"""
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS completions_last_access ON completions (last_access)")
+        self._conn.commit()
+
+    def should_cache(self, temperature):
+        if temperature == 0 or self.cache_nonzero_temperature:
+            return True
+        with self._lock:
+            self.skipped += 1
+        return False
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT value, created FROM completions WHERE key = ?", (key,)).fetchone()
+            if row is not None and self.ttl is not None and now - row[1] > self.ttl:
+                self._conn.execute("DELETE FROM completions WHERE key = ?", (key,))
+                self._conn.commit()
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE completions SET last_access = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self.hits += 1
+            return row[0]
+
+    def put(self, key, value):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO completions (key, value, created, last_access) VALUES (?, ?, ?, ?)",
+                (key, value, now, now),
+            )
+            if self.max_entries is not None:
+                self._conn.execute(
+                    """DELETE FROM completions WHERE key IN (
+                        SELECT key FROM completions ORDER BY last_access DESC LIMIT -1 OFFSET ?
+                    )""",
+                    (self.max_entries,),
+                )
+            self._conn.commit()
+
+    def get_or_compute(self, key, compute):
+        value = self.get(key)
+        if value is None:
+            value = compute()
+            self.put(key, value)
+        return value
+
+    def stats(self):
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM completions").fetchone()[0]
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "skipped": self.skipped,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": entries,
+            }
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM completions")
+            self._conn.commit()
+            self.hits = self.misses = self.skipped = 0
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    """
+    Return the process-wide cache, opening it on first use
+    """
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = PromptCache()
+        return _cache
+
+
+def set_cache(cache):
+    """
+    Replace the process-wide cache; passing None makes the next get_cache call reopen the default file
+    """
+    global _cache
+    with _cache_lock:
+        _cache = cache
@@ -0,0 +1,83 @@
+"""
+Process-wide limits on LLM traffic: requests per minute (token bucket) and calls in flight
+"""
+import asyncio
+import threading
+import time
+
+
+class RateLimiter:
+    """
+    Thread-safe limiter. acquire() blocks until a request token and a concurrency slot are
+    free; release() gives the slot back. Either limit can be None to disable it.
+    """
+
+    def __init__(self, rate_per_minute=None, max_concurrent=None, burst=None):
+        self.rate_per_minute = rate_per_minute
+        self.max_concurrent = max_concurrent
+        self._rate = rate_per_minute / 60.0 if rate_per_minute else None
+        self._capacity = burst or (max(1.0, self._rate) if self._rate else None)
+        self._tokens = self._capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_concurrent) if max_concurrent else None
+
+    def _take_token(self):
+        """
+        Take a token if one is available, otherwise return how long to wait for the next one
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self._capacity, self._tokens + (now - self._updated) * self._rate)
+            self._updated = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0.0
+            return (1 - self._tokens) / self._rate
+
+    def acquire(self):
+        if self._slots is not None:
+            self._slots.acquire()
+        if self._rate is not None:
+            delay = self._take_token()
+            while delay > 0:
+                time.sleep(delay)
+                delay = self._take_token()
+
+    def release(self):
+        if self._slots is not None:
+            self._slots.release()
+
+    async def acquire_async(self):
+        """
+        acquire() in a worker thread, so the event loop keeps running while it waits. If the
+        awaiting task is cancelled (e.g. by a wait_for timeout) the thread may still get a slot
+        afterwards; whichever side finds out last gives it back, so a timeout never leaks a slot
+        """
+        lock = threading.Lock()
+        state = {"acquired": False, "abandoned": False}
+
+        def acquire():
+            self.acquire()
+            with lock:
+                if state["abandoned"]:
+                    self.release()
+                else:
+                    state["acquired"] = True
+
+        try:
+            await asyncio.get_running_loop().run_in_executor(None, acquire)
+        except asyncio.CancelledError:
+            with lock:
+                state["abandoned"] = True
+                if state["acquired"]:
+                    self.release()
+            raise
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.release()
+        return False
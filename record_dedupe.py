@@ -0,0 +1,279 @@
+"""
+Duplicate-record detection across merged database search results.
+
+Records are first grouped by exact DOI/PMID through hash indexes, then by normalised
+title using MinHash signatures and LSH banding; LSH candidates are confirmed by the
+exact Jaccard similarity of their title shingles. Work grows roughly linearly with the
+number of records. Each cluster keeps its most complete record, filled in with fields
+from the duplicates, and the merge report says why every removed record matched.
+"""
+import re
+import unicodedata
+import zlib
+
+import numpy as np
+
+MERSENNE_PRIME = (1 << 31) - 1
+DEFAULT_THRESHOLD = 0.8
+MAX_BUCKET_SIZE = 500
+LSH_MARGIN = 0.1
+FETCH_CLUSTERS = 500
+
+
+def normalize_title(title):
+    title = title or ""
+    if not title.isascii():
+        title = unicodedata.normalize("NFKD", title)
+        title = "".join(ch for ch in title if not unicodedata.combining(ch))
+    return " ".join(re.sub(r"[^a-z0-9]+", " ", title.lower()).split())
+
+
+def normalize_doi(doi):
+    doi = (doi or "").strip().lower()
+    for prefix in ("https://doi.org/", "http://doi.org/", "http://dx.doi.org/", "doi:"):
+        if doi.startswith(prefix):
+            doi = doi[len(prefix):]
+    return doi
+
+
+def shingles(text, k=5):
+    text = text.replace(" ", "")
+    if len(text) <= k:
+        return {text} if text else set()
+    return {text[i:i + k] for i in range(len(text) - k + 1)}
+
+
+def _shingle_hashes(shingle_set):
+    return [zlib.crc32(s.encode("utf-8")) % MERSENNE_PRIME for s in shingle_set]
+
+
+class MinHasher:
+    def __init__(self, num_perm=64, seed=1):
+        rng = np.random.default_rng(seed)
+        self.a = rng.integers(1, MERSENNE_PRIME, size=num_perm, dtype=np.uint64)
+        self.b = rng.integers(0, MERSENNE_PRIME, size=num_perm, dtype=np.uint64)
+
+    def signature(self, shingle_set):
+        return self.signatures([shingle_set])[0]
+
+    def signatures(self, shingle_sets, chunk_size=1000):
+        """
+        One signature row per (non-empty) shingle set, computed a chunk of sets at a time
+        """
+        rows = []
+        for start in range(0, len(shingle_sets), chunk_size):
+            chunk = shingle_sets[start:start + chunk_size]
+            lengths = np.fromiter((len(s) for s in chunk), dtype=np.int64, count=len(chunk))
+            hashes = np.fromiter((h for s in chunk for h in _shingle_hashes(s)), dtype=np.uint64, count=int(lengths.sum()))
+            permuted = (self.a[:, None] * hashes[None, :] + self.b[:, None]) % MERSENNE_PRIME
+            offsets = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+            rows.append(np.minimum.reduceat(permuted, offsets, axis=1).T)
+        return np.vstack(rows) if rows else np.zeros((0, len(self.a)), dtype=np.uint64)
+
+
+def lsh_params(threshold, num_perm):
+    """
+    (bands, rows) with bands * rows <= num_perm whose S-curve midpoint (1/bands)^(1/rows) is closest to threshold
+    """
+    best = (num_perm, 1)
+    best_error = None
+    for rows in range(1, num_perm + 1):
+        bands = num_perm // rows
+        error = abs((1.0 / bands) ** (1.0 / rows) - threshold)
+        if best_error is None or error < best_error:
+            best, best_error = (bands, rows), error
+    return best
+
+
+class _UnionFind:
+    def __init__(self, n):
+        self.parent = list(range(n))
+
+    def find(self, i):
+        while self.parent[i] != i:
+            self.parent[i] = self.parent[self.parent[i]]
+            i = self.parent[i]
+        return i
+
+    def union(self, i, j):
+        root_i, root_j = self.find(i), self.find(j)
+        if root_i == root_j:
+            return False
+        if root_j < root_i:
+            root_i, root_j = root_j, root_i
+        self.parent[root_j] = root_i
+        return True
+
+
+def _get(record, field):
+    value = record.get(field) if hasattr(record, "get") else getattr(record, field, None)
+    return value or ""
+
+
+def _completeness(record):
+    return (bool(_get(record, "doi")), bool(_get(record, "abstract")), len(_get(record, "abstract")))
+
+
+def _merged(records):
+    """
+    The most complete record of a cluster, with empty fields filled from the others
+    """
+    ordered = sorted(records, key=_completeness, reverse=True)
+    keep = ordered[0]
+    merged = dict(keep.to_dict() if hasattr(keep, "to_dict") else keep)
+    for other in ordered[1:]:
+        fields = other.to_dict() if hasattr(other, "to_dict") else other
+        for field, value in fields.items():
+            if value and not merged.get(field):
+                merged[field] = value
+    if hasattr(keep, "to_dict"):
+        return keep, type(keep)(**merged)
+    return keep, merged
+
+
+class UniqueRecords:
+    """
+    The deduplicated records, read lazily from the source: each cluster's merged record takes the
+    place of its first member and the other members are skipped
+    """
+
+    def __init__(self, records, merged, removed):
+        self.records = records
+        self.merged = merged
+        self.removed = removed
+
+    def __iter__(self):
+        for i, record in enumerate(self.records):
+            if i in self.merged:
+                yield self.merged[i]
+            elif i not in self.removed:
+                yield record
+
+    def __len__(self):
+        return len(self.records) - len(self.removed)
+
+
+class DedupeResult:
+    def __init__(self, unique, report, total):
+        self.unique = unique
+        self.report = report
+        self.total = total
+
+    @property
+    def removed(self):
+        return len(self.report)
+
+
+def _records_at(records, positions):
+    if isinstance(records, list):
+        return [records[i] for i in positions]
+    return records.get_rows(positions)
+
+
+def find_duplicates(records, threshold=DEFAULT_THRESHOLD, num_perm=64, min_title_length=20):
+    """
+    Deduplicate records (dicts or importers.Record). Returns a DedupeResult whose report has
+    one row per removed record: kept_id, removed_id, reason and similarity.
+    Titles shorter than min_title_length are only matched by DOI/PMID.
+    An importers.RecordStore is not loaded whole: one pass keeps only the DOI/PMID keys and title
+    shingles, then the members of each cluster are fetched by position, and DedupeResult.unique
+    streams the unique records from the store again when iterated.
+    """
+    if not hasattr(records, "get_rows"):
+        records = list(records)
+    n = len(records)
+    union = _UnionFind(n)
+    reasons = {}
+
+    def link(i, j, reason, similarity):
+        if union.union(i, j):
+            reasons[(min(i, j), max(i, j))] = (reason, similarity)
+
+    seen = {"doi": {}, "pmid": {}}
+    title_shingles = [None] * n
+    for i, record in enumerate(records):
+        for field, normalize in (("doi", normalize_doi), ("pmid", str.strip)):
+            key = normalize(str(_get(record, field)))
+            if not key:
+                continue
+            if key in seen[field]:
+                link(seen[field][key], i, field, 1.0)
+            else:
+                seen[field][key] = i
+        title = normalize_title(_get(record, "title"))
+        if len(title) >= min_title_length:
+            title_shingles[i] = shingles(title)
+    seen = None
+
+    hasher = MinHasher(num_perm)
+    # Banding is tuned below the threshold so pairs just above it are rarely missed;
+    # every candidate is verified exactly anyway.
+    bands, rows = lsh_params(max(0.5, threshold - LSH_MARGIN), num_perm)
+    with_titles = [i for i in range(n) if title_shingles[i]]
+    signatures = hasher.signatures([title_shingles[i] for i in with_titles])
+    buckets = {}
+    for band in range(bands):
+        band_keys = np.ascontiguousarray(signatures[:, band * rows:(band + 1) * rows])
+        for i, key in zip(with_titles, band_keys):
+            buckets.setdefault((band, key.tobytes()), []).append(i)
+
+    checked = set()
+    for members in buckets.values():
+        if len(members) < 2 or len(members) > MAX_BUCKET_SIZE:
+            continue
+        for position in range(1, len(members)):
+            j = members[position]
+            for i in members[:position]:
+                if union.find(i) == union.find(j):
+                    break
+                if (i, j) in checked:
+                    continue
+                checked.add((i, j))
+                a, b = title_shingles[i], title_shingles[j]
+                similarity = len(a & b) / len(a | b)
+                if similarity >= threshold:
+                    link(i, j, "title", similarity)
+                    break
+    buckets = title_shingles = None
+
+    # union keeps the smallest index as the root, so each cluster starts with its first record
+    clusters = {}
+    for i in range(n):
+        root = union.find(i)
+        if root != i:
+            clusters.setdefault(root, [root]).append(i)
+
+    merged_at = {}
+    removed = set()
+    report = []
+    roots = sorted(clusters)
+    for start in range(0, len(roots), FETCH_CLUSTERS):
+        chunk = roots[start:start + FETCH_CLUSTERS]
+        positions = [i for root in chunk for i in clusters[root]]
+        fetched = dict(zip(positions, _records_at(records, positions)))
+        for root in chunk:
+            members = clusters[root]
+            keep, merged = _merged([fetched[i] for i in members])
+            merged_at[root] = merged
+            keep_index = next(i for i in members if fetched[i] is keep)
+            removed.update(members[1:])
+            for i in members:
+                if i == keep_index:
+                    continue
+                reason, similarity = _cluster_reason(reasons, members, i)
+                report.append({
+                    "kept_id": str(_get(keep, "id")),
+                    "removed_id": str(_get(fetched[i], "id")),
+                    "removed_title": _get(fetched[i], "title"),
+                    "reason": reason,
+                    "similarity": round(similarity, 3),
+                })
+    return DedupeResult(UniqueRecords(records, merged_at, removed), report, n)
+
+
+def _cluster_reason(reasons, members, i):
+    for j in members:
+        found = reasons.get((min(i, j), max(i, j)))
+        if found:
+            return found
+    return ("transitive", 0.0)
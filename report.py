@@ -0,0 +1,427 @@
+"""
+Review report builder.
+
+A report is a list of sections (introduction, methods, screening, risk of bias, summary,
+discussion, conclusion). Each section is built from a named subset of the review's inputs into
+format-neutral blocks and stored under a fingerprint of those inputs, so a rebuild only
+regenerates sections whose inputs changed; the introduction, discussion and conclusion are
+written by the LLM, the rest are templated.
+
+Rendering to HTML, DOCX (python-docx) or PDF (fpdf2, pure Python) happens in a worker process
+and writes a content-addressed file, so the page never waits on it and an unchanged report is
+not rendered twice. This replaces docx2pdf, which needs a local Word install.
+"""
+import atexit
+import contextvars
+import hashlib
+import html
+import json
+import os
+import threading
+import unicodedata
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+
+import prompt_cache
+
+REPORT_VERSION = 1
+DEFAULT_CACHE_PATH = os.path.join(prompt_cache.DEFAULT_CACHE_DIR, "report_sections.sqlite")
+DEFAULT_REPORT_DIR = os.path.join(prompt_cache.DEFAULT_CACHE_DIR, "reports")
+FORMATS = {"HTML": "html", "Word": "docx", "PDF": "pdf"}
+DECISIONS = ("INCLUDE", "EXCLUDE", "UNSURE")
+
+
+def heading(text, level=1):
+    return {"type": "heading", "level": level, "text": str(text)}
+
+
+def paragraph(text):
+    return {"type": "paragraph", "text": str(text)}
+
+
+def bullets(items):
+    return {"type": "bullets", "items": [str(item) for item in items]}
+
+
+def table(columns, rows, colours=None):
+    """
+    colours maps a cell value to a background colour ("#rrggbb")
+    """
+    return {"type": "table", "columns": [str(c) for c in columns], "rows": [[str(cell) for cell in row] for row in rows],
+            "colours": colours or {}}
+
+
+def _write_section(title, instructions, facts, persona_dict):
+    import search_strat as ss
+    import token_budget
+
+    prompt = f"Section: {title}\n{instructions}\n\nInformation:\n{facts}\n\n{title}:"
+    max_tokens = token_budget.persona_max_tokens(persona_dict, "report_section_developer")
+    text = ss.question_developer(prompt, persona_dict["report_section_developer"], max_tokens=max_tokens, stage="report_section_developer")
+    return [paragraph(part.strip()) for part in str(text).strip().split("\n\n") if part.strip()]
+
+
+def _counts(decisions):
+    counts = dict.fromkeys(DECISIONS, 0)
+    for row in decisions.values():
+        counts[row["decision"]] = counts.get(row["decision"], 0) + 1
+    return counts
+
+
+def build_introduction(inputs, persona_dict):
+    strategy = inputs["strategy"]
+    facts = "\n".join(f"{key}: {strategy[key]}" for key in ("New Question", "Population Statement") if strategy.get(key))
+    return _write_section(
+        "Introduction", "Introduce the topic, why it matters and the objective of this review.", facts, persona_dict,
+    )
+
+
+def build_methods(inputs, persona_dict):
+    strategy = inputs["strategy"]
+    blocks = []
+    if strategy.get("New Question"):
+        blocks += [heading("Review question", 2), paragraph(strategy["New Question"])]
+    if strategy.get("Population Statement"):
+        blocks += [heading("Eligibility", 2), paragraph(strategy["Population Statement"])]
+    if strategy.get("Inclusion and Exclusion Criteria"):
+        blocks.append(paragraph(strategy["Inclusion and Exclusion Criteria"]))
+    databases = [key[len("Search strategy specific to "):] for key in strategy if key.startswith("Search strategy specific to ")]
+    if databases:
+        blocks += [heading("Information sources", 2), bullets(databases)]
+    if strategy.get("Final Search Strategy"):
+        blocks += [heading("Search strategy", 2), paragraph(strategy["Final Search Strategy"])]
+    for database in databases:
+        blocks += [heading(database, 3), paragraph(strategy["Search strategy specific to " + database])]
+    if strategy.get("Pubmed Query"):
+        blocks += [heading("PubMed query", 3), paragraph(strategy["Pubmed Query"])]
+    blocks += [
+        heading("Study selection", 2),
+        paragraph("Titles and abstracts were screened against the eligibility criteria, and the full texts of records "
+                  "that were included or unclear were screened against each criterion using passages retrieved from the paper. "
+                  "Included studies were assessed with the Cochrane RoB 2 tool."),
+    ]
+    return blocks
+
+
+def build_screening(inputs, persona_dict):
+    blocks = []
+    screening, fulltext = inputs["screening"], inputs["fulltext"]
+    if screening:
+        counts = _counts(screening)
+        blocks.append(paragraph(
+            f"{len(screening)} records were screened on title and abstract: {counts['INCLUDE']} included, "
+            f"{counts['EXCLUDE']} excluded and {counts['UNSURE']} unclear."
+        ))
+    if fulltext:
+        counts = _counts(fulltext)
+        blocks.append(paragraph(
+            f"{len(fulltext)} full texts were assessed: {counts['INCLUDE']} included, {counts['EXCLUDE']} excluded "
+            f"and {counts['UNSURE']} unclear."
+        ))
+        blocks.append(table(("Study", "Decision", "Reason"), [(row["id"], row["decision"], row["reason"]) for row in fulltext.values()]))
+    return blocks or [paragraph("No screening results are available.")]
+
+
+def build_risk_of_bias(inputs, persona_dict):
+    import risk_of_bias
+
+    rows = inputs["rob"]
+    if not rows:
+        return [paragraph("No risk of bias assessment is available.")]
+    traffic_lights = risk_of_bias.traffic_light_table(rows.values())
+    summary = risk_of_bias.summary_table(traffic_lights)
+    return [
+        paragraph(f"{len(rows)} studies were assessed with the Cochrane RoB 2 tool. "
+                  f"Overall, {summary.loc['Overall', 'Low']:.0f}% were at low risk of bias, "
+                  f"{summary.loc['Overall', 'Some concerns']:.0f}% raised some concerns and "
+                  f"{summary.loc['Overall', 'High']:.0f}% were at high risk."),
+        table(["Study", *traffic_lights.columns], [(study, *values) for study, values in zip(traffic_lights.index, traffic_lights.to_numpy())],
+              colours=risk_of_bias.LEVEL_COLOURS),
+        bullets(f"{key}: {name}" for key, name, focus in risk_of_bias.DOMAINS),
+    ]
+
+
+def build_summary(inputs, persona_dict):
+    summary = inputs["summary"]
+    if not summary or not summary.get("summary"):
+        return [paragraph("No summary of the included studies is available.")]
+    blocks = [paragraph(part) for part in summary["summary"].split("\n\n") if part.strip()]
+    if summary.get("studies"):
+        blocks += [heading("Included studies", 2), bullets(summary["studies"].values())]
+    return blocks
+
+
+def build_discussion(inputs, persona_dict):
+    return _write_section(
+        "Discussion",
+        "Discuss the main findings, how consistent they are, the risk of bias of the evidence and the limitations of this review.",
+        _findings(inputs), persona_dict,
+    )
+
+
+def build_conclusion(inputs, persona_dict):
+    return _write_section(
+        "Conclusion", "State the conclusions for practice and research in one or two paragraphs.", _findings(inputs), persona_dict,
+    )
+
+
+def _findings(inputs):
+    facts = []
+    if inputs["strategy"].get("New Question"):
+        facts.append(f"Review question: {inputs['strategy']['New Question']}")
+    if inputs["summary"] and inputs["summary"].get("summary"):
+        facts.append(f"Summary of included studies: {inputs['summary']['summary']}")
+    if inputs["rob"]:
+        overall = {}
+        for row in inputs["rob"].values():
+            for domain in row["domains"]:
+                overall.setdefault(domain["name"], []).append(domain["judgement"])
+        facts.append("Risk of bias: " + "; ".join(
+            f"{name}: " + ", ".join(f"{judgements.count(level)} {level.lower()}" for level in dict.fromkeys(judgements))
+            for name, judgements in overall.items()
+        ))
+    return "\n".join(facts)
+
+
+class ReportSection:
+    def __init__(self, key, title, inputs, build):
+        self.key = key
+        self.title = title
+        self.inputs = inputs
+        self.build = build
+
+
+SECTIONS = [
+    ReportSection("introduction", "Introduction", ("strategy",), build_introduction),
+    ReportSection("methods", "Methods", ("strategy",), build_methods),
+    ReportSection("screening", "Results: study selection", ("screening", "fulltext"), build_screening),
+    ReportSection("risk_of_bias", "Results: risk of bias", ("rob",), build_risk_of_bias),
+    ReportSection("summary", "Results: summary of included studies", ("summary",), build_summary),
+    ReportSection("discussion", "Discussion", ("strategy", "summary", "rob"), build_discussion),
+    ReportSection("conclusion", "Conclusion", ("strategy", "summary", "rob"), build_conclusion),
+]
+
+
+def fingerprint(section, inputs):
+    """
+    Hash of everything a section is built from
+    """
+    import search_strat as ss
+
+    payload = json.dumps(
+        [REPORT_VERSION, ss.LLM_MODEL, section.key, [inputs.get(name) for name in section.inputs]],
+        sort_keys=True, default=str,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def build_report(inputs, persona_dict, cache=None, sections=None, max_workers=3):
+    """
+    [{"key", "title", "fingerprint", "blocks", "regenerated"}] for the report sections. inputs holds
+    "strategy", "screening", "fulltext", "rob" and "summary" (missing ones count as empty).
+    Sections found in the cache under their fingerprint are reused; the rest are built
+    concurrently and stored.
+    """
+    inputs = {name: inputs.get(name) or {} for name in ("strategy", "screening", "fulltext", "rob", "summary")}
+    sections = SECTIONS if sections is None else sections
+    if cache is None:
+        cache = prompt_cache.PromptCache(":memory:", max_entries=None)
+    built = []
+    todo = []
+    for section in sections:
+        key = fingerprint(section, inputs)
+        stored = cache.get(key)
+        entry = {"key": section.key, "title": section.title, "fingerprint": key, "regenerated": stored is None,
+                 "blocks": json.loads(stored) if stored is not None else None}
+        built.append(entry)
+        if stored is None:
+            todo.append((entry, section))
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        futures = [(entry, executor.submit(contextvars.copy_context().run, section.build, inputs, persona_dict)) for entry, section in todo]
+        for entry, future in futures:
+            entry["blocks"] = future.result()
+            cache.put(entry["fingerprint"], json.dumps(entry["blocks"]))
+    return built
+
+
+def render_html(title, sections):
+    parts = [
+        "<!DOCTYPE html>",
+        f"<html><head><meta charset=\"utf-8\"><title>{html.escape(title)}</title>",
+        "<style>body{font-family:sans-serif;max-width:60em;margin:2em auto;line-height:1.5}"
+        "table{border-collapse:collapse;margin:1em 0}td,th{border:1px solid #999;padding:.3em .6em;text-align:left}"
+        "p{white-space:pre-wrap}</style></head><body>",
+        f"<h1>{html.escape(title)}</h1>",
+    ]
+    for section in sections:
+        parts.append(f"<h2>{html.escape(section['title'])}</h2>")
+        for block in section["blocks"]:
+            if block["type"] == "heading":
+                level = min(6, block["level"] + 1)
+                parts.append(f"<h{level}>{html.escape(block['text'])}</h{level}>")
+            elif block["type"] == "paragraph":
+                parts.append(f"<p>{html.escape(block['text'])}</p>")
+            elif block["type"] == "bullets":
+                parts.append("<ul>" + "".join(f"<li>{html.escape(item)}</li>" for item in block["items"]) + "</ul>")
+            elif block["type"] == "table":
+                parts.append("<table><tr>" + "".join(f"<th>{html.escape(c)}</th>" for c in block["columns"]) + "</tr>")
+                for row in block["rows"]:
+                    cells = []
+                    for cell in row:
+                        colour = block["colours"].get(cell)
+                        style = f" style=\"background:{colour}\"" if colour else ""
+                        cells.append(f"<td{style}>{html.escape(cell)}</td>")
+                    parts.append("<tr>" + "".join(cells) + "</tr>")
+                parts.append("</table>")
+    parts.append("</body></html>")
+    return "\n".join(parts)
+
+
+def render_docx(title, sections, path):
+    import docx
+    from docx.oxml import OxmlElement
+    from docx.oxml.ns import qn
+
+    document = docx.Document()
+    document.add_heading(title, 0)
+    for section in sections:
+        document.add_heading(section["title"], 1)
+        for block in section["blocks"]:
+            if block["type"] == "heading":
+                document.add_heading(block["text"], min(9, block["level"] + 1))
+            elif block["type"] == "paragraph":
+                document.add_paragraph(block["text"])
+            elif block["type"] == "bullets":
+                for item in block["items"]:
+                    document.add_paragraph(item, style="List Bullet")
+            elif block["type"] == "table":
+                grid = document.add_table(rows=1, cols=len(block["columns"]))
+                grid.style = "Table Grid"
+                for cell, text in zip(grid.rows[0].cells, block["columns"]):
+                    cell.text = text
+                for row in block["rows"]:
+                    for cell, text in zip(grid.add_row().cells, row):
+                        cell.text = text
+                        colour = block["colours"].get(text)
+                        if colour:
+                            shading = OxmlElement("w:shd")
+                            shading.set(qn("w:val"), "clear")
+                            shading.set(qn("w:fill"), colour.lstrip("#"))
+                            cell._tc.get_or_add_tcPr().append(shading)
+    document.save(path)
+
+
+def _latin1(text):
+    """
+    The PDF core fonts only cover Latin-1: fold typographic punctuation and drop what cannot be shown
+    """
+    text = str(text).translate({0x2013: "-", 0x2014: "-", 0x2018: "'", 0x2019: "'", 0x201c: '"', 0x201d: '"',
+                                0x2022: "-", 0x2026: "...", 0x2264: "<=", 0x2265: ">=", 0x00a0: " "})
+    text = unicodedata.normalize("NFKD", text)
+    return text.encode("latin-1", "ignore").decode("latin-1")
+
+
+def render_pdf(title, sections, path):
+    from fpdf import FPDF
+    from fpdf.fonts import FontFace
+
+    pdf = FPDF()
+    pdf.set_auto_page_break(True, margin=15)
+    pdf.add_page()
+    pdf.set_font("Helvetica", "B", 18)
+    pdf.multi_cell(0, 9, _latin1(title), new_x="LMARGIN", new_y="NEXT")
+    for section in sections:
+        pdf.ln(4)
+        pdf.set_font("Helvetica", "B", 14)
+        pdf.multi_cell(0, 8, _latin1(section["title"]), new_x="LMARGIN", new_y="NEXT")
+        for block in section["blocks"]:
+            if block["type"] == "heading":
+                pdf.set_font("Helvetica", "B", 12 if block["level"] <= 2 else 11)
+                pdf.multi_cell(0, 7, _latin1(block["text"]), new_x="LMARGIN", new_y="NEXT")
+            elif block["type"] == "paragraph":
+                pdf.set_font("Helvetica", "", 10)
+                pdf.multi_cell(0, 5, _latin1(block["text"]), new_x="LMARGIN", new_y="NEXT")
+                pdf.ln(2)
+            elif block["type"] == "bullets":
+                pdf.set_font("Helvetica", "", 10)
+                for item in block["items"]:
+                    pdf.multi_cell(0, 5, _latin1("- " + item), new_x="LMARGIN", new_y="NEXT")
+                pdf.ln(2)
+            elif block["type"] == "table":
+                pdf.set_font("Helvetica", "", 8)
+                with pdf.table(text_align="LEFT") as grid:
+                    header = grid.row()
+                    for text in block["columns"]:
+                        header.cell(_latin1(text))
+                    for row in block["rows"]:
+                        cells = grid.row()
+                        for text in row:
+                            colour = block["colours"].get(text)
+                            cells.cell(_latin1(text), style=FontFace(fill_color=colour) if colour else None)
+                pdf.ln(2)
+    pdf.output(path)
+
+
+def render_file(title, sections, fmt, path):
+    """
+    Runs in the render worker process. Writes the report to path (through a temporary file) and returns path
+    """
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    if fmt == "html":
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(render_html(title, sections))
+    elif fmt == "docx":
+        render_docx(title, sections, tmp_path)
+    elif fmt == "pdf":
+        render_pdf(title, sections, tmp_path)
+    else:
+        raise ValueError(f"Unknown report format {fmt!r}")
+    os.replace(tmp_path, path)
+    return path
+
+
+_render_pool = None
+_render_pool_lock = threading.Lock()
+
+
+def get_render_pool():
+    """
+    The process-wide single-worker pool that report files are rendered in
+    """
+    global _render_pool
+    with _render_pool_lock:
+        if _render_pool is None:
+            _render_pool = ProcessPoolExecutor(max_workers=1)
+        return _render_pool
+
+
+def shutdown_render_pool():
+    global _render_pool
+    with _render_pool_lock:
+        pool, _render_pool = _render_pool, None
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+atexit.register(shutdown_render_pool)
+
+
+def report_path(title, sections, fmt, out_dir=DEFAULT_REPORT_DIR):
+    """
+    Where the rendering of these sections is stored; the name is a hash of the title and section fingerprints
+    """
+    digest = hashlib.sha256(json.dumps([REPORT_VERSION, fmt, title, [s["fingerprint"] for s in sections]]).encode("utf-8")).hexdigest()
+    return os.path.join(out_dir, f"{digest[:24]}.{fmt}")
+
+
+def start_render(title, sections, fmt, out_dir=DEFAULT_REPORT_DIR):
+    """
+    Render the report in the worker process. Returns a Future of the file path, already done when
+    the same report was rendered before
+    """
+    path = report_path(title, sections, fmt, out_dir)
+    if os.path.exists(path):
+        future = Future()
+        future.set_result(path)
+        return future
+    os.makedirs(out_dir, exist_ok=True)
+    return get_render_pool().submit(render_file, title, sections, fmt, path)
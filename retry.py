@@ -0,0 +1,47 @@
+"""
+Retry helper for LLM calls that fail for transient reasons (rate limits, timeouts, dropped connections)
+"""
+import random
+import time
+
+# Matched by class name so this works across openai/langchain versions without importing them
+TRANSIENT_ERROR_NAMES = {
+    "RateLimitError",
+    "Timeout",
+    "APITimeoutError",
+    "APIConnectionError",
+    "ServiceUnavailableError",
+    "InternalServerError",
+    "TryAgain",
+}
+
+
+def is_transient_error(exc):
+    if isinstance(exc, (TimeoutError, ConnectionError)):
+        return True
+    return any(cls.__name__ in TRANSIENT_ERROR_NAMES for cls in type(exc).__mro__)
+
+
+def backoff_delay(attempt, backoff=1.0, max_backoff=30.0):
+    """
+    Exponential backoff with full jitter for the given 0-based retry attempt
+    """
+    return random.uniform(0, min(max_backoff, backoff * (2 ** attempt)))
+
+
+def call_with_retry(func, *args, retries=3, backoff=1.0, max_backoff=30.0, on_retry=None, **kwargs):
+    """
+    Call func, retrying up to retries times on transient errors. Other errors propagate immediately.
+    on_retry(attempt, exc) is called before each sleep.
+    """
+    attempt = 0
+    while True:
+        try:
+            return func(*args, **kwargs)
+        except Exception as exc:
+            if attempt >= retries or not is_transient_error(exc):
+                raise
+            if on_retry is not None:
+                on_retry(attempt + 1, exc)
+            time.sleep(backoff_delay(attempt, backoff, max_backoff))
+            attempt += 1
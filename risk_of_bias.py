@@ -0,0 +1,271 @@
+"""
+Cochrane risk-of-bias (RoB 2) assessment of included papers.
+
+Every domain of a paper is judged in one structured request: passages are retrieved per domain
+from the paper's pdf_store chunks (as in fulltext_screening) and the model answers one line per
+domain citing the passages it used. Judgements are cached per (paper SHA-256, TOOL_VERSION), so
+re-running after adding a paper only assesses the new one. The traffic-light table and the
+summary graph are built from the judgements with array operations over the whole table.
+"""
+import contextvars
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import numpy as np
+
+import fulltext_screening
+import prompt_cache
+import rate_limit
+import retry
+import search_strat as ss
+import token_budget
+
+TOOL_VERSION = "rob2-1"
+DEFAULT_CACHE_PATH = os.path.join(prompt_cache.DEFAULT_CACHE_DIR, "risk_of_bias.sqlite")
+
+# (key, domain, what the retrieved passages should cover)
+DOMAINS = (
+    ("D1", "Bias arising from the randomisation process",
+     "random sequence generation, allocation concealment and baseline differences between groups"),
+    ("D2", "Bias due to deviations from intended interventions",
+     "blinding of participants and personnel, adherence, deviations from the intended intervention and intention-to-treat analysis"),
+    ("D3", "Bias due to missing outcome data",
+     "dropouts, withdrawals, loss to follow-up and how missing outcome data were handled"),
+    ("D4", "Bias in measurement of the outcome",
+     "how outcomes were measured and whether outcome assessors were blinded to the intervention"),
+    ("D5", "Bias in selection of the reported result",
+     "trial registration, pre-specified protocol or analysis plan and selective reporting of outcomes"),
+)
+DOMAIN_KEYS = tuple(key for key, name, focus in DOMAINS)
+LEVELS = ("Low", "Some concerns", "High", "No information")
+LEVEL_COLOURS = {"Low": "#3aa655", "Some concerns": "#f2c12e", "High": "#d64541", "No information": "#b0b0b0"}
+JUDGEMENT_REGEX = re.compile(
+    r"^\s*\[?D?(\d)\]?\s*[|:.)-]\s*(LOW|SOME CONCERNS|HIGH)\b\s*(?:\|\s*([^|]*?)\s*(?:\|\s*(.*))?)?$", re.IGNORECASE
+)
+
+
+class JudgementCache:
+    """
+    SQLite store of assessed papers keyed by (sha, tool version)
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS judgements (sha TEXT, tool_version TEXT, value TEXT NOT NULL, created REAL, "
+            "PRIMARY KEY (sha, tool_version))"
+        )
+        self._conn.commit()
+
+    def get_many(self, shas, tool_version=TOOL_VERSION):
+        """
+        {sha: stored row} for the shas already assessed with tool_version
+        """
+        shas = list(shas)
+        found = {}
+        with self._lock:
+            for start in range(0, len(shas), 500):
+                batch = shas[start:start + 500]
+                rows = self._conn.execute(
+                    f"SELECT sha, value FROM judgements WHERE tool_version = ? AND sha IN ({','.join('?' * len(batch))})",
+                    [tool_version, *batch],
+                ).fetchall()
+                found.update((sha, json.loads(value)) for sha, value in rows)
+        return found
+
+    def put(self, sha, row, tool_version=TOOL_VERSION):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO judgements (sha, tool_version, value, created) VALUES (?, ?, ?, ?)",
+                (sha, tool_version, json.dumps(row), time.time()),
+            )
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def build_rob_prompt(passages, cited):
+    lines = ["Domains:"]
+    for number, (key, name, focus) in enumerate(DOMAINS, start=1):
+        lines.append(f"{number}. ({key}) {name}: {focus}")
+    lines += ["", "Passages:"]
+    for number, chunk in enumerate(passages, start=1):
+        lines.append(f"[P{number}] ({chunk.section}) {chunk.text}")
+    lines.append("")
+    lines.append("Passages retrieved for each domain: " + "; ".join(
+        f"{key}: {', '.join(f'P{passage}' for passage in passages_for) or 'none'}"
+        for (key, name, focus), passages_for in zip(DOMAINS, cited)
+    ))
+    lines.append("Assessment:")
+    return "\n".join(lines)
+
+
+def parse_judgements(text):
+    """
+    {domain key: (level, [passage numbers], reason)}. Domains the model skipped come back "No information"
+    """
+    judgements = {}
+    for line in str(text).splitlines():
+        match = JUDGEMENT_REGEX.match(line)
+        if match:
+            number = int(match.group(1))
+            if 1 <= number <= len(DOMAINS) and DOMAIN_KEYS[number - 1] not in judgements:
+                level = " ".join(match.group(2).split()).capitalize()
+                passages = [int(passage) for passage in re.findall(r"P(\d+)", match.group(3) or "", re.IGNORECASE)]
+                judgements[DOMAIN_KEYS[number - 1]] = (level, passages, (match.group(4) or "").strip())
+    for key in DOMAIN_KEYS:
+        judgements.setdefault(key, ("No information", [], "no judgement returned"))
+    return judgements
+
+
+def assess_paper(store, sha, persona_dict, top_k=2, max_passages=10, embedder=None, limiter=None):
+    """
+    Judge every RoB 2 domain of one stored paper in a single request. Returns a row with a judgement,
+    reason and (section, chunk) citations per domain
+    """
+    chunks = store.chunks(sha)
+    queries = [(key, f"{name}: {focus}") for key, name, focus in DOMAINS]
+    passages, cited = fulltext_screening.retrieve_passages(chunks, queries, top_k=top_k, max_passages=max_passages, embedder=embedder)
+    prompt = build_rob_prompt(passages, cited)
+    persona = persona_dict["risk_of_bias_developer"]
+    max_tokens = token_budget.persona_max_tokens(persona_dict, "risk_of_bias_developer") * len(DOMAINS)
+    if limiter is not None:
+        limiter.acquire()
+    try:
+        output = ss.question_developer(prompt, persona, max_tokens=max_tokens, stage="risk_of_bias_developer")
+    finally:
+        if limiter is not None:
+            limiter.release()
+    judgements = parse_judgements(output)
+    domains = []
+    for (key, name, focus), passages_for in zip(DOMAINS, cited):
+        level, passage_numbers, reason = judgements[key]
+        passage_numbers = [n for n in passage_numbers if 1 <= n <= len(passages)] or passages_for
+        domains.append({
+            "domain": key,
+            "name": name,
+            "judgement": level,
+            "reason": reason,
+            "citations": [{"section": passages[n - 1].section, "chunk": passages[n - 1].seq} for n in passage_numbers],
+        })
+    return {
+        "sha": sha,
+        "domains": domains,
+        "passages": len(passages),
+        "prompt_tokens": token_budget.count_tokens(persona + prompt, ss.LLM_MODEL),
+    }
+
+
+class RoBResult:
+    def __init__(self, rows, failures, assessed, elapsed):
+        self.rows = rows
+        self.failures = failures
+        self.assessed = assessed
+        self.elapsed = elapsed
+
+    @property
+    def cached(self):
+        return len(self.rows) - self.assessed
+
+    def table(self):
+        return traffic_light_table(self.rows.values())
+
+
+def assess_papers(store, papers, persona_dict, top_k=2, max_passages=10, max_workers=4, rate_per_minute=None,
+                  retries=3, cache=None, embedder=None, on_progress=None):
+    """
+    Assess [(record_id, sha)] papers concurrently, one request per paper. Papers already in the
+    cache for TOOL_VERSION are not sent again; new judgements are stored as each paper finishes.
+    A paper that still fails after retries is recorded in failures. on_progress(done, total) is
+    called in this thread.
+    """
+    started = time.perf_counter()
+    cached = cache.get_many(sha for record_id, sha in papers) if cache is not None else {}
+    rows = {}
+    failures = {}
+    todo = []
+    for record_id, sha in papers:
+        record_id = str(record_id if record_id is not None else sha[:12])
+        if sha in cached:
+            rows[record_id] = dict(cached[sha], id=record_id)
+        else:
+            todo.append((record_id, sha))
+    limiter = rate_limit.RateLimiter(rate_per_minute, max_workers)
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        futures = {
+            executor.submit(
+                contextvars.copy_context().run, retry.call_with_retry, assess_paper, store, sha, persona_dict,
+                top_k=top_k, max_passages=max_passages, embedder=embedder, limiter=limiter, retries=retries,
+            ): (record_id, sha)
+            for record_id, sha in todo
+        }
+        try:
+            for done, future in enumerate(as_completed(futures), start=1):
+                record_id, sha = futures[future]
+                try:
+                    row = future.result()
+                except Exception as error:
+                    failures[record_id] = error
+                else:
+                    if cache is not None:
+                        cache.put(sha, row)
+                    rows[record_id] = dict(row, id=record_id)
+                if on_progress is not None:
+                    on_progress(done, len(futures))
+        except BaseException:
+            # e.g. a cancelled job raising from on_progress: papers not started yet are dropped
+            executor.shutdown(cancel_futures=True)
+            raise
+    return RoBResult(rows, failures, len(todo) - len(failures), time.perf_counter() - started)
+
+
+def traffic_light_table(rows):
+    """
+    DataFrame with one row per study, one column per domain and an Overall column following the
+    RoB 2 algorithm: High if any domain is High, Low if every domain is Low, otherwise Some concerns
+    """
+    import pandas as pd
+
+    rows = list(rows)
+    table = pd.DataFrame(
+        [[domain["judgement"] for domain in row["domains"]] for row in rows],
+        index=pd.Index([row["id"] for row in rows], name="Study"),
+        columns=list(DOMAIN_KEYS),
+    )
+    values = table.to_numpy(dtype=object)
+    table["Overall"] = np.select(
+        [(values == "High").any(axis=1), (values == "Low").all(axis=1)], ["High", "Low"], default="Some concerns"
+    )
+    return table
+
+
+def summary_table(table):
+    """
+    Percentage of studies at each level per domain (rows) for the summary graph
+    """
+    import pandas as pd
+
+    if not len(table):
+        return pd.DataFrame(0.0, index=table.columns, columns=list(LEVELS))
+    values = table.to_numpy(dtype=object)
+    shares = (values[:, :, None] == np.array(LEVELS, dtype=object)).mean(axis=0) * 100
+    return pd.DataFrame(shares, index=table.columns, columns=list(LEVELS))
+
+
+def style_traffic_lights(table):
+    """
+    Styler colouring every cell by its judgement
+    """
+    css = {level: f"background-color: {colour}; color: black" for level, colour in LEVEL_COLOURS.items()}
+    return table.style.apply(lambda frame: frame.replace(css), axis=None)
@@ -0,0 +1,245 @@
+"""
+Title/abstract screening engine.
+
+Records are packed several to a prompt so the screening persona and the criteria are
+paid for once per batch, batches run concurrently under a rate limiter, and every
+decision is appended to a JSONL checkpoint as soon as its batch returns. Rerunning with
+the same checkpoint skips records that already have a decision.
+
+Batches are sized by tokens as well as by count: a batch is closed once its prompt plus the
+completion budget of its records would not fit the model's context, and screen_batch refuses
+a prompt that does not fit rather than letting question_developer trim records out of it.
+"""
+import contextvars
+import hashlib
+import json
+import os
+import re
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import llm_pool
+import prompt_cache
+import rate_limit
+import retry
+import search_strat as ss
+import token_budget
+
+DECISIONS = ("INCLUDE", "EXCLUDE", "UNSURE")
+DECISION_REGEX = re.compile(r"^\s*\[?(\d+)\]?\s*[|:.)-]\s*(INCLUDE|EXCLUDE|UNSURE)\b\s*[|:-]?\s*(.*)$", re.IGNORECASE)
+CHECKPOINT_DIR = os.path.join(prompt_cache.DEFAULT_CACHE_DIR, "screening")
+
+
+def checkpoint_path(criteria, dataset_key):
+    """
+    Checkpoint file for one (criteria, dataset) pair, so changing either starts a fresh screen
+    """
+    digest = hashlib.sha256((criteria + "\0" + str(dataset_key)).encode("utf-8")).hexdigest()[:16]
+    return os.path.join(CHECKPOINT_DIR, digest + ".jsonl")
+
+
+def _record_lines(number, record):
+    return [f"[{number}] Title: {record.get('title') or ''}", f"Abstract: {record.get('abstract') or 'No abstract available.'}", ""]
+
+
+def build_batch_prompt(criteria, records):
+    lines = ["Inclusion and Exclusion Criteria:", criteria.strip(), "", "Records:"]
+    for number, record in enumerate(records, start=1):
+        lines += _record_lines(number, record)
+    lines.append("Decisions:")
+    return "\n".join(lines)
+
+
+def prompt_tokens(prompt, persona_dict):
+    """
+    Tokens of a batch prompt as question_developer sends it, persona and template included
+    """
+    persona = llm_pool.QUESTION_TEMPLATE.format(question=persona_dict["screening_developer"])
+    return token_budget.count_tokens(persona, ss.LLM_MODEL) + token_budget.count_tokens(prompt, ss.LLM_MODEL)
+
+
+def prompt_allowance(count, persona_dict):
+    """
+    Prompt tokens a batch of count records may use: the context window less their completion
+    budget, capped by token_budget.prompt_budget
+    """
+    max_tokens = token_budget.persona_max_tokens(persona_dict, "screening_developer") * count
+    allowed = token_budget.context_window(ss.LLM_MODEL) - max_tokens
+    if token_budget.prompt_budget is not None:
+        allowed = min(allowed, token_budget.prompt_budget)
+    return allowed
+
+
+def parse_decisions(text, count):
+    """
+    Map record numbers 1..count to (decision, reason). Records the model skipped come back UNSURE
+    """
+    decisions = {}
+    for line in str(text).splitlines():
+        match = DECISION_REGEX.match(line)
+        if match:
+            number = int(match.group(1))
+            if 1 <= number <= count and number not in decisions:
+                decisions[number] = (match.group(2).upper(), match.group(3).strip())
+    for number in range(1, count + 1):
+        decisions.setdefault(number, ("UNSURE", "no decision returned"))
+    return decisions
+
+
+def load_checkpoint(path):
+    decisions = {}
+    if path and os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    row = json.loads(line)
+                except ValueError:
+                    continue
+                decisions[row["id"]] = row
+    return decisions
+
+
+class ScreeningResult:
+    def __init__(self, decisions, screened, resumed, failed_batches, elapsed, calls):
+        self.decisions = decisions
+        self.screened = screened
+        self.resumed = resumed
+        self.failed_batches = failed_batches
+        self.elapsed = elapsed
+        self.calls = calls
+
+    @property
+    def records_per_minute(self):
+        return self.screened / self.elapsed * 60 if self.elapsed else 0.0
+
+    def counts(self):
+        counts = dict.fromkeys(DECISIONS, 0)
+        for row in self.decisions.values():
+            counts[row["decision"]] = counts.get(row["decision"], 0) + 1
+        return counts
+
+
+def _record_tokens(number, record):
+    # +1 for tokens that merge differently once the records are joined into one prompt
+    return token_budget.count_tokens("\n".join(_record_lines(number, record)) + "\n", ss.LLM_MODEL) + 1
+
+
+def _shorten(record, fixed, persona_dict):
+    """
+    Copy of a record whose abstract is cut so that it fits a batch on its own
+    """
+    spare = prompt_allowance(1, persona_dict) - fixed - _record_tokens(1, {"title": record.get("title"), "abstract": " "})
+    abstract = token_budget.trim_to_tokens(record.get("abstract") or "", max(0, spare), ss.LLM_MODEL)
+    return {"id": record.get("id"), "title": record.get("title"), "abstract": abstract}
+
+
+def _batches(records, batch_size, done, criteria, persona_dict):
+    """
+    Batches of at most batch_size unscreened records whose prompt fits the context. A record
+    too long to fit even on its own is screened alone with a shortened abstract
+    """
+    fixed = prompt_tokens(build_batch_prompt(criteria, []), persona_dict)
+    batch = []
+    tokens = fixed
+    for record in records:
+        record_id = str(record.get("id"))
+        if record_id in done:
+            continue
+        cost = _record_tokens(len(batch) + 1, record)
+        if batch and (len(batch) >= batch_size or tokens + cost > prompt_allowance(len(batch) + 1, persona_dict)):
+            yield batch
+            batch = []
+            tokens = fixed
+            cost = _record_tokens(1, record)
+        if not batch and tokens + cost > prompt_allowance(1, persona_dict):
+            record = _shorten(record, fixed, persona_dict)
+            cost = _record_tokens(1, record)
+        batch.append(record)
+        tokens += cost
+    if batch:
+        yield batch
+
+
+def screen_batch(batch, criteria, persona_dict, limiter=None):
+    prompt = build_batch_prompt(criteria, batch)
+    tokens = prompt_tokens(prompt, persona_dict)
+    if tokens > prompt_allowance(len(batch), persona_dict):
+        # trimming would cut records out of the middle of the prompt and they would still get decisions
+        raise ValueError(f"Screening prompt for {len(batch)} records is {tokens} tokens, too long for {ss.LLM_MODEL}")
+    # the persona file's screening budget is per record
+    max_tokens = token_budget.persona_max_tokens(persona_dict, "screening_developer") * len(batch)
+    if limiter is not None:
+        limiter.acquire()
+    try:
+        output = ss.question_developer(prompt, persona_dict["screening_developer"], max_tokens=max_tokens, stage="screening_developer")
+    finally:
+        if limiter is not None:
+            limiter.release()
+    return parse_decisions(output, len(batch))
+
+
+def screen_records(records, criteria, persona_dict, batch_size=10, max_workers=4, rate_per_minute=None,
+                   checkpoint=None, retries=3, on_progress=None):
+    """
+    Screen records (any iterable of dicts or importers.Record) against criteria, at most
+    batch_size to a prompt and fewer when their abstracts are long. Decisions are appended to the checkpoint file as batches finish; records already in it are
+    skipped. on_progress(screened, resumed) is called after every batch.
+    """
+    decisions = load_checkpoint(checkpoint)
+    resumed = len(decisions)
+    if checkpoint:
+        os.makedirs(os.path.dirname(os.path.abspath(checkpoint)), exist_ok=True)
+    limiter = rate_limit.RateLimiter(rate_per_minute, max_workers)
+    screened = 0
+    failed_batches = 0
+    calls = 0
+    started = time.perf_counter()
+    batches = _batches(records, batch_size, set(decisions), criteria, persona_dict)
+    out = open(checkpoint, "a", encoding="utf-8") if checkpoint else None
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+            running = {}
+            exhausted = False
+            try:
+                while running or not exhausted:
+                    # keep a couple of batches queued per worker without materialising every batch
+                    while not exhausted and len(running) < max_workers * 2:
+                        batch = next(batches, None)
+                        if batch is None:
+                            exhausted = True
+                            break
+                        future = executor.submit(contextvars.copy_context().run, retry.call_with_retry, screen_batch, batch,
+                                                 criteria, persona_dict, limiter, retries=retries)
+                        running[future] = batch
+                    if not running:
+                        break
+                    finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        batch = running.pop(future)
+                        calls += 1
+                        try:
+                            batch_decisions = future.result()
+                        except Exception:
+                            # left out of the checkpoint, so the next run retries it
+                            failed_batches += 1
+                            continue
+                        for number, record in enumerate(batch, start=1):
+                            decision, reason = batch_decisions[number]
+                            row = {"id": str(record.get("id")), "title": record.get("title") or "", "decision": decision, "reason": reason}
+                            decisions[row["id"]] = row
+                            if out is not None:
+                                out.write(json.dumps(row, ensure_ascii=False) + "\n")
+                        if out is not None:
+                            out.flush()
+                        screened += len(batch)
+                        if on_progress is not None:
+                            on_progress(screened, resumed)
+            except BaseException:
+                # e.g. a cancelled job raising from on_progress: batches still queued are not sent
+                for future in running:
+                    future.cancel()
+                raise
+    finally:
+        if out is not None:
+            out.close()
+    return ScreeningResult(decisions, screened, resumed, failed_batches, time.perf_counter() - started, calls)
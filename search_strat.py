@@ -1,53 +1,342 @@
-import streamlit as st
+import ast
+import asyncio
+import contextvars
+import functools
+import os
 import re
 import json
 import time
-import docx
-from docx.shared import Inches
-from docx2pdf import convert
-from langchain import PromptTemplate, LLMChain
-from langchain.chat_models import ChatOpenAI
-from langchain.llms import OpenAI
-import time
+import lazy
+import llm_pool
+import prompt_cache
+import pipeline
+import retry
+import token_budget
+import tracing
+from concurrent.futures import ThreadPoolExecutor
+
+# The baseline called OpenAI() with langchain's default model, text-davinci-003, which OpenAI has retired.
+# gpt-3.5-turbo-instruct is its completion-API replacement with the same 4k context, and naming it here
+# lets the pool key chains by model and token_budget size prompts against its context window.
+LLM_MODEL = "gpt-3.5-turbo-instruct"
+MAX_TOKENS = 2000
+
+# numpy and the embedding stack load on the first semantic dedupe, not with this module
+dedupe = lazy.lazy_import("dedupe")
 
-openai_api_key = st.secrets["OPENAI_API_KEY"]
+rate_limiter = None
 
-def question_developer(user_input, persona, temperature=0):
+def set_rate_limiter(limiter):
     """
-    Module to generate a new research question based on the user input and persona
+    Route every LLM call through limiter (a rate_limit.RateLimiter), or None to remove the limit
+    """
+    global rate_limiter
+    rate_limiter = limiter
+
+_persona_dicts = {}
+
+def load_persona_dict(path='perssonadict.json'):
     """
+    Parsed persona file, cached per process and re-read only when the file changes on disk.
+    Callers share the returned dict, so treat it as read-only
+    """
+    key = os.path.abspath(path)
+    mtime = os.path.getmtime(key)
+    cached = _persona_dicts.get(key)
+    if cached is None or cached[0] != mtime:
+        with open(key, 'r') as f:
+            cached = (mtime, json.load(f))
+        _persona_dicts[key] = cached
+    return cached[1]
+
+@tracing.traced()
+def question_developer(user_input, persona, temperature=0, stream=False, max_tokens=MAX_TOKENS, stage=None):
+    """
+    Module to generate a new research question based on the user input and persona.
+    With stream=True a generator of text chunks is returned instead; joined, the chunks
+    equal the non-streaming result. user_input is trimmed if the prompt would not leave
+    room for max_tokens of completion.
+    """
+    user_input, max_tokens, prompt_tokens = token_budget.fit_prompt(persona, user_input, max_tokens, LLM_MODEL, llm_pool.QUESTION_TEMPLATE)
     question = persona + user_input
-    template = """Question: {question}
-
-    Answer:"""
-    prompt = PromptTemplate(template=template, input_variables=["question"])
-    llm_chain = LLMChain(
-        prompt=prompt,
-        llm=OpenAI(temperature=temperature, max_tokens=2000),
-        verbose=False
+    if stream:
+        return _stream_completion(question, temperature, max_tokens, stage, prompt_tokens)
+    started = time.perf_counter()
+    cache, key = _cache_lookup_key(question, temperature, max_tokens)
+    if key is not None:
+        cached = cache.get(key)
+        if cached is not None:
+            _record_usage(stage, prompt_tokens, cached, started, cached=True)
+            return cached
+    llm_chain = llm_pool.get_pool().get_chain(LLM_MODEL, temperature, max_tokens)
+    limiter = rate_limiter
+    if limiter is not None:
+        waited = time.perf_counter()
+        limiter.acquire()
+        tracing.add("queue_time", time.perf_counter() - waited)
+    try:
+        result = llm_chain.predict(question=question)
+    finally:
+        if limiter is not None:
+            limiter.release()
+    if key is not None:
+        cache.put(key, result)
+    _record_usage(stage, prompt_tokens, result, started)
+    return result
+
+@tracing.traced()
+def _stream_completion(question, temperature, max_tokens, stage, prompt_tokens):
+    started = time.perf_counter()
+    cache, key = _cache_lookup_key(question, temperature, max_tokens)
+    if key is not None:
+        cached = cache.get(key)
+        if cached is not None:
+            _record_usage(stage, prompt_tokens, cached, started, cached=True)
+            yield cached
+            return
+    pool = llm_pool.get_pool()
+    llm = pool.get_llm(LLM_MODEL, temperature, max_tokens)
+    chunks = []
+    limiter = rate_limiter
+    if limiter is not None:
+        waited = time.perf_counter()
+        limiter.acquire()
+        tracing.add("queue_time", time.perf_counter() - waited)
+    try:
+        for chunk in llm.stream(llm_pool.QUESTION_TEMPLATE.format(question=question)):
+            # chat models stream message chunks, completion models stream plain strings
+            text = getattr(chunk, "content", chunk)
+            chunks.append(text)
+            yield text
+    finally:
+        if limiter is not None:
+            limiter.release()
+    result = "".join(chunks)
+    if key is not None:
+        cache.put(key, result)
+    _record_usage(stage, prompt_tokens, result, started)
+
+def _record_usage(stage, prompt_tokens, result, started, cached=False):
+    completion_tokens = token_budget.count_tokens(str(result), LLM_MODEL)
+    token_budget.record(stage or "question_developer", LLM_MODEL, prompt_tokens, completion_tokens, time.perf_counter() - started, cached)
+    tracing.add("prompt_tokens", prompt_tokens)
+    tracing.add("completion_tokens", completion_tokens)
+    tracing.add("cache_hits" if cached else "llm_calls")
+
+def _cache_lookup_key(question, temperature, max_tokens=MAX_TOKENS):
+    """
+    Return (cache, key) for a persona prompt, or (cache, None) when the call should not be cached
+    """
+    cache = prompt_cache.get_cache()
+    if not cache.should_cache(temperature):
+        return cache, None
+    return cache, prompt_cache.make_key(llm_pool.QUESTION_TEMPLATE.format(question=question), LLM_MODEL, temperature, max_tokens)
+
+def _persona_call(persona_dict, persona_key, user_input, **kwargs):
+    """
+    question_developer with the persona's completion budget from the persona file, recorded under its key
+    """
+    return question_developer(
+        user_input,
+        persona_dict[persona_key],
+        max_tokens=token_budget.persona_max_tokens(persona_dict, persona_key),
+        stage=persona_key,
+        **kwargs
         )
 
+def _filter_question_outputs(outputs):
+    """
+    Keep the completions that contain a new question and drop exact repeats, preserving order
+    """
+    question_options = [output for output in outputs if output is not None and dedupe.extract_question(output)]
+    return list(dict.fromkeys(question_options))
 
-    return llm_chain.predict(question=question)
+def split_question_candidates(new_question_output):
+    """
+    Split a completion that answers with several New Question/Rationale pairs into one
+    completion per pair, in the format get_new_question_rationale parses
+    """
+    pairs = re.findall(r"New Question\]?:\s+(.*)\n\s*\[?Rationale\]?:\s+(.*)", str(new_question_output))
+    return [f"New Question: {question.strip()}\nRationale: {rationale.strip()}\n" for question, rationale in pairs]
+
+class QuestionSample:
+    """
+    Outcome of sample_new_questions_async
+    """
+
+    def __init__(self, questions, calls, max_attempts, malformed, duplicates, temperature):
+        self.questions = questions
+        self.calls = calls
+        self.saved_calls = max(0, max_attempts - calls)
+        self.malformed = malformed
+        self.duplicates = duplicates
+        self.temperature = temperature
 
+    def __repr__(self):
+        return (
+            f"QuestionSample({len(self.questions)} questions, calls={self.calls}, saved_calls={self.saved_calls}, "
+            f"malformed={self.malformed}, duplicates={self.duplicates}, temperature={self.temperature})"
+        )
+
+@tracing.traced()
 def develop_new_questions(user_input, persona_dict):
     question_options = []
-    new_question_regex = r"New Question:\s+(.*)\n"
-    rationale_regex = r"Rationale:\s+(.*)"
     for i in range(10):
-        new_question_output = question_developer(user_input, persona_dict["question_developer"], temperature=0.3)
-        try:
-            question_only = re.search(new_question_regex, str(new_question_output)).group(1)
-            question_only = question_only.strip("\n")
-            question_options.append(new_question_output)
-        except:
-            pass
+        new_question_output = _persona_call(persona_dict, "question_developer", user_input, temperature=0.3)
+        question_options.append(new_question_output)
+    return _filter_question_outputs(question_options)
 
+@tracing.traced()
+async def aquestion_developer(user_input, persona, temperature=0, max_tokens=MAX_TOKENS, stage=None):
+    """
+    Async version of question_developer so several completions can be in flight at once
+    """
+    user_input, max_tokens, prompt_tokens = token_budget.fit_prompt(persona, user_input, max_tokens, LLM_MODEL, llm_pool.QUESTION_TEMPLATE)
+    question = persona + user_input
+    started = time.perf_counter()
+    cache, key = _cache_lookup_key(question, temperature, max_tokens)
+    if key is not None:
+        cached = cache.get(key)
+        if cached is not None:
+            _record_usage(stage, prompt_tokens, cached, started, cached=True)
+            return cached
+    llm_chain = llm_pool.get_pool().get_chain(LLM_MODEL, temperature, max_tokens)
+    limiter = rate_limiter
+    if limiter is not None:
+        waited = time.perf_counter()
+        await limiter.acquire_async()
+        tracing.add("queue_time", time.perf_counter() - waited)
+    try:
+        result = await llm_chain.apredict(question=question)
+    finally:
+        if limiter is not None:
+            limiter.release()
+    if key is not None:
+        cache.put(key, result)
+    _record_usage(stage, prompt_tokens, result, started)
+    return result
+
+async def gather_bounded(coroutine_factories, max_concurrency=10, timeout=60):
+    """
+    Run the coroutine factories concurrently with at most max_concurrency in flight.
+    Results come back in the same order as the factories; a call that fails or
+    takes longer than timeout seconds gives None in its slot.
+    """
+    semaphore = asyncio.Semaphore(max(1, max_concurrency))
+
+    async def run_one(factory):
+        async with semaphore:
+            try:
+                return await asyncio.wait_for(factory(), timeout)
+            except Exception:
+                return None
+
+    return await asyncio.gather(*(run_one(factory) for factory in coroutine_factories))
+
+@tracing.traced()
+async def develop_new_questions_async(user_input, persona_dict, n=10, max_concurrency=10, timeout=60, developer=None,
+                                      similarity_threshold=None, target_distinct=None, embedder=None):
+    """
+    Generate up to n candidate questions concurrently instead of one round-trip at a time.
+    developer can be swapped for any coroutine function with the aquestion_developer signature.
+    With similarity_threshold, near-identical rewordings are collapsed by embedding similarity.
+    With target_distinct, candidates are generated in waves of max_concurrency and generation
+    stops once that many distinct questions exist, saving the remaining calls.
+    """
+    sample = await sample_new_questions_async(
+        user_input,
+        persona_dict,
+        target=target_distinct or n,
+        max_attempts=n,
+        temperature_step=0,
+        max_concurrency=max_concurrency if target_distinct else n,
+        timeout=timeout,
+        developer=developer,
+        similarity_threshold=similarity_threshold,
+        embedder=embedder,
+        )
+    return sample.questions
+
+async def sample_new_questions_async(user_input, persona_dict, target=5, max_attempts=10, temperature=0.3,
+                                     temperature_step=0.2, max_temperature=1.0, per_request=1, max_concurrency=5,
+                                     timeout=60, developer=None, similarity_threshold=None, embedder=None):
+    """
+    Adaptive question sampler. Requests go out in waves of at most max_concurrency, sized to
+    what is still missing, until target distinct well-formed questions exist or max_attempts
+    requests have been made. Every wave that produces duplicates raises the temperature by
+    temperature_step (up to max_temperature). per_request > 1 asks for several candidates in
+    one completion and splits the answer.
+    """
+    developer = developer or functools.partial(
+        aquestion_developer,
+        max_tokens=token_budget.persona_max_tokens(persona_dict, "question_developer") * per_request,
+        stage="question_developer",
+        )
+    persona = persona_dict["question_developer"]
+    prompt = user_input
+    if per_request > 1:
+        prompt = user_input + f"\nPlease provide {per_request} different alternatives, each with its own New Question: and Rationale:."
+
+    candidates = []
     question_dedupe = []
-    for question in question_options:
-        if question not in question_dedupe:
-            question_dedupe.append(question)
-    return question_dedupe
+    calls = 0
+    malformed = 0
+    duplicates = 0
+    while len(question_dedupe) < target and calls < max_attempts:
+        missing = target - len(question_dedupe)
+        size = min(max(1, max_concurrency), max_attempts - calls, -(-missing // per_request))
+        factories = [lambda t=temperature: developer(prompt, persona, temperature=t) for i in range(size)]
+        outputs = await gather_bounded(factories, max_concurrency=max_concurrency, timeout=timeout)
+        calls += size
+
+        well_formed = 0
+        for output in outputs:
+            if output is None:
+                malformed += 1
+                continue
+            parts = split_question_candidates(output) if per_request > 1 else [output]
+            parts = [part for part in parts if dedupe.extract_question(part)]
+            if not parts:
+                malformed += 1
+            well_formed += len(parts)
+            candidates += parts
+
+        previous = len(question_dedupe)
+        question_dedupe = _filter_question_outputs(candidates)
+        if similarity_threshold is not None:
+            question_dedupe = await asyncio.to_thread(dedupe.semantic_dedupe, question_dedupe, similarity_threshold, embedder)
+        wave_duplicates = well_formed - (len(question_dedupe) - previous)
+        duplicates += wave_duplicates
+        if wave_duplicates > 0:
+            temperature = min(max_temperature, round(temperature + temperature_step, 2))
+
+    tracing.add("saved_calls", max(0, max_attempts - calls))
+    return QuestionSample(question_dedupe[:target], calls, max_attempts, malformed, duplicates, temperature)
+
+def sample_new_questions(user_input, persona_dict, **kwargs):
+    """
+    Blocking wrapper around sample_new_questions_async for the Streamlit script thread
+    """
+    return asyncio.run(sample_new_questions_async(user_input, persona_dict, **kwargs))
+
+def develop_new_questions_concurrent(user_input, persona_dict, n=10, max_concurrency=10, timeout=60, developer=None,
+                                     similarity_threshold=None, target_distinct=None, embedder=None):
+    """
+    Blocking wrapper around develop_new_questions_async for the Streamlit script thread
+    """
+    return asyncio.run(
+        develop_new_questions_async(
+            user_input,
+            persona_dict,
+            n=n,
+            max_concurrency=max_concurrency,
+            timeout=timeout,
+            developer=developer,
+            similarity_threshold=similarity_threshold,
+            target_distinct=target_distinct,
+            embedder=embedder,
+            )
+        )
 
 def get_new_question_rationale(new_question_output):
     new_question_regex = r"New Question:\s+(.*)\n"
@@ -57,61 +346,195 @@ def get_new_question_rationale(new_question_output):
     ques_rat_list = [new_question, rationale]
     return ques_rat_list
 
+@tracing.traced()
 def develop_document_title(new_question, persona_dict):
-    doctitle_question = question_developer(new_question + "\nDocument Title:", persona_dict["doctitle_developer"])
+    doctitle_question = _persona_call(persona_dict, "doctitle_developer", new_question + "\nDocument Title:")
     return str(doctitle_question)
 
+@tracing.traced()
 def develop_file_title(new_question, persona_dict):
-    filetitle_question = question_developer(new_question + "\nFile Title:", persona_dict["filetitle_developer"])
+    filetitle_question = _persona_call(persona_dict, "filetitle_developer", new_question + "\nFile Title:")
     return str(filetitle_question)
 
+@tracing.traced()
 def determine_population_statement_template(new_question, persona_dict):
-    intorexp_question = question_developer(new_question, persona_dict["intorexp_developer"])
+    intorexp_question = _persona_call(persona_dict, "intorexp_developer", new_question)
     return str(intorexp_question)
 
+@tracing.traced()
 def develop_population_statement(new_question, pop_statement_template, persona_dict):
     if "pico" in pop_statement_template.lower():
-        pico_question = question_developer(new_question, persona_dict["PICO_developer"])
+        pico_question = _persona_call(persona_dict, "PICO_developer", new_question)
         pop_statement = pico_question
     elif "peco" in pop_statement_template.lower():
-        pico_question = question_developer(new_question, persona_dict["PECO_developer"])
+        pico_question = _persona_call(persona_dict, "PECO_developer", new_question)
         pop_statement = pico_question
     elif "spider" in pop_statement_template.lower():
-        spider_question = question_developer(new_question, persona_dict["SPIDER_developer"])
+        spider_question = _persona_call(persona_dict, "SPIDER_developer", new_question)
         pop_statement = spider_question
     return pop_statement
 
-def develop_inclusion_exclusion_criteria(new_question, pop_statement, persona_dict):
-    incexc_question = question_developer(str(pop_statement + "\nMy Research Question: " + new_question), persona_dict["incexc_developer"])
+@tracing.traced()
+def develop_inclusion_exclusion_criteria(new_question, pop_statement, persona_dict, stream=False):
+    incexc_question = _persona_call(persona_dict, "incexc_developer", str(pop_statement + "\nMy Research Question: " + new_question), stream=stream)
     return incexc_question
 
-def develop_search_strategy(new_question, pop_statement, incexc_question, persona_dict):
-    searchstrat_question = question_developer(str("My Research Question: " + new_question + "\nPopulation Statement: " + pop_statement + "\n" + incexc_question + "\n\n" + "Final Search Strategy:"), persona_dict["searchstrat_developer"])
+@tracing.traced()
+def develop_search_strategy(new_question, pop_statement, incexc_question, persona_dict, stream=False):
+    searchstrat_question = _persona_call(persona_dict, "searchstrat_developer", str("My Research Question: " + new_question + "\nPopulation Statement: " + pop_statement + "\n" + incexc_question + "\n\n" + "Final Search Strategy:"), stream=stream)
     return searchstrat_question
 
+@tracing.traced()
 def determine_databases_to_search(new_question, persona_dict):
-    database_question = question_developer(str(new_question + "\nList of databases:"), persona_dict["database_developer"])
+    database_question = _persona_call(persona_dict, "database_developer", str(new_question + "\nList of databases:"))
     return str(database_question)
 
+DATABASE_LIST_PREFIX = "('"
+
+def parse_database_list(text, prefix=DATABASE_LIST_PREFIX):
+    """
+    Database names from a list_returner completion. The prompt ends with the opening of a tuple,
+    so the completion is read as a Python literal with that prefix put back (or as it is), and
+    otherwise split on commas, semicolons and newlines. Never evaluated as code
+    """
+    text = str(text).strip()
+    names = None
+    for candidate in (prefix + text, text):
+        try:
+            value = ast.literal_eval(candidate)
+        except (ValueError, TypeError, SyntaxError, MemoryError, RecursionError):
+            continue
+        if isinstance(value, str):
+            value = [value]
+        if isinstance(value, (list, tuple, set)):
+            names = [str(name) for name in value]
+            break
+    if names is None:
+        names = re.split(r"[,;\n]", text)
+    databases = []
+    for name in names:
+        name = re.sub(r"^\s*(?:[-*]|\d+[.)])\s+", "", name)
+        name = name.strip().strip("[]()'\"").strip()
+        # "PubMed, Embase, and CINAHL": the last item keeps its conjunction
+        name = re.sub(r"^(?:and|or)\s+", "", name, flags=re.IGNORECASE).strip()
+        if name and name.lower() not in ("and", "or"):
+            databases.append(name)
+    return list(dict.fromkeys(databases))
+
+@tracing.traced()
 def get_database_list(database_question, persona_dict):
-    database_list = question_developer(str(database_question + "\nList:('"), persona_dict["list_returner"])
-    if "and" in database_list:
-        database_list = database_list.remove("and")
-    database_list = eval(database_list)
-    return database_list
+    completion = _persona_call(persona_dict, "list_returner", str(database_question + "\nList:" + DATABASE_LIST_PREFIX))
+    return parse_database_list(completion)
+
+@tracing.traced()
+def develop_database_search_strategy(database, searchstrat_question, persona_dict):
+    database_strat = _persona_call(persona_dict, "databasesearchstrat_developer", str("My Search Strategy: " + searchstrat_question + "\nDatabase that will be searched: " + database + "\nSearch strategy specific to " + database + ":"))
+    return database_strat
+
+def _queued_context():
+    context = contextvars.copy_context()
+    context.run(tracing.mark_queued)
+    return context
+
+class DatabaseStrategies(dict):
+    """
+    database -> search strategy for every database that succeeded; failed databases are in .failures
+    """
+
+    def __init__(self, strategies=(), failures=None):
+        super().__init__(strategies)
+        self.failures = failures or {}
 
+    def combined(self):
+        return "".join("\nStrategy for " + database + ":\n" + database_strat + "\n" for database, database_strat in self.items())
+
+@tracing.traced()
 def develop_database_search_strategies(database_list, searchstrat_question, persona_dict):
-    all_database_strats = ""
+    strategies = DatabaseStrategies()
     for database in database_list:
-        database_strat = question_developer(str("My Search Strategy: " + searchstrat_question + "\nDatabase that will be searched: " + database + "\nSearch strategy specific to " + database + ":"), persona_dict["databasesearchstrat_developer"])
-        all_database_strats += "\nStrategy for " + database + ":\n" + database_strat + "\n"
-    return all_database_strats
+        strategies[database] = develop_database_search_strategy(database, searchstrat_question, persona_dict)
+    return strategies.combined()
+
+@tracing.traced()
+def develop_database_search_strategies_concurrent(database_list, searchstrat_question, persona_dict, max_workers=4, retries=3, backoff=1.0):
+    """
+    Generate the per-database strategies in parallel, retrying transient errors with backoff.
+    A database that still fails is left out of the mapping and recorded in .failures
+    instead of sinking the whole batch.
+    """
+    results = {}
+    failures = {}
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        futures = {
+            database: executor.submit(
+                _queued_context().run,
+                retry.call_with_retry,
+                develop_database_search_strategy,
+                database,
+                searchstrat_question,
+                persona_dict,
+                retries=retries,
+                backoff=backoff,
+                on_retry=lambda attempt, exc: tracing.add("retries"),
+                )
+            for database in dict.fromkeys(database_list)
+            }
+        for database, future in futures.items():
+            try:
+                results[database] = future.result()
+            except Exception as exc:
+                failures[database] = exc
+    return DatabaseStrategies(results, failures)
+
+def combine_database_strategies(database_strategies):
+    return database_strategies.combined()
 
+@tracing.traced()
 def develop_pubmed_query(searchstrat_question, persona_dict):
-    pubmed_question = question_developer(str(searchstrat_question) + "\n Pubmed Query: (", persona_dict["pubmedquery_developer"])
+    pubmed_question = _persona_call(persona_dict, "pubmedquery_developer", str(searchstrat_question) + "\n Pubmed Query: (")
     return str(pubmed_question)
 
 def write_summary_to_file(summary):
     with open('summary_file.txt', 'w', encoding='utf-8') as handle:
         for item in summary:
             handle.write(item + "\n")
+
+STRATEGY_PIPELINE = [
+    pipeline.Stage("document_title", develop_document_title, ("new_question", "persona_dict"), "Document Title"),
+    pipeline.Stage("file_title", develop_file_title, ("new_question", "persona_dict"), "File Title"),
+    pipeline.Stage("pop_statement_template", determine_population_statement_template, ("new_question", "persona_dict"), "Best clinical question statement"),
+    pipeline.Stage("database_question", determine_databases_to_search, ("new_question", "persona_dict"), "List of suggested databases"),
+    pipeline.Stage("pop_statement", develop_population_statement, ("new_question", "pop_statement_template", "persona_dict"), "Population Statement"),
+    pipeline.Stage("incexc_question", develop_inclusion_exclusion_criteria, ("new_question", "pop_statement", "persona_dict"), "Inclusion and Exclusion Criteria", streams=True),
+    pipeline.Stage("searchstrat_question", develop_search_strategy, ("new_question", "pop_statement", "incexc_question", "persona_dict"), "Final Search Strategy", streams=True),
+    pipeline.Stage("database_list", get_database_list, ("database_question", "persona_dict"), "Databases"),
+    pipeline.Stage("database_strategies", develop_database_search_strategies_concurrent, ("database_list", "searchstrat_question", "persona_dict"), "Database Strategies"),
+    pipeline.Stage("all_database_strats", combine_database_strategies, ("database_strategies",), "All Database Strategy"),
+    pipeline.Stage("pubmed_question", develop_pubmed_query, ("searchstrat_question", "persona_dict"), "Pubmed Query"),
+]
+
+def build_search_strategy(new_question, persona_dict, max_workers=4, on_result=None, on_token=None):
+    """
+    Run every strategy stage for new_question, in parallel where the stages allow it.
+    Pass on_token to receive the long completions chunk by chunk.
+    """
+    with tracing.span("build_search_strategy"):
+        return pipeline.run_pipeline(
+            STRATEGY_PIPELINE,
+            {"new_question": new_question, "persona_dict": persona_dict},
+            max_workers=max_workers,
+            on_result=on_result,
+            on_token=on_token,
+            )
+
+def strategy_summary(results):
+    """
+    Map pipeline results onto the summary_dict keys used by searchstrat_developer
+    """
+    summary_dict = {"New Question": results["new_question"]}
+    for stage in STRATEGY_PIPELINE:
+        if stage.name in results and stage.name not in ("database_list", "database_strategies"):
+            summary_dict[stage.label] = results[stage.name]
+    for database, database_strat in results.get("database_strategies", {}).items():
+        summary_dict["Search strategy specific to " + database] = database_strat
+    return summary_dict
@@ -4,27 +4,18 @@ import json
 import time
 import docx
 from docx.shared import Inches
-from docx2pdf import convert
-from langchain import PromptTemplate, LLMChain
-from langchain.chat_models import ChatOpenAI
 import time
+import llm_pool
+
+LLM_MODEL = "gpt-3.5-turbo"
+MAX_TOKENS = 2000
 
 def question_developer(user_input, persona, temperature=0):
     """
     Module to generate a new research question based on the user input and persona
     """
     question = persona + user_input
-    template = """Question: {question}
-
-    Answer:"""
-    prompt = PromptTemplate(template=template, input_variables=["question"])
-    llm_chain = LLMChain(
-        prompt=prompt,
-        llm=ChatOpenAI(temperature=temperature, max_tokens=2000),
-        verbose=False
-        )
-
-
+    llm_chain = llm_pool.get_pool().get_chain(LLM_MODEL, temperature, MAX_TOKENS)
     return llm_chain.predict(question=question)
 
 def searchstrat_developer(original_question, output_placeholder=None, temperature=0.3):
@@ -0,0 +1,217 @@
+"""
+Hierarchical map-reduce summary of the included studies.
+
+Each study is summarised on its own from its pdf_store chunks (map), then the summaries are
+combined in a tree of reduce steps of at most fan_in children until one summary is left. Every
+node is keyed Merkle-style: a leaf by the paper's SHA-256 and the review question, an inner node
+by its children's keys. Node summaries are stored under those keys, so a re-run only calls the
+LLM for nodes whose key is new, which after adding one study is the path from it to the root.
+
+Groups are cut at content-defined boundaries (a node ends a group when its key hash says so)
+rather than every fan_in positions, so an added study does not shift every later group. Each
+level has a fraction of the nodes below it, so calls and tokens grow linearly with study count.
+"""
+import contextvars
+import hashlib
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import llm_pool
+import prompt_cache
+import rate_limit
+import retry
+import search_strat as ss
+import token_budget
+
+SUMMARIZER_VERSION = 1
+DEFAULT_CACHE_PATH = os.path.join(prompt_cache.DEFAULT_CACHE_DIR, "summaries.sqlite")
+STUDY_SECTIONS = ("front matter", "abstract", "summary", "methods", "method", "materials and methods",
+                  "patients and methods", "methodology", "study design", "results", "findings",
+                  "conclusion", "conclusions", "limitations")
+
+
+def node_key(kind, *parts):
+    payload = "\x1f".join([str(SUMMARIZER_VERSION), ss.LLM_MODEL, kind, *[str(part) for part in parts]])
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def group_nodes(keys, fan_in, slots=2):
+    """
+    Split a level's node keys into groups of 2..fan_in. A group ends after a node whose key hash
+    falls in slots / fan_in of the hash range (expected size fan_in / slots); groups that come out
+    larger than fan_in are split again with a wider slice, so cuts never depend on positions
+    """
+    groups = []
+    current = []
+    for key in keys:
+        current.append(key)
+        if len(current) >= 2 and int(key[:8], 16) % fan_in < slots:
+            groups.append(current)
+            current = []
+    if current:
+        groups.append(current)
+    if slots >= fan_in:
+        return groups
+    result = []
+    for group in groups:
+        result += group_nodes(group, fan_in, slots + 1) if len(group) > fan_in else [group]
+    return result
+
+
+def study_text(store, sha):
+    """
+    The paper's abstract, methods, results and conclusions, or every chunk if none are labelled
+    """
+    chunks = store.chunks(sha, sections=STUDY_SECTIONS) or store.chunks(sha)
+    return "\n".join(f"({chunk.section}) {chunk.text}" for chunk in chunks)
+
+
+def build_map_prompt(question, record_id, text):
+    return f"Review question: {question}\nStudy: {record_id}\n\nFull text:\n{text}\n\nSummary:"
+
+
+def build_reduce_prompt(question, summaries):
+    parts = [f"Review question: {question}", "", "Summaries:"]
+    parts += [f"- {summary}" for summary in summaries]
+    parts += ["", "Combined summary:"]
+    return "\n".join(parts)
+
+
+def _complete(prompt, persona_key, persona_dict, max_tokens, stage, limiter=None):
+    """
+    (output, prompt tokens, completion tokens) for one summarisation call
+    """
+    persona = persona_dict[persona_key]
+    fitted, max_tokens, prompt_tokens = token_budget.fit_prompt(persona, prompt, max_tokens, ss.LLM_MODEL, llm_pool.QUESTION_TEMPLATE)
+    if limiter is not None:
+        limiter.acquire()
+    try:
+        output = ss.question_developer(fitted, persona, max_tokens=max_tokens, stage=stage)
+    finally:
+        if limiter is not None:
+            limiter.release()
+    output = str(output).strip()
+    return output, prompt_tokens, token_budget.count_tokens(output, ss.LLM_MODEL)
+
+
+class SummaryResult:
+    def __init__(self, summary, studies, levels, failures, elapsed):
+        self.summary = summary
+        self.studies = studies
+        self.levels = levels
+        self.failures = failures
+        self.elapsed = elapsed
+
+    @property
+    def computed(self):
+        return sum(level["computed"] for level in self.levels)
+
+    def totals(self):
+        return {
+            field: sum(level[field] for level in self.levels)
+            for field in ("nodes", "computed", "cached", "prompt_tokens", "completion_tokens")
+        }
+
+
+def summarize_studies(store, papers, question, persona_dict, fan_in=6, max_workers=4, rate_per_minute=None,
+                      retries=3, cache=None, on_progress=None):
+    """
+    Summarise [(record_id, sha)] papers for the review question. Returns a SummaryResult with the root
+    summary, the per-study summaries and one row per tree level (0 is the map step) with node, cached,
+    token and wall-time counts. Studies that still fail after retries are left out and recorded in
+    failures. on_progress(level, done, total) is called in this thread.
+    """
+    if fan_in < 2:
+        raise ValueError("fan_in must be at least 2")
+    if cache is None:
+        cache = prompt_cache.PromptCache(":memory:", max_entries=None)
+    limiter = rate_limit.RateLimiter(rate_per_minute, max_workers)
+    map_tokens = token_budget.persona_max_tokens(persona_dict, "study_summary_developer")
+    reduce_tokens = token_budget.persona_max_tokens(persona_dict, "summary_reducer_developer")
+    reduce_budget = (token_budget.context_window(ss.LLM_MODEL) - reduce_tokens
+                     - token_budget.count_tokens(persona_dict["summary_reducer_developer"], ss.LLM_MODEL) - 64)
+    started = time.perf_counter()
+    failures = {}
+    levels = []
+    texts = {}
+
+    def run_level(level, jobs, call):
+        """
+        jobs: {key: args for call}. Fills texts for every key that is cached or succeeds
+        """
+        stats = {"level": level, "nodes": len(jobs), "computed": 0, "cached": 0,
+                 "prompt_tokens": 0, "completion_tokens": 0, "seconds": 0.0}
+        level_started = time.perf_counter()
+        todo = {}
+        for key, args in jobs.items():
+            text = cache.get(key)
+            if text is None:
+                todo[key] = args
+            else:
+                texts[key] = text
+                stats["cached"] += 1
+        with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+            futures = {
+                executor.submit(contextvars.copy_context().run, retry.call_with_retry, call, *args, retries=retries): key
+                for key, args in todo.items()
+            }
+            try:
+                for done, future in enumerate(as_completed(futures), start=1):
+                    key = futures[future]
+                    try:
+                        output, prompt_tokens, completion_tokens = future.result()
+                    except Exception as error:
+                        failures[key] = error
+                    else:
+                        cache.put(key, output)
+                        texts[key] = output
+                        stats["computed"] += 1
+                        stats["prompt_tokens"] += prompt_tokens
+                        stats["completion_tokens"] += completion_tokens
+                    if on_progress is not None:
+                        on_progress(level, done, len(futures))
+            except BaseException:
+                # e.g. a cancelled job raising from on_progress: nodes not started yet are dropped
+                executor.shutdown(cancel_futures=True)
+                raise
+        stats["seconds"] = time.perf_counter() - level_started
+        levels.append(stats)
+
+    def map_study(record_id, sha):
+        prompt = build_map_prompt(question, record_id, study_text(store, sha))
+        output, prompt_tokens, completion_tokens = _complete(
+            prompt, "study_summary_developer", persona_dict, map_tokens, "study_summary_developer", limiter)
+        return f"[{record_id}] {output}", prompt_tokens, completion_tokens
+
+    def reduce_group(children):
+        # every child gets an equal share of the context, instead of the middle children being trimmed away
+        share = max(50, (reduce_budget - token_budget.count_tokens(question, ss.LLM_MODEL)) // len(children))
+        prompt = build_reduce_prompt(question, [token_budget.trim_to_tokens(texts[child], share, ss.LLM_MODEL) for child in children])
+        return _complete(prompt, "summary_reducer_developer", persona_dict, reduce_tokens, "summary_reducer_developer", limiter)
+
+    leaves = {}
+    for record_id, sha in papers:
+        record_id = str(record_id if record_id is not None else sha[:12])
+        leaves[node_key("map", sha, record_id, question)] = (record_id, sha)
+    run_level(0, leaves, map_study)
+    for key, (record_id, sha) in leaves.items():
+        if key in failures:
+            failures[record_id] = failures.pop(key)
+    studies = {leaves[key][0]: texts[key] for key in leaves if key in texts}
+
+    # leaves in key order, so the tree does not depend on the order papers were passed in
+    keys = sorted(key for key in leaves if key in texts)
+    level = 0
+    while len(keys) > 1:
+        level += 1
+        groups = group_nodes(keys, fan_in)
+        jobs = {node_key("reduce", question, *group): (group,) for group in groups if len(group) > 1}
+        run_level(level, jobs, reduce_group)
+        failed = [key for key in jobs if key in failures]
+        if failed:
+            raise RuntimeError(f"{len(failed)} reduce steps failed at level {level}: {failures[failed[0]]}")
+        # a single trailing node moves up a level unchanged
+        keys = [node_key("reduce", question, *group) if len(group) > 1 else group[0] for group in groups]
+    summary = texts[keys[0]] if keys else ""
+    return SummaryResult(summary, studies, levels, failures, time.perf_counter() - started)
@@ -0,0 +1,32 @@
+import io
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import importers
+
+
+def test_ris_end_tag_without_trailing_space_ends_the_record():
+    ris = "TY  - JOUR\nTI  - First\nAU  - Smith J\nER  -\nTY  - JOUR\nTI  - Second\nER  -\r\n"
+    records = list(importers.iter_ris(io.StringIO(ris)))
+    assert [record.title for record in records] == ["First", "Second"]
+    assert records[1].authors == ""
+
+
+def test_json_list_values_are_joined():
+    data = '[{"id": "R1", "title": ["Part one", "part two"], "authors": ["Smith J", "Lee K"], "year": [2020]}]'
+    records = list(importers.iter_json(io.StringIO(data)))
+    assert records[0].title == "Part one part two"
+    assert records[0].authors == "Smith J; Lee K"
+    store = importers.RecordStore()
+    assert store.add_all(records) == 1
+    store.close()
+
+
+def test_default_store_is_a_temporary_file_removed_on_close():
+    store = importers.RecordStore()
+    store.add_all([importers.Record(id="R1", title="First")])
+    assert os.path.getsize(store.path) > 0
+    store.close()
+    assert not os.path.exists(store.path)
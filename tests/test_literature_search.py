@@ -0,0 +1,35 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import importers
+import literature_search
+
+
+@pytest.fixture
+def corpus(tmp_path):
+    corpus = literature_search.LocalCorpus(str(tmp_path / "corpus.sqlite"))
+    corpus.add_all([
+        importers.Record(id="1", title="Exercise for depression", abstract="A trial of exercise.", authors="Smith J; Lee K", year="2019"),
+        importers.Record(id="2", title="Diet and depression", abstract="A cohort of adults.", authors="Jones J; Smith A", year="2020"),
+        importers.Record(id="3", title="Smith on sleep", abstract="Sleep hygiene in adults.", authors="Brown J", year="2021"),
+    ])
+    yield corpus
+    corpus.close()
+
+
+def titles(corpus, query):
+    return sorted(record.title for record in corpus.fetch(corpus.match_ids(query)))
+
+
+def test_leading_not_excludes_from_every_record(corpus):
+    assert titles(corpus, "NOT exercise") == ["Diet and depression", "Smith on sleep"]
+    assert titles(corpus, "(NOT exercise) AND depression") == ["Diet and depression"]
+
+
+def test_field_tag_applies_to_the_run_of_words_before_it(corpus):
+    assert titles(corpus, "Smith J[au]") == ["Exercise for depression"]
+    assert titles(corpus, "Smith A[au] OR sleep") == ["Diet and depression", "Smith on sleep"]
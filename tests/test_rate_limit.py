@@ -0,0 +1,25 @@
+import asyncio
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import rate_limit
+
+
+def test_timed_out_acquire_async_gives_its_slot_back():
+    limiter = rate_limit.RateLimiter(max_concurrent=1)
+
+    async def run():
+        limiter.acquire()
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(limiter.acquire_async(), 0.05)
+        # the abandoned waiter takes the slot once it is free and must hand it straight back
+        limiter.release()
+        await asyncio.wait_for(limiter.acquire_async(), 2)
+        limiter.release()
+
+    asyncio.run(run())
+    assert limiter._slots.acquire(blocking=False)
@@ -0,0 +1,53 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+pytest.importorskip("numpy")
+
+import importers
+import record_dedupe
+
+
+def sample_records():
+    return [
+        importers.Record(id="1", title="Exercise therapy for depression in older adults", doi="10.1/a"),
+        importers.Record(id="2", title="Cognitive behavioural therapy for anxiety in children"),
+        importers.Record(id="1", title="EXERCISE THERAPY FOR DEPRESSION IN OLDER ADULTS.", abstract="Longer copy"),
+        importers.Record(id="4", title="Diabetes outcomes after bariatric surgery", pmid="123"),
+        importers.Record(id="5", title="Quality of life after surgery", pmid="123"),
+    ]
+
+
+class CountingStore(importers.RecordStore):
+    def __init__(self):
+        super().__init__()
+        self.passes = 0
+        self.fetched = []
+
+    def get_rows(self, positions):
+        self.fetched += positions
+        return super().get_rows(positions)
+
+    def __iter__(self):
+        self.passes += 1
+        return super().__iter__()
+
+
+def test_store_is_streamed_and_matches_a_list():
+    store = CountingStore()
+    store.add_all(sample_records())
+    expected = record_dedupe.find_duplicates(sample_records())
+    result = record_dedupe.find_duplicates(store)
+    # one pass for the keys, then only the duplicates are fetched
+    assert store.passes == 1
+    assert sorted(store.fetched) == [0, 2, 3, 4]
+    assert result.report == expected.report
+    assert [record.to_dict() for record in result.unique] == [record.to_dict() for record in expected.unique]
+    assert len(result.unique) == 3
+    # the copy sharing an id is merged, not confused with the record it duplicates
+    assert [row["reason"] for row in result.report] == ["title", "pmid"]
+    assert [record.abstract for record in result.unique][0] == "Longer copy"
+
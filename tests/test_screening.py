@@ -0,0 +1,104 @@
+import os
+import sys
+import threading
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import llm_pool
+import screening
+import search_strat as ss
+import token_budget
+
+PERSONA_DICT = {"screening_developer": "Screen the records below.\n", "max_tokens": {"screening_developer": 60}}
+CRITERIA = "Inclusion: " + " ".join(f"adults with condition {i} treated with exercise" for i in range(60))
+
+
+def long_records(count, words=330):
+    return [
+        {"id": f"R{i:02d}", "title": f"Study R{i:02d}", "abstract": " ".join(f"finding{j}" for j in range(words))}
+        for i in range(count)
+    ]
+
+
+@pytest.fixture
+def sent_prompts(monkeypatch):
+    """
+    Replace the LLM with a model that, like the real one given a trimmed prompt, answers for
+    every record number up to ten whether or not that record survived in its prompt
+    """
+    sent = []
+
+    def question_developer(user_input, persona, max_tokens=2000, stage=None, **kwargs):
+        user_input, max_tokens, tokens = token_budget.fit_prompt(persona, user_input, max_tokens, ss.LLM_MODEL,
+                                                                 llm_pool.QUESTION_TEMPLATE)
+        sent.append(user_input)
+        return "\n".join(f"{number} | INCLUDE | matches" for number in range(1, 11))
+
+    monkeypatch.setattr(ss, "question_developer", question_developer)
+    return sent
+
+
+def test_oversized_batch_is_refused(sent_prompts):
+    batch = long_records(10)
+    assert screening.prompt_tokens(screening.build_batch_prompt(CRITERIA, batch), PERSONA_DICT) > \
+        screening.prompt_allowance(len(batch), PERSONA_DICT)
+    with pytest.raises(ValueError):
+        screening.screen_batch(batch, CRITERIA, PERSONA_DICT)
+    assert sent_prompts == []
+
+
+def test_no_decision_for_a_record_missing_from_its_prompt(sent_prompts):
+    records = long_records(25)
+    result = screening.screen_records(records, CRITERIA, PERSONA_DICT, batch_size=10, max_workers=2)
+    assert result.failed_batches == 0
+    assert len(sent_prompts) > 3
+    assert set(result.decisions) == {record["id"] for record in records}
+    for row in result.decisions.values():
+        assert any(f"Title: {row['title']}\n" in prompt for prompt in sent_prompts)
+    assert not any(token_budget.TRIM_MARKER in prompt for prompt in sent_prompts)
+
+
+def test_record_too_long_for_any_batch_is_shortened_not_dropped(sent_prompts):
+    records = long_records(2, words=4000)
+    result = screening.screen_records(records, CRITERIA, PERSONA_DICT, batch_size=10)
+    assert result.failed_batches == 0
+    assert len(sent_prompts) == 2
+    for record, prompt in zip(records, sent_prompts):
+        assert f"[1] Title: {record['title']}\n" in prompt
+
+
+def test_interrupted_screen_does_not_send_queued_batches(monkeypatch):
+    sent = []
+    release = threading.Event()
+
+    def question_developer(user_input, persona, max_tokens=2000, stage=None, **kwargs):
+        sent.append(user_input)
+        # the first batch returns at once, the rest hang until the screen has been interrupted
+        if len(sent) > 1:
+            release.wait(5)
+        return "1 | EXCLUDE | no"
+
+    def on_progress(screened, resumed):
+        threading.Timer(0.2, release.set).start()
+        raise KeyboardInterrupt
+
+    monkeypatch.setattr(ss, "question_developer", question_developer)
+    records = [{"id": f"R{i}", "title": f"Study {i}", "abstract": "short"} for i in range(20)]
+    with pytest.raises(KeyboardInterrupt):
+        screening.screen_records(records, "Adults", PERSONA_DICT, batch_size=1, max_workers=2, on_progress=on_progress)
+    # the finished batch and the two running ones; the batch still queued is never sent
+    assert len(sent) <= 3
+
+
+def test_batch_calls_reach_the_callers_ledger(monkeypatch):
+    def question_developer(user_input, persona, max_tokens=2000, stage=None, **kwargs):
+        token_budget.record(stage or "question_developer", ss.LLM_MODEL, 10, 5, 0.0)
+        return "1 | INCLUDE | matches"
+
+    monkeypatch.setattr(ss, "question_developer", question_developer)
+    records = [{"id": f"R{i}", "title": f"Study {i}", "abstract": "short"} for i in range(4)]
+    with token_budget.track_run() as ledger:
+        screening.screen_records(records, "Adults", PERSONA_DICT, batch_size=1, max_workers=2)
+    assert len(ledger.calls) == 4
@@ -0,0 +1,25 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import search_strat as ss
+
+
+@pytest.mark.parametrize("completion, expected", [
+    ("PubMed', 'Embase', 'Cochrane Library')", ["PubMed", "Embase", "Cochrane Library"]),
+    ("['PubMed', 'Embase']", ["PubMed", "Embase"]),
+    ("PubMed', 'Embase', 'and', 'CINAHL')", ["PubMed", "Embase", "CINAHL"]),
+    ("PubMed, Embase, and Allied and Complementary Medicine Database",
+     ["PubMed", "Embase", "Allied and Complementary Medicine Database"]),
+    ("1. PubMed\n2. Embase\n", ["PubMed", "Embase"]),
+])
+def test_parse_database_list(completion, expected):
+    assert ss.parse_database_list(completion) == expected
+
+
+def test_parse_database_list_does_not_run_code(monkeypatch):
+    monkeypatch.setattr(os, "system", lambda command: pytest.fail("completion was executed"))
+    assert ss.parse_database_list("__import__('os').system('true')") == ["__import__('os').system('true"]
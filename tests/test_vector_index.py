@@ -0,0 +1,43 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+np = pytest.importorskip("numpy")
+
+import vector_index
+
+
+def test_upsert_repeated_id_in_one_batch_keeps_last():
+    index = vector_index.LocalIndex()
+    index.upsert(["a", "b", "a"], np.eye(3), [{"row": 0}, {"row": 1}, {"row": 2}])
+    assert index.ids == ["a", "b"]
+    assert index.metadata == [{"row": 2}, {"row": 1}]
+    assert index.query([0, 0, 1], top_k=1)[0][0] == "a"
+
+    index.upsert(["b", "c", "c"], np.eye(3))
+    assert index.ids == ["a", "b", "c"]
+    assert [item_id for item_id, score, meta in index.query([0, 0, 1], top_k=3)][:2] in (["a", "c"], ["c", "a"])
+
+
+def test_pinecone_uploads_do_not_share_a_namespace(monkeypatch):
+    calls = []
+
+    class FakeIndex:
+        def upsert(self, vectors, namespace=None):
+            calls.append(("upsert", namespace))
+
+        def query(self, vector, top_k, include_metadata, namespace=None):
+            calls.append(("query", namespace))
+            return {"matches": []}
+
+    monkeypatch.setattr(vector_index, "pinecone_index", lambda *args: FakeIndex())
+    first = vector_index.namespace_for(("upload", "a.ris", "0" * 64))
+    second = vector_index.namespace_for(("upload", "a.ris", "1" * 64))
+    assert first != second
+    index = vector_index.PineconeIndex("index", "key", namespace=first)
+    index.upsert(["a"], np.eye(1))
+    index.query([1.0])
+    assert calls == [("upsert", first), ("query", first)]
@@ -0,0 +1,198 @@
+"""
+Token accounting for persona calls.
+
+Counts prompt and completion tokens with tiktoken (or roughly, by characters, when its BPE
+file cannot be loaded, e.g. offline), trims the variable part of a prompt
+so prompt + completion fit the model's context (or a tighter configured budget), picks
+max_tokens per persona from the "max_tokens" entry of perssonadict.json, and keeps a
+per-run ledger of tokens, cost and latency for every stage.
+"""
+import contextlib
+import contextvars
+import functools
+import threading
+
+DEFAULT_MAX_TOKENS = 2000
+
+CONTEXT_WINDOWS = {
+    "gpt-3.5-turbo-instruct": 4096,
+    "gpt-3.5-turbo": 16385,
+    "gpt-4": 8192,
+}
+
+# USD per 1K tokens: (prompt, completion)
+PRICES = {
+    "gpt-3.5-turbo-instruct": (0.0015, 0.002),
+    "gpt-3.5-turbo": (0.0005, 0.0015),
+    "gpt-4": (0.03, 0.06),
+}
+
+# Optional cap on prompt tokens per call, tighter than the context window
+prompt_budget = None
+
+TRIM_MARKER = "\n[...]\n"
+
+CHARS_PER_TOKEN = 4
+
+
+class ApproximateEncoding:
+    """
+    Stand-in for a tiktoken encoding: one token per CHARS_PER_TOKEN characters, which is close
+    for English text and keeps encode/decode round-tripping for trim_to_tokens
+    """
+
+    def encode(self, text):
+        return [text[i:i + CHARS_PER_TOKEN] for i in range(0, len(text), CHARS_PER_TOKEN)]
+
+    def decode(self, tokens):
+        return "".join(tokens)
+
+
+@functools.lru_cache(maxsize=None)
+def _encoding(model):
+    """
+    The model's tiktoken encoding, loaded once per process. tiktoken downloads its BPE file on
+    first use, so without network access (or without tiktoken) counts fall back to an estimate
+    rather than failing the LLM call; the fallback is cached too, so the download is tried once
+    """
+    try:
+        import tiktoken
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            return tiktoken.get_encoding("cl100k_base")
+    except Exception:
+        return ApproximateEncoding()
+
+
+def count_tokens(text, model):
+    return len(_encoding(model).encode(text or ""))
+
+
+def context_window(model):
+    return CONTEXT_WINDOWS.get(model, 4096)
+
+
+def persona_max_tokens(persona_dict, persona_key):
+    """
+    Completion budget for a persona from the persona file's "max_tokens" table
+    """
+    return persona_dict.get("max_tokens", {}).get(persona_key, DEFAULT_MAX_TOKENS)
+
+
+def trim_to_tokens(text, max_tokens, model):
+    """
+    Cut text down to max_tokens by dropping its middle; the opening (question, population
+    statement) and the closing instruction are what the personas rely on most
+    """
+    encoding = _encoding(model)
+    tokens = encoding.encode(text)
+    if len(tokens) <= max_tokens:
+        return text
+    marker = len(encoding.encode(TRIM_MARKER))
+    keep = max(0, max_tokens - marker)
+    head = keep // 2
+    tail = keep - head
+    return encoding.decode(tokens[:head]) + TRIM_MARKER + encoding.decode(tokens[len(tokens) - tail:] if tail else [])
+
+
+def fit_prompt(persona, user_input, max_tokens, model, template="{question}"):
+    """
+    Return (user_input, max_tokens, prompt_tokens) such that prompt_tokens + max_tokens fits the
+    context window and prompt_tokens fits prompt_budget. user_input is trimmed first; if the
+    persona alone is too long the completion budget shrinks instead.
+    """
+    limit = context_window(model)
+    fixed_tokens = count_tokens(template.format(question=persona), model)
+    prompt_tokens = fixed_tokens + count_tokens(user_input, model)
+    allowed = limit - max_tokens
+    if prompt_budget is not None:
+        allowed = min(allowed, prompt_budget)
+    if prompt_tokens > allowed:
+        user_input = trim_to_tokens(user_input, max(0, allowed - fixed_tokens), model)
+        prompt_tokens = fixed_tokens + count_tokens(user_input, model)
+    if prompt_tokens + max_tokens > limit:
+        max_tokens = max(1, limit - prompt_tokens)
+    return user_input, max_tokens, prompt_tokens
+
+
+def cost(model, prompt_tokens, completion_tokens):
+    prompt_price, completion_price = PRICES.get(model, (0.0, 0.0))
+    return (prompt_tokens * prompt_price + completion_tokens * completion_price) / 1000
+
+
+class TokenLedger:
+    """
+    Thread-safe record of every persona call made during one run
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.calls = []
+
+    def record(self, stage, model, prompt_tokens, completion_tokens, latency, cached=False):
+        call = {
+            "stage": stage,
+            "model": model,
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "latency": latency,
+            "cached": cached,
+            "cost": 0.0 if cached else cost(model, prompt_tokens, completion_tokens),
+        }
+        with self._lock:
+            self.calls.append(call)
+
+    def by_stage(self):
+        """
+        One row per stage with call count, tokens, cost and total latency
+        """
+        rows = {}
+        with self._lock:
+            calls = list(self.calls)
+        for call in calls:
+            row = rows.setdefault(call["stage"], {
+                "stage": call["stage"],
+                "calls": 0,
+                "cached": 0,
+                "prompt_tokens": 0,
+                "completion_tokens": 0,
+                "cost": 0.0,
+                "latency": 0.0,
+            })
+            row["calls"] += 1
+            row["cached"] += int(call["cached"])
+            for field in ("prompt_tokens", "completion_tokens", "cost", "latency"):
+                row[field] += call[field]
+        return list(rows.values())
+
+    def totals(self):
+        rows = self.by_stage()
+        return {
+            "calls": sum(row["calls"] for row in rows),
+            "prompt_tokens": sum(row["prompt_tokens"] for row in rows),
+            "completion_tokens": sum(row["completion_tokens"] for row in rows),
+            "cost": sum(row["cost"] for row in rows),
+        }
+
+
+current_ledger = contextvars.ContextVar("current_ledger", default=None)
+
+
+@contextlib.contextmanager
+def track_run():
+    """
+    Collect every persona call made inside the block (including pipeline worker threads) in a new ledger
+    """
+    ledger = TokenLedger()
+    token = current_ledger.set(ledger)
+    try:
+        yield ledger
+    finally:
+        current_ledger.reset(token)
+
+
+def record(stage, model, prompt_tokens, completion_tokens, latency, cached=False):
+    ledger = current_ledger.get()
+    if ledger is not None:
+        ledger.record(stage, model, prompt_tokens, completion_tokens, latency, cached)
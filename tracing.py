@@ -0,0 +1,270 @@
+"""
+Stage-level tracing for the strategy pipeline.
+
+span() (context manager) and traced() (decorator) record wall time, queue time, retries,
+token counts and cache hits for a stage. Finished spans go to every registered sink:
+MemorySink for the UI, JsonlSink for offline analysis and OTLPSink for an
+OpenTelemetry collector. With no sinks registered, spans are not created at all.
+"""
+import contextlib
+import contextvars
+import functools
+import inspect
+import json
+import secrets
+import threading
+import time
+
+current_span = contextvars.ContextVar("current_span", default=None)
+_queued_at = contextvars.ContextVar("queued_at", default=None)
+_sinks = []
+_sinks_lock = threading.Lock()
+
+
+class Span:
+    def __init__(self, name, parent=None, attributes=None):
+        self.name = name
+        self.parent = parent
+        self.trace_id = parent.trace_id if parent is not None else secrets.token_hex(16)
+        self.span_id = secrets.token_hex(8)
+        self.start = time.time()
+        self.end = None
+        self.thread = threading.current_thread().name
+        self.attributes = dict(attributes or {})
+        self._lock = threading.Lock()
+
+    def add(self, key, amount=1):
+        with self._lock:
+            self.attributes[key] = self.attributes.get(key, 0) + amount
+
+    def set(self, key, value):
+        with self._lock:
+            self.attributes[key] = value
+
+    @property
+    def duration(self):
+        return (self.end if self.end is not None else time.time()) - self.start
+
+    def to_dict(self):
+        with self._lock:
+            attributes = dict(self.attributes)
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent.span_id if self.parent is not None else None,
+            "name": self.name,
+            "start": self.start,
+            "end": self.end,
+            "duration": self.duration,
+            "thread": self.thread,
+            "attributes": attributes,
+        }
+
+
+def add_sink(sink):
+    with _sinks_lock:
+        _sinks.append(sink)
+
+
+def remove_sink(sink):
+    with _sinks_lock:
+        if sink in _sinks:
+            _sinks.remove(sink)
+    flush = getattr(sink, "flush", None)
+    if flush is not None:
+        flush()
+
+
+def enabled():
+    return bool(_sinks)
+
+
+def mark_queued():
+    """
+    Note that work is being handed to a pool; the next span started in this context reports the wait as queue_time
+    """
+    _queued_at.set(time.time())
+
+
+def add(key, amount=1):
+    """
+    Add to a counter on the current span and every enclosing span
+    """
+    span = current_span.get()
+    while span is not None:
+        span.add(key, amount)
+        span = span.parent
+
+
+def _emit(span):
+    with _sinks_lock:
+        sinks = list(_sinks)
+    record = span.to_dict()
+    for sink in sinks:
+        try:
+            sink.export(record)
+        except Exception:
+            pass
+
+
+@contextlib.contextmanager
+def span(name, **attributes):
+    """
+    Trace the enclosed block as one span. Yields the Span, or None when tracing is disabled
+    """
+    if not _sinks:
+        yield None
+        return
+    current = Span(name, current_span.get(), attributes)
+    queued_at = _queued_at.get()
+    if queued_at is not None:
+        current.set("queue_time", max(0.0, current.start - queued_at))
+        _queued_at.set(None)
+    token = current_span.set(current)
+    try:
+        yield current
+    except BaseException as exc:
+        current.set("error", repr(exc))
+        raise
+    finally:
+        current_span.reset(token)
+        current.end = time.time()
+        _emit(current)
+
+
+def traced(name=None):
+    """
+    Decorator form of span() for plain, generator and coroutine functions
+    """
+    def decorator(func):
+        span_name = name or func.__name__
+
+        if inspect.isgeneratorfunction(func):
+            @functools.wraps(func)
+            def generator_wrapper(*args, **kwargs):
+                with span(span_name):
+                    yield from func(*args, **kwargs)
+            return generator_wrapper
+
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def coroutine_wrapper(*args, **kwargs):
+                with span(span_name):
+                    return await func(*args, **kwargs)
+            return coroutine_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(span_name):
+                return func(*args, **kwargs)
+        return wrapper
+
+    return decorator
+
+
+class MemorySink:
+    """
+    Keeps finished spans in a list (bounded by max_spans)
+    """
+
+    def __init__(self, max_spans=10000):
+        self.max_spans = max_spans
+        self.spans = []
+        self._lock = threading.Lock()
+
+    def export(self, record):
+        with self._lock:
+            self.spans.append(record)
+            if len(self.spans) > self.max_spans:
+                del self.spans[: len(self.spans) - self.max_spans]
+
+    def trace(self, trace_id):
+        with self._lock:
+            return [record for record in self.spans if record["trace_id"] == trace_id]
+
+
+class JsonlSink:
+    """
+    Appends one JSON line per finished span
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def export(self, record):
+        line = json.dumps(record, ensure_ascii=False)
+        with self._lock, open(self.path, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+
+
+def _otlp_value(value):
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def to_otlp_span(record):
+    otlp = {
+        "traceId": record["trace_id"],
+        "spanId": record["span_id"],
+        "name": record["name"],
+        "kind": 1,
+        "startTimeUnixNano": str(int(record["start"] * 1e9)),
+        "endTimeUnixNano": str(int(record["end"] * 1e9)),
+        "attributes": [{"key": key, "value": _otlp_value(value)} for key, value in record["attributes"].items()],
+        "status": {"code": 2 if "error" in record["attributes"] else 1},
+    }
+    if record["parent_id"]:
+        otlp["parentSpanId"] = record["parent_id"]
+    return otlp
+
+
+class OTLPSink:
+    """
+    Batches spans and POSTs them as OTLP/JSON to a local OpenTelemetry collector
+    """
+
+    def __init__(self, endpoint="http://localhost:4318/v1/traces", service_name="synthscope", batch_size=64, timeout=2.0):
+        self.endpoint = endpoint
+        self.service_name = service_name
+        self.batch_size = batch_size
+        self.timeout = timeout
+        self._batch = []
+        self._lock = threading.Lock()
+
+    def export(self, record):
+        with self._lock:
+            self._batch.append(record)
+            if len(self._batch) < self.batch_size and record["parent_id"] is not None:
+                return
+            batch, self._batch = self._batch, []
+        self._post(batch)
+
+    def flush(self):
+        with self._lock:
+            batch, self._batch = self._batch, []
+        if batch:
+            self._post(batch)
+
+    def _post(self, batch):
+        import urllib.request
+
+        payload = {
+            "resourceSpans": [{
+                "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": self.service_name}}]},
+                "scopeSpans": [{"scope": {"name": "synthscope.tracing"}, "spans": [to_otlp_span(record) for record in batch]}],
+            }]
+        }
+        request = urllib.request.Request(
+            self.endpoint,
+            data=json.dumps(payload).encode("utf-8"),
+            headers={"Content-Type": "application/json"},
+            method="POST",
+        )
+        with urllib.request.urlopen(request, timeout=self.timeout):
+            pass
@@ -0,0 +1,210 @@
+"""
+Vector index over imported literature records, used to pre-rank records against the
+review's PICO statement and inclusion/exclusion criteria before any per-record LLM call.
+
+LocalIndex is an in-process NumPy brute-force index that needs no network; PineconeIndex
+wraps a hosted Pinecone index with the same upsert/query interface.
+"""
+import functools
+import json
+import os
+
+import numpy as np
+
+import embeddings
+
+
+def record_id(record):
+    item_id = record.get("id")
+    if item_id is None or item_id == "":
+        return embeddings.text_hash(record_text(record))[:16]
+    return str(item_id)
+
+
+def record_text(record):
+    """
+    The text that gets embedded for a record: title and abstract
+    """
+    title = record.get("title") or ""
+    abstract = record.get("abstract") or ""
+    return (title + "\n" + abstract).strip()
+
+
+def criteria_text(pop_statement=None, incexc_question=None, new_question=None):
+    parts = [part for part in (new_question, pop_statement, incexc_question) if part]
+    return "\n".join(parts)
+
+
+class LocalIndex:
+    """
+    Brute-force cosine-similarity index held in memory, optionally saved to an .npz file
+    """
+
+    def __init__(self):
+        self.ids = []
+        self.metadata = []
+        self._positions = {}
+        self._chunks = []
+        self._matrix = np.zeros((0, 0), dtype=np.float32)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _vectors(self):
+        if self._chunks:
+            parts = [self._matrix] if len(self._matrix) else []
+            self._matrix = np.vstack(parts + self._chunks)
+            self._chunks = []
+        return self._matrix
+
+    def upsert(self, ids, vectors, metadata=None):
+        """
+        Add or overwrite vectors by id. An id repeated within one call keeps its last vector
+        """
+        vectors = embeddings.normalize(np.asarray(vectors, dtype=np.float32))
+        metadata = metadata or [{} for i in ids]
+        last_rows = {}
+        for row, item_id in enumerate(ids):
+            last_rows[item_id] = row
+        new_rows = []
+        for item_id, row in last_rows.items():
+            position = self._positions.get(item_id)
+            if position is None:
+                self._positions[item_id] = len(self.ids)
+                self.ids.append(item_id)
+                self.metadata.append(metadata[row])
+                new_rows.append(row)
+            else:
+                self._vectors()[position] = vectors[row]
+                self.metadata[position] = metadata[row]
+        if new_rows:
+            self._chunks.append(vectors[new_rows])
+
+    def query(self, vector, top_k=10):
+        """
+        Return [(id, score, metadata)] for the top_k most similar vectors, best first
+        """
+        matrix = self._vectors()
+        if not len(matrix):
+            return []
+        query = embeddings.normalize(np.asarray(vector, dtype=np.float32).reshape(1, -1))[0]
+        scores = matrix @ query
+        top_k = min(top_k, len(scores))
+        top = np.argpartition(-scores, top_k - 1)[:top_k]
+        top = top[np.argsort(-scores[top])]
+        return [(self.ids[i], float(scores[i]), self.metadata[i]) for i in top]
+
+    def save(self, path):
+        """
+        Write path.npz (vectors and ids) and path.meta.json
+        """
+        path = path[:-4] if path.endswith(".npz") else path
+        np.savez_compressed(path + ".npz", vectors=self._vectors(), ids=np.array(self.ids, dtype=str))
+        with open(path + ".meta.json", "w", encoding="utf-8") as f:
+            json.dump(self.metadata, f)
+
+    @classmethod
+    def load(cls, path):
+        path = path[:-4] if path.endswith(".npz") else path
+        index = cls()
+        data = np.load(path + ".npz")
+        metadata_path = path + ".meta.json"
+        metadata = None
+        if os.path.exists(metadata_path):
+            with open(metadata_path, "r", encoding="utf-8") as f:
+                metadata = json.load(f)
+        index.upsert([str(item_id) for item_id in data["ids"]], data["vectors"], metadata)
+        return index
+
+
+@functools.lru_cache(maxsize=None)
+def pinecone_index(index_name, api_key, environment=None):
+    """
+    Pinecone index handle, built once per process and index so reruns reuse the client's connections
+    """
+    import pinecone
+
+    if hasattr(pinecone, "Pinecone"):
+        return pinecone.Pinecone(api_key=api_key).Index(index_name)
+    # pinecone-client 2.x
+    pinecone.init(api_key=api_key, environment=environment)
+    return pinecone.Index(index_name)
+
+
+def namespace_for(key):
+    """
+    A Pinecone namespace for one set of records (e.g. a RecordStore key), so a shared index
+    never returns ids from another upload
+    """
+    return "records-" + embeddings.text_hash(repr(key))[:32]
+
+
+class PineconeIndex:
+    """
+    Same interface as LocalIndex on top of a hosted Pinecone index
+    """
+
+    def __init__(self, index_name, api_key, environment=None, namespace=None, batch_size=100):
+        self._index = pinecone_index(index_name, api_key, environment)
+        self.namespace = namespace
+        self.batch_size = batch_size
+
+    def upsert(self, ids, vectors, metadata=None):
+        metadata = metadata or [{} for i in ids]
+        items = [(item_id, [float(x) for x in vector], meta) for item_id, vector, meta in zip(ids, vectors, metadata)]
+        for start in range(0, len(items), self.batch_size):
+            self._index.upsert(vectors=items[start:start + self.batch_size], namespace=self.namespace)
+
+    def query(self, vector, top_k=10):
+        response = self._index.query(
+            vector=[float(x) for x in vector],
+            top_k=top_k,
+            include_metadata=True,
+            namespace=self.namespace,
+        )
+        matches = response["matches"] if isinstance(response, dict) else response.matches
+        return [(match["id"], float(match["score"]), dict(match.get("metadata") or {})) for match in matches]
+
+
+def index_records(index, records, embedder=None, batch_size=256, on_progress=None, total=None):
+    """
+    Embed records (dicts or importers.Record objects, from any iterable) in batches and
+    upsert them. Returns the number of records indexed. on_progress(done, total) is called
+    after each batch.
+    """
+    if total is None and hasattr(records, "__len__"):
+        total = len(records)
+    done = 0
+    batch = []
+
+    def flush():
+        texts = [record_text(record) for record in batch]
+        vectors = embeddings.embed_texts(texts, embedder=embedder, batch_size=batch_size)
+        index.upsert(
+            [record_id(record) for record in batch],
+            vectors,
+            [{"title": (record.get("title") or "")[:500]} for record in batch],
+        )
+
+    for record in records:
+        batch.append(record)
+        if len(batch) >= batch_size:
+            flush()
+            done += len(batch)
+            batch = []
+            if on_progress is not None:
+                on_progress(done, total)
+    if batch:
+        flush()
+        done += len(batch)
+        if on_progress is not None:
+            on_progress(done, total)
+    return done
+
+
+def shortlist(index, query_text, top_k=200, embedder=None):
+    """
+    Records most similar to the criteria text, best first, as [(id, score, metadata)]
+    """
+    vector = embeddings.embed_texts([query_text], embedder=embedder)[0]
+    return index.query(vector, top_k=top_k)